@@ -12,10 +12,8 @@ import cv2
 import shutil
 import tempfile
 import torch
-from basicsr.archs.rrdbnet_arch import RRDBNet
-from basicsr.archs.srvgg_arch import SRVGGNetCompact
 
-from realesrgan.utils import RealESRGANer
+from realesrgan.model_zoo import get_upsampler
 
 try:
     from cog import BasePredictor, Input, Path
@@ -23,16 +21,29 @@ try:
 except Exception:
     print('please install cog and realesrgan package')
 
+# cog version -> model name of the model zoo
+VERSIONS = {
+    'General - RealESRGANplus': 'RealESRGAN_x4plus',
+    'General - v3': 'realesr-general-x4v3',
+    'Anime - anime6B': 'RealESRGAN_x4plus_anime_6B',
+    'AnimeVideo - v3': 'realesr-animevideov3',
+}
+
 
 class Predictor(BasePredictor):
 
     def setup(self):
         os.makedirs('output', exist_ok=True)
+        self.face_enhancers = {}
         # download weights
         if not os.path.exists('weights/realesr-general-x4v3.pth'):
             os.system(
                 'wget https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-x4v3.pth -P ./weights'
             )
+        if not os.path.exists('weights/realesr-general-wdn-x4v3.pth'):
+            os.system(
+                'wget https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-wdn-x4v3.pth -P ./weights'
+            )
         if not os.path.exists('weights/GFPGANv1.4.pth'):
             os.system('wget https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.4.pth -P ./weights')
         if not os.path.exists('weights/RealESRGAN_x4plus.pth'):
@@ -50,33 +61,19 @@ class Predictor(BasePredictor):
 
     def choose_model(self, scale, version, tile=0):
         half = True if torch.cuda.is_available() else False
-        if version == 'General - RealESRGANplus':
-            model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-            model_path = 'weights/RealESRGAN_x4plus.pth'
-            self.upsampler = RealESRGANer(
-                scale=4, model_path=model_path, model=model, tile=tile, tile_pad=10, pre_pad=0, half=half)
-        elif version == 'General - v3':
-            model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu')
-            model_path = 'weights/realesr-general-x4v3.pth'
-            self.upsampler = RealESRGANer(
-                scale=4, model_path=model_path, model=model, tile=tile, tile_pad=10, pre_pad=0, half=half)
-        elif version == 'Anime - anime6B':
-            model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
-            model_path = 'weights/RealESRGAN_x4plus_anime_6B.pth'
-            self.upsampler = RealESRGANer(
-                scale=4, model_path=model_path, model=model, tile=tile, tile_pad=10, pre_pad=0, half=half)
-        elif version == 'AnimeVideo - v3':
-            model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
-            model_path = 'weights/realesr-animevideov3.pth'
-            self.upsampler = RealESRGANer(
-                scale=4, model_path=model_path, model=model, tile=tile, tile_pad=10, pre_pad=0, half=half)
-
-        self.face_enhancer = GFPGANer(
-            model_path='weights/GFPGANv1.4.pth',
-            upscale=scale,
-            arch='clean',
-            channel_multiplier=2,
-            bg_upsampler=self.upsampler)
+        # upsamplers are kept warm by the model pool, so switching versions does not reload them
+        self.upsampler = get_upsampler(
+            VERSIONS[version], model_dir='weights', tile=tile, tile_pad=10, pre_pad=0, half=half)
+
+        if scale not in self.face_enhancers:
+            self.face_enhancers[scale] = GFPGANer(
+                model_path='weights/GFPGANv1.4.pth',
+                upscale=scale,
+                arch='clean',
+                channel_multiplier=2,
+                bg_upsampler=self.upsampler)
+        self.face_enhancer = self.face_enhancers[scale]
+        self.face_enhancer.bg_upsampler = self.upsampler
 
     def predict(
         self,
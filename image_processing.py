@@ -1,27 +1,38 @@
 import cv2
-import torch
 from PIL import Image
 import os
 
-from basicsr.archs.rrdbnet_arch import RRDBNet
-from realesrgan import RealESRGANer
+from realesrgan import ResultCache, get_upsampler, hash_file, select_model
+from realesrgan.cache import DEFAULT_CACHE_SIZE
 from gfpgan import GFPGANer
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self,
+                 cache_dir=None,
+                 cache_size=DEFAULT_CACHE_SIZE,
+                 model_name='RealESRGAN_x4plus',
+                 quality='balanced'):
+        # 'auto' choisit pour chaque image le modèle le moins coûteux de la qualité demandée
+        self.model_name = model_name
+        self.quality = quality
         self.realesrgan_model = None
         self.gfpgan_model = None
+        self.gfpgan_hash = None
+        # Cache disque optionnel des résultats : une image déjà traitée avec les mêmes options n'est pas recalculée
+        self.result_cache = ResultCache(cache_dir, cache_size) if cache_dir else None
 
     def load_models(self):
         """Charge les modèles RealESRGAN et GFPGAN."""
         print("Chargement des modèles...")
         try:
-            model_path_realesrgan = os.path.join('weights', 'RealESRGAN_x4plus.pth')
-            model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-            bg_upsampler = RealESRGANer(scale=4, model_path=model_path_realesrgan, model=model, tile=400, tile_pad=10, pre_pad=0, half=torch.cuda.is_available())
+            # Le modèle reste chargé dans le pool : un second chargement ne relit pas les poids
+            bg_upsampler = self.get_upsampler('RealESRGAN_x4plus' if self.model_name == 'auto' else self.model_name)
 
             model_path_gfpgan = os.path.join('weights', 'GFPGANv1.4.pth')
-            self.gfpgan_model = GFPGANer(model_path=model_path_gfpgan, upscale=4, arch='clean', channel_multiplier=2, bg_upsampler=bg_upsampler)
+            self.gfpgan_model = GFPGANer(
+                model_path=model_path_gfpgan, upscale=4, arch='clean', channel_multiplier=2, bg_upsampler=bg_upsampler)
+            if self.result_cache is not None:
+                self.gfpgan_hash = hash_file(model_path_gfpgan)
 
             # On stocke le modèle Real-ESRGAN de base aussi, pour le cas où GFPGAN n'est pas utilisé
             self.realesrgan_model = bg_upsampler
@@ -31,6 +42,10 @@ class ImageProcessor:
             print(f"Erreur de chargement de modèle : {e}")
             return e # On retourne l'erreur pour l'afficher dans l'UI
 
+    def get_upsampler(self, model_name):
+        """Renvoie le modèle Real-ESRGAN demandé, depuis le pool de modèles."""
+        return get_upsampler(model_name, model_dir='weights', tile='auto', tile_pad=10, pre_pad=0, precision='auto')
+
     def process_image(self, input_path, restore_faces, cancellation_event):
         """Améliore une image en utilisant les modèles chargés."""
         print(f"Traitement de {input_path}, restauration des visages: {restore_faces}")
@@ -43,14 +58,38 @@ class ImageProcessor:
             print("Traitement annulé avant le démarrage.")
             return "cancelled"
 
-        if restore_faces and self.gfpgan_model:
-            _, _, restored_img = self.gfpgan_model.enhance(img, has_aligned=False, only_center_face=False, paste_back=True)
-            output = restored_img
-        elif self.realesrgan_model:
-            output, _ = self.realesrgan_model.enhance(img, outscale=4)
-        else:
+        if self.model_name == 'auto' and self.realesrgan_model:
+            model_name = select_model(img, self.quality)
+            print(f"Modèle choisi : {model_name}")
+            self.realesrgan_model = self.get_upsampler(model_name)
+            if self.gfpgan_model:
+                self.gfpgan_model.bg_upsampler = self.realesrgan_model
+
+        restore_faces = bool(restore_faces and self.gfpgan_model)
+        if not restore_faces and not self.realesrgan_model:
             raise RuntimeError("Aucun modèle n'est chargé pour le traitement.")
 
+        key = None
+        output = None
+        # La clé couvre les pixels et toutes les options qui changent le résultat (None si les poids sont inconnus)
+        params = None if self.result_cache is None else self.realesrgan_model.cache_params(outscale=4)
+        if params is not None:
+            params.update(restore_faces=restore_faces, gfpgan=self.gfpgan_hash if restore_faces else None)
+            key = self.result_cache.key(img, **params)
+            output = self.result_cache.get(key)
+
+        if output is not None:
+            print("Résultat trouvé dans le cache.")
+        else:
+            if restore_faces:
+                _, _, restored_img = self.gfpgan_model.enhance(
+                    img, has_aligned=False, only_center_face=False, paste_back=True)
+                output = restored_img
+            else:
+                output, _ = self.realesrgan_model.enhance(img, outscale=4)
+            if key is not None:
+                self.result_cache.put(key, output)
+
         # On vérifie une dernière fois après la fin du traitement
         if cancellation_event.is_set():
             print("Traitement annulé après la fin.")
@@ -2,11 +2,9 @@ import argparse
 import cv2
 import glob
 import os
-from basicsr.archs.rrdbnet_arch import RRDBNet
-from basicsr.utils.download_util import load_file_from_url
 
-from realesrgan import RealESRGANer
-from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+from realesrgan import (MODEL_ZOO, QUALITY_TIERS, ResultCache, TileExecutor, TileRouter, get_native_model,
+                        get_upsampler, select_model)
 
 
 def main():
@@ -19,8 +17,12 @@ def main():
         '--model_name',
         type=str,
         default='RealESRGAN_x4plus',
-        help=('Model names: RealESRGAN_x4plus | RealESRNet_x4plus | RealESRGAN_x4plus_anime_6B | RealESRGAN_x2plus | '
-              'realesr-animevideov3 | realesr-general-x4v3'))
+        help=f'Model names: {" | ".join(MODEL_ZOO)} | auto for the cheapest model of --quality for each image')
+    parser.add_argument(
+        '--quality',
+        type=str,
+        default='balanced',
+        help=f'Quality tier of -n auto. Options: {" | ".join(QUALITY_TIERS)}')
     parser.add_argument('-o', '--output', type=str, default='results', help='Output folder')
     parser.add_argument(
         '-dn',
@@ -33,87 +35,150 @@ def main():
     parser.add_argument(
         '--model_path', type=str, default=None, help='[Option] Model path. Usually, you do not need to specify it')
     parser.add_argument('--suffix', type=str, default='out', help='Suffix of the restored image')
-    parser.add_argument('-t', '--tile', type=int, default=0, help='Tile size, 0 for no tile during testing')
-    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument(
+        '-t',
+        '--tile',
+        type=str,
+        default='0',
+        help='Tile size, 0 for no tile during testing, auto to derive it from --tile_memory_budget')
+    parser.add_argument(
+        '--tile_memory_budget',
+        type=float,
+        default=None,
+        help='Memory budget in GB for one tile, used by --tile auto. Default: 80%% of the free GPU memory')
+    parser.add_argument(
+        '--tile_pad',
+        type=str,
+        default='10',
+        help='Tile padding, exact for the receptive field of the network (tiled output identical to untiled)')
+    parser.add_argument(
+        '--tile_batch_size', type=int, default=1, help='Number of same-sized tiles processed in one forward pass')
+    parser.add_argument(
+        '--tile_workers',
+        type=int,
+        default=0,
+        help='Number of worker processes running the tiles of each image, spread over the GPUs, or on the CPU '
+        'without GPU. 0 runs them in this process')
+    parser.add_argument(
+        '--tile_dedup',
+        action='store_true',
+        help='Run the network once for byte-identical tiles, e.g., the flat areas of documents and screenshots')
+    parser.add_argument(
+        '--tile_cache_size',
+        type=int,
+        default=0,
+        help='With --tile_dedup, number of tile outputs reused across images. 0 only deduplicates within an image')
+    parser.add_argument(
+        '--tile_router',
+        action='store_true',
+        help='Upsample the flat tiles with bicubic and the medium tiles with --compact_model, only the detailed '
+        'tiles with the model. Needs --tile')
+    parser.add_argument(
+        '--compact_model',
+        type=str,
+        default='realesr-general-x4v3',
+        help='Compact model of the medium tiles of --tile_router, of the same scale as the model. none for the model')
+    parser.add_argument(
+        '--router_thresholds',
+        type=float,
+        nargs=2,
+        default=[0.015, 0.05],
+        help='Gradient energy thresholds of the flat and the medium tiles of --tile_router')
     parser.add_argument('--pre_pad', type=int, default=0, help='Pre padding size at each border')
     parser.add_argument('--face_enhance', action='store_true', help='Use GFPGAN to enhance face')
     parser.add_argument(
-        '--fp32', action='store_true', help='Use fp32 precision during inference. Default: fp16 (half precision).')
+        '--fp32', action='store_true', help='Use fp32 precision during inference, same as --precision fp32')
+    parser.add_argument(
+        '--precision',
+        type=str,
+        default='auto',
+        help=('Inference precision. Options: fp32 | fp16 | bf16 | auto. auto uses fp16 on GPU, and bf16 autocast on '
+              'CPUs with native bfloat16 instructions (fp32 otherwise)'))
     parser.add_argument(
         '--alpha_upsampler',
         type=str,
         default='realesrgan',
         help='The upsampler for the alpha channels. Options: realesrgan | bicubic')
+    parser.add_argument(
+        '--batch_alpha',
+        action='store_true',
+        help='Process the image and its alpha channel in one batched forward pass (needs twice the memory)')
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=1,
+        help='Number of images read before they are enhanced together, the images of the same size sharing forward '
+        'passes within --tile_memory_budget. 1 enhances the images one by one')
     parser.add_argument(
         '--ext',
         type=str,
         default='auto',
         help='Image extension. Options: auto | jpg | png, auto means using the same extension as inputs')
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        default=None,
+        help='Folder of an on-disk cache of the results, so that repeated images are not processed again')
+    parser.add_argument('--cache_size', type=float, default=2, help='Size cap of the result cache, in GB')
     parser.add_argument(
         '-g', '--gpu-id', type=int, default=None, help='gpu device to use (default=None) can be 0,1,2 for multi-gpu')
 
     args = parser.parse_args()
+    if args.tile_router and args.tile == '0':
+        parser.error('--tile_router routes the tiles of the images, set --tile to a tile size or auto')
 
-    # determine models according to model names
+    # the model is built from the model zoo, and its weights are downloaded on first use
     args.model_name = args.model_name.split('.')[0]
-    if args.model_name == 'RealESRGAN_x4plus':  # x4 RRDBNet model
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth']
-    elif args.model_name == 'RealESRNet_x4plus':  # x4 RRDBNet model
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.1/RealESRNet_x4plus.pth']
-    elif args.model_name == 'RealESRGAN_x4plus_anime_6B':  # x4 RRDBNet model with 6 blocks
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.2.4/RealESRGAN_x4plus_anime_6B.pth']
-    elif args.model_name == 'RealESRGAN_x2plus':  # x2 RRDBNet model
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2)
-        netscale = 2
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.1/RealESRGAN_x2plus.pth']
-    elif args.model_name == 'realesr-animevideov3':  # x4 VGG-style model (XS size)
-        model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-animevideov3.pth']
-    elif args.model_name == 'realesr-general-x4v3':  # x4 VGG-style model (S size)
-        model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu')
-        netscale = 4
-        file_url = [
-            'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-wdn-x4v3.pth',
-            'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-x4v3.pth'
-        ]
-
-    # determine model paths
-    if args.model_path is not None:
-        model_path = args.model_path
-    else:
-        model_path = os.path.join('weights', args.model_name + '.pth')
-        if not os.path.isfile(model_path):
-            ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-            for url in file_url:
-                # model_path will be updated
-                model_path = load_file_from_url(
-                    url=url, model_dir=os.path.join(ROOT_DIR, 'weights'), progress=True, file_name=None)
-
-    # use dni to control the denoise strength
-    dni_weight = None
-    if args.model_name == 'realesr-general-x4v3' and args.denoise_strength != 1:
-        wdn_model_path = model_path.replace('realesr-general-x4v3', 'realesr-general-wdn-x4v3')
-        model_path = [model_path, wdn_model_path]
-        dni_weight = [args.denoise_strength, 1 - args.denoise_strength]
-
-    # restorer
-    upsampler = RealESRGANer(
-        scale=netscale,
-        model_path=model_path,
-        dni_weight=dni_weight,
-        model=model,
-        tile=args.tile,
-        tile_pad=args.tile_pad,
-        pre_pad=args.pre_pad,
-        half=not args.fp32,
-        gpu_id=args.gpu_id)
+    result_cache = None if args.cache_dir is None else ResultCache(args.cache_dir, int(args.cache_size * 1024**3))
+    tile_router = None
+    if args.tile_router:
+        compact = None
+        if args.compact_model != 'none':
+            compact = get_upsampler(
+                args.compact_model,
+                precision='fp32' if args.fp32 else args.precision,
+                outscale=args.outscale,
+                gpu_id=args.gpu_id)
+        tile_router = TileRouter(compact, thresholds=args.router_thresholds)
+    # upsamplers by model name, with -n auto
+    upsamplers = {}
+
+    def load_upsampler(name):
+        if name in upsamplers:
+            return upsamplers[name]
+        model_path = None if auto else args.model_path
+        if model_path is None and get_native_model(name, args.outscale) != name:
+            print(f'Model {get_native_model(name, args.outscale)} for the x{args.outscale:g} output of {name}')
+        upsampler = get_upsampler(
+            name,
+            model_path=model_path,
+            denoise_strength=args.denoise_strength,
+            tile=args.tile if args.tile == 'auto' else int(args.tile),
+            tile_pad=args.tile_pad if args.tile_pad == 'exact' else int(args.tile_pad),
+            tile_batch_size=args.tile_batch_size,
+            tile_memory_budget=None if args.tile_memory_budget is None else int(args.tile_memory_budget * 1024**3),
+            batch_alpha=args.batch_alpha,
+            pre_pad=args.pre_pad,
+            outscale=args.outscale,
+            precision='fp32' if args.fp32 else args.precision,
+            gpu_id=args.gpu_id)
+        if args.tile_workers:
+            upsampler.executor = TileExecutor(upsampler, num_workers=args.tile_workers)
+        upsampler.tile_dedup, upsampler.tile_cache_size = args.tile_dedup, args.tile_cache_size
+        upsampler.tile_router = tile_router
+        compact = None if tile_router is None else tile_router.compact
+        if compact is not None and compact.scale != upsampler.scale:
+            print(f'Warning: the compact model is x{compact.scale} and the model x{upsampler.scale}, the medium tiles '
+                  'run the model')
+        if compact is upsampler or (compact is not None and compact.scale != upsampler.scale):
+            # the medium tiles run this model: the pooled compact upsampler is this one, or it has another scale
+            upsampler.tile_router = TileRouter(None, tile_router.thresholds, tile_router.flat_tier, tile_router.feather)
+        upsampler.result_cache = result_cache
+        upsamplers[name] = upsampler
+        return upsampler
+
+    auto = args.model_name == 'auto'
+    upsampler = None if auto else load_upsampler(args.model_name)
 
     if args.face_enhance:  # Use GFPGAN for face enhancement
         from gfpgan import GFPGANer
@@ -130,6 +195,38 @@ def main():
     else:
         paths = sorted(glob.glob(os.path.join(args.input, '*')))
 
+    def save(imgname, extension, img_mode, output):
+        if args.ext == 'auto':
+            extension = extension[1:]
+        else:
+            extension = args.ext
+        if img_mode == 'RGBA':  # RGBA images should be saved in png format
+            extension = 'png'
+        if args.suffix == '':
+            save_path = os.path.join(args.output, f'{imgname}.{extension}')
+        else:
+            save_path = os.path.join(args.output, f'{imgname}_{args.suffix}.{extension}')
+        cv2.imwrite(save_path, output)
+
+    # images waiting for a batch, by model name: (imgname, extension, img)
+    batch_jobs = {}
+
+    def flush_batch(model_name):
+        jobs = batch_jobs.pop(model_name, [])
+        if not jobs:
+            return
+        upsampler = load_upsampler(model_name)
+        try:
+            results = upsampler.enhance_batch([img for _, _, img in jobs],
+                                              outscale=args.outscale,
+                                              memory_budget=upsampler.tile_memory_budget)
+        except RuntimeError as error:
+            print('Error', error)
+            print('If you encounter CUDA out of memory, try to set --batch_size with a smaller number.')
+        else:
+            for (imgname, extension, _), (output, img_mode) in zip(jobs, results):
+                save(imgname, extension, img_mode, output)
+
     for idx, path in enumerate(paths):
         imgname, extension = os.path.splitext(os.path.basename(path))
         print('Testing', idx, imgname)
@@ -139,27 +236,45 @@ def main():
             img_mode = 'RGBA'
         else:
             img_mode = None
+        model_name = args.model_name
+        if auto:
+            model_name = select_model(img, args.quality)
+            print('Model', model_name)
+            upsampler = load_upsampler(model_name)
+            if args.face_enhance:
+                face_enhancer.bg_upsampler = upsampler
+
+        if args.batch_size > 1 and not args.face_enhance:
+            batch_jobs.setdefault(model_name, []).append((imgname, extension, img))
+            if len(batch_jobs[model_name]) >= args.batch_size:
+                flush_batch(model_name)
+            continue
 
         try:
             if args.face_enhance:
                 _, _, output = face_enhancer.enhance(img, has_aligned=False, only_center_face=False, paste_back=True)
             else:
                 output, _ = upsampler.enhance(img, outscale=args.outscale)
+                if upsampler.tile_routes is not None:
+                    print('Tile routes:', ', '.join(f'{tier} {n}' for tier, n in upsampler.tile_routes.items()))
         except RuntimeError as error:
             print('Error', error)
             print('If you encounter CUDA out of memory, try to set --tile with a smaller number.')
         else:
-            if args.ext == 'auto':
-                extension = extension[1:]
-            else:
-                extension = args.ext
-            if img_mode == 'RGBA':  # RGBA images should be saved in png format
-                extension = 'png'
-            if args.suffix == '':
-                save_path = os.path.join(args.output, f'{imgname}.{extension}')
-            else:
-                save_path = os.path.join(args.output, f'{imgname}_{args.suffix}.{extension}')
-            cv2.imwrite(save_path, output)
+            save(imgname, extension, img_mode, output)
+    for model_name in list(batch_jobs):
+        flush_batch(model_name)
+
+    tile_hits = tile_misses = 0
+    for upsampler in upsamplers.values():
+        if upsampler.executor is not None:
+            upsampler.executor.close()
+        tile_hits, tile_misses = tile_hits + upsampler.tile_hits, tile_misses + upsampler.tile_misses
+    if result_cache is not None:
+        print(f'Result cache: {result_cache.hits} hits, {result_cache.misses} misses')
+    if args.tile_dedup:
+        print(f'Tile dedup: {tile_hits} hits, {tile_misses} misses '
+              f'({tile_hits / max(1, tile_hits + tile_misses):.1%} hit rate)')
 
 
 if __name__ == '__main__':
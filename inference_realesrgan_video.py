@@ -7,13 +7,10 @@ import os
 import shutil
 import subprocess
 import torch
-from basicsr.archs.rrdbnet_arch import RRDBNet
-from basicsr.utils.download_util import load_file_from_url
 from os import path as osp
 from tqdm import tqdm
 
-from realesrgan import RealESRGANer
-from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+from realesrgan import MODEL_ZOO, QUALITY_TIERS, get_upsampler, select_model
 
 try:
     import ffmpeg
@@ -36,6 +33,20 @@ def get_video_meta_info(video_path):
     return ret
 
 
+def get_first_frame(args):
+    """Read the first frame of the input video, image or folder."""
+    input_type = mimetypes.guess_type(args.input)[0] or 'folder'
+    if input_type.startswith('video'):
+        meta = get_video_meta_info(args.input)
+        out, _ = (
+            ffmpeg.input(args.input).output('pipe:', format='rawvideo', pix_fmt='bgr24', vframes=1,
+                                            loglevel='error').run(capture_stdout=True, cmd=args.ffmpeg_bin))
+        return np.frombuffer(out, np.uint8).reshape([meta['height'], meta['width'], 3])
+    if input_type.startswith('image'):
+        return cv2.imread(args.input)
+    return cv2.imread(sorted(glob.glob(os.path.join(args.input, '*')))[0])
+
+
 def get_sub_video(args, num_process, process_idx):
     if num_process == 1:
         return args.input
@@ -173,60 +184,16 @@ class Writer:
 def inference_video(args, video_save_path, device=None, total_workers=1, worker_idx=0):
     # ---------------------- determine models according to model names ---------------------- #
     args.model_name = args.model_name.split('.pth')[0]
-    if args.model_name == 'RealESRGAN_x4plus':  # x4 RRDBNet model
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth']
-    elif args.model_name == 'RealESRNet_x4plus':  # x4 RRDBNet model
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.1/RealESRNet_x4plus.pth']
-    elif args.model_name == 'RealESRGAN_x4plus_anime_6B':  # x4 RRDBNet model with 6 blocks
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.2.4/RealESRGAN_x4plus_anime_6B.pth']
-    elif args.model_name == 'RealESRGAN_x2plus':  # x2 RRDBNet model
-        model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2)
-        netscale = 2
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.1/RealESRGAN_x2plus.pth']
-    elif args.model_name == 'realesr-animevideov3':  # x4 VGG-style model (XS size)
-        model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
-        netscale = 4
-        file_url = ['https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-animevideov3.pth']
-    elif args.model_name == 'realesr-general-x4v3':  # x4 VGG-style model (S size)
-        model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu')
-        netscale = 4
-        file_url = [
-            'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-wdn-x4v3.pth',
-            'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-x4v3.pth'
-        ]
-
-    # ---------------------- determine model paths ---------------------- #
-    model_path = os.path.join('weights', args.model_name + '.pth')
-    if not os.path.isfile(model_path):
-        ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-        for url in file_url:
-            # model_path will be updated
-            model_path = load_file_from_url(
-                url=url, model_dir=os.path.join(ROOT_DIR, 'weights'), progress=True, file_name=None)
-
-    # use dni to control the denoise strength
-    dni_weight = None
-    if args.model_name == 'realesr-general-x4v3' and args.denoise_strength != 1:
-        wdn_model_path = model_path.replace('realesr-general-x4v3', 'realesr-general-wdn-x4v3')
-        model_path = [model_path, wdn_model_path]
-        dni_weight = [args.denoise_strength, 1 - args.denoise_strength]
-
-    # restorer
-    upsampler = RealESRGANer(
-        scale=netscale,
-        model_path=model_path,
-        dni_weight=dni_weight,
-        model=model,
-        tile=args.tile,
-        tile_pad=args.tile_pad,
+    upsampler = get_upsampler(
+        args.model_name,
+        denoise_strength=args.denoise_strength,
+        tile=args.tile if args.tile == 'auto' else int(args.tile),
+        tile_pad=args.tile_pad if args.tile_pad == 'exact' else int(args.tile_pad),
+        tile_batch_size=args.tile_batch_size,
+        tile_memory_budget=None if args.tile_memory_budget is None else int(args.tile_memory_budget * 1024**3),
         pre_pad=args.pre_pad,
-        half=not args.fp32,
+        outscale=args.outscale,
+        precision='fp32' if args.fp32 else args.precision,
         device=device,
     )
 
@@ -254,23 +221,37 @@ def inference_video(args, video_save_path, device=None, total_workers=1, worker_
 
     pbar = tqdm(total=len(reader), unit='frame', desc='inference')
     while True:
-        img = reader.get_frame()
-        if img is None:
+        # the frames of a batch have the same size, and share the forward passes
+        imgs = []
+        while len(imgs) < (1 if args.face_enhance else args.batch_size):
+            img = reader.get_frame()
+            if img is None:
+                break
+            imgs.append(img)
+        if not imgs:
             break
 
         try:
             if args.face_enhance:
-                _, _, output = face_enhancer.enhance(img, has_aligned=False, only_center_face=False, paste_back=True)
+                _, _, output = face_enhancer.enhance(
+                    imgs[0], has_aligned=False, only_center_face=False, paste_back=True)
+                outputs = [output]
+            elif len(imgs) > 1:
+                results = upsampler.enhance_batch(
+                    imgs, outscale=args.outscale, memory_budget=upsampler.tile_memory_budget)
+                outputs = [output for output, _ in results]
             else:
-                output, _ = upsampler.enhance(img, outscale=args.outscale)
+                output, _ = upsampler.enhance(imgs[0], outscale=args.outscale)
+                outputs = [output]
         except RuntimeError as error:
             print('Error', error)
-            print('If you encounter CUDA out of memory, try to set --tile with a smaller number.')
+            print('If you encounter CUDA out of memory, try to set --tile or --batch_size with a smaller number.')
         else:
-            writer.write_frame(output)
+            for output in outputs:
+                writer.write_frame(output)
 
         torch.cuda.synchronize(device)
-        pbar.update(1)
+        pbar.update(len(imgs))
 
     reader.close()
     writer.close()
@@ -286,6 +267,11 @@ def run(args):
         os.system(f'ffmpeg -i {args.input} -qscale:v 1 -qmin 1 -qmax 1 -vsync 0  {tmp_frames_folder}/frame%08d.png')
         args.input = tmp_frames_folder
 
+    if args.model_name == 'auto':
+        # one model for the whole video, selected on its first frame, so that the frames stay consistent
+        args.model_name = select_model(get_first_frame(args), args.quality)
+        print('Model', args.model_name)
+
     num_gpus = torch.cuda.device_count()
     num_process = num_gpus * args.num_process_per_gpu
     if num_process == 1:
@@ -335,9 +321,13 @@ def main():
         '--model_name',
         type=str,
         default='realesr-animevideov3',
-        help=('Model names: realesr-animevideov3 | RealESRGAN_x4plus_anime_6B | RealESRGAN_x4plus | RealESRNet_x4plus |'
-              ' RealESRGAN_x2plus | realesr-general-x4v3'
-              'Default:realesr-animevideov3'))
+        help=f'Model names: {" | ".join(MODEL_ZOO)} | auto for the cheapest model of --quality, selected on the '
+        'first frame. Default: realesr-animevideov3')
+    parser.add_argument(
+        '--quality',
+        type=str,
+        default='balanced',
+        help=f'Quality tier of -n auto. Options: {" | ".join(QUALITY_TIERS)}')
     parser.add_argument('-o', '--output', type=str, default='results', help='Output folder')
     parser.add_argument(
         '-dn',
@@ -348,12 +338,39 @@ def main():
               'Only used for the realesr-general-x4v3 model'))
     parser.add_argument('-s', '--outscale', type=float, default=4, help='The final upsampling scale of the image')
     parser.add_argument('--suffix', type=str, default='out', help='Suffix of the restored video')
-    parser.add_argument('-t', '--tile', type=int, default=0, help='Tile size, 0 for no tile during testing')
-    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument(
+        '-t',
+        '--tile',
+        type=str,
+        default='0',
+        help='Tile size, 0 for no tile during testing, auto to derive it from --tile_memory_budget')
+    parser.add_argument(
+        '--tile_memory_budget',
+        type=float,
+        default=None,
+        help='Memory budget in GB for one tile, used by --tile auto. Default: 80%% of the free GPU memory')
+    parser.add_argument(
+        '--tile_pad',
+        type=str,
+        default='10',
+        help='Tile padding, exact for the receptive field of the network (tiled output identical to untiled)')
+    parser.add_argument(
+        '--tile_batch_size', type=int, default=1, help='Number of same-sized tiles processed in one forward pass')
     parser.add_argument('--pre_pad', type=int, default=0, help='Pre padding size at each border')
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=1,
+        help='Number of frames processed together, in forward passes within --tile_memory_budget')
     parser.add_argument('--face_enhance', action='store_true', help='Use GFPGAN to enhance face')
     parser.add_argument(
-        '--fp32', action='store_true', help='Use fp32 precision during inference. Default: fp16 (half precision).')
+        '--fp32', action='store_true', help='Use fp32 precision during inference, same as --precision fp32')
+    parser.add_argument(
+        '--precision',
+        type=str,
+        default='auto',
+        help=('Inference precision. Options: fp32 | fp16 | bf16 | auto. auto uses fp16 on GPU, and bf16 autocast on '
+              'CPUs with native bfloat16 instructions (fp32 otherwise)'))
     parser.add_argument('--fps', type=float, default=None, help='FPS of the output video')
     parser.add_argument('--ffmpeg_bin', type=str, default='ffmpeg', help='The path to ffmpeg')
     parser.add_argument('--extract_frame_first', action='store_true')
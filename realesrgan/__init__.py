@@ -1,6 +1,13 @@
 # flake8: noqa
 from .archs import *
+from .cache import *
 from .data import *
+from .executor import *
+from .model_zoo import *
 from .models import *
+from .onnx_backend import *
+from .quantization import *
+from .routing import *
+from .tiling import *
 from .utils import *
 from .version import *
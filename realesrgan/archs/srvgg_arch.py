@@ -67,3 +67,39 @@ class SRVGGNetCompact(nn.Module):
         base = F.interpolate(x, scale_factor=self.upscale, mode='nearest')
         out += base
         return out
+
+
+@ARCH_REGISTRY.register()
+class SRVGGNetCompactInference(SRVGGNetCompact):
+    """An inference variant of SRVGGNetCompact, with the same layers and state dicts.
+
+    The nearest upsampled image is added to the output of the last conv before the pixel shuffle, as the input
+    channel ``c`` is broadcast to its ``upscale**2`` sub-pixel channels. It is the same addition as the one of
+    SRVGGNetCompact, so the output is identical, but neither the full-resolution upsampled image nor the extra
+    full-resolution add pass are needed. Activations run in place, except PReLU which has no in-place kernel.
+    It requires ``num_in_ch == num_out_ch``, like the residual of SRVGGNetCompact.
+
+    Args:
+        See SRVGGNetCompact.
+    """
+
+    def forward(self, x):
+        out = x
+        for layer in self.body:
+            out = layer(out)
+
+        # (N, C * s * s, H, W) -> (N, C, s * s, H, W): the sub-pixel channels of the pixel shuffle
+        n, c, h, w = x.shape
+        out.view(n, c, self.upscale * self.upscale, h, w).add_(x.unsqueeze(2))
+        return self.upsampler(out)
+
+    def to_compact(self):
+        """The SRVGGNetCompact with the same parameters, on cpu in fp32.
+
+        The in-place addition on a view of this forward is not captured by the ONNX export and the FX quantization,
+        which use the plain network instead.
+        """
+        net = SRVGGNetCompact(self.num_in_ch, self.num_out_ch, self.num_feat, self.num_conv, self.upscale,
+                              self.act_type)
+        net.load_state_dict(self.state_dict())
+        return net
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import numpy as np
+import os
+import threading
+import torch
+from collections import OrderedDict
+
+__all__ = ['ResultCache', 'hash_file', 'hash_params']
+
+# default size cap of a ResultCache
+DEFAULT_CACHE_SIZE = 2 * 1024**3
+
+
+def hash_params(tensors):
+    """Hash of network parameters, e.g., ``model.state_dict().values()``, to key the results of their weights."""
+    digest = hashlib.blake2b(digest_size=16)
+    for tensor in tensors:
+        tensor = tensor.detach().cpu().contiguous()
+        digest.update(f'{tuple(tensor.shape)}{tensor.dtype}'.encode())
+        if tensor.numel():
+            digest.update(tensor.view(-1).view(torch.uint8).numpy().data)
+    return digest.hexdigest()
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Hash of a file, e.g., an ONNX or TorchScript network which holds its weights."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache():
+    """An on-disk cache of enhanced images, keyed by a hash of the input pixels and of the output-affecting options.
+
+    Results are stored as ``.npy`` files in ``cache_dir``, so they are lossless and shared by the processes using the
+    same folder. The least recently used ones are evicted when the files exceed ``max_size``. The hits and misses are
+    counted in ``hits`` and ``misses``.
+
+    Args:
+        cache_dir (str): Folder of the cached results. It is created if needed.
+        max_size (int): Size cap of the cached results in bytes. Default: DEFAULT_CACHE_SIZE.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # key -> file size, from the least to the most recently used
+        self.entries = OrderedDict()
+        paths = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.npy')]
+        for entry in sorted(paths, key=lambda entry: entry.stat().st_mtime):
+            self.entries[entry.name[:-4]] = entry.stat().st_size
+
+    @property
+    def size(self):
+        """Size of the cached results, in bytes."""
+        return sum(self.entries.values())
+
+    @staticmethod
+    def key(img, **params):
+        """Key of the result of an image.
+
+        Args:
+            img (ndarray): Input image.
+            params: Every option which affects the output, e.g., the weights hash, the denoise strength, the outscale.
+                The values must be JSON serializable.
+        """
+        img = np.ascontiguousarray(img)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f'{img.shape}{img.dtype}'.encode())
+        digest.update(img.data)
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npy')
+
+    def get(self, key):
+        """The cached result of a key, or None."""
+        with self._lock:
+            try:
+                output = np.load(self._path(key))
+            except (OSError, ValueError):
+                # missing, or evicted by another process
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            if key not in self.entries:
+                # written by another process, the file size counts against max_size
+                self.entries[key] = os.path.getsize(self._path(key))
+            self.entries.move_to_end(key)
+            os.utime(self._path(key))
+            return output
+
+    def put(self, key, output):
+        """Cache the result of a key, and evict the least recently used results over ``max_size``."""
+        with self._lock:
+            path = self._path(key)
+            # written to a temporary file first, so that other processes never read a partial file
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, output)
+            os.replace(tmp_path, path)
+            self.entries[key] = os.path.getsize(path)
+            self.entries.move_to_end(key)
+            while len(self.entries) > 1 and self.size > self.max_size:
+                evicted, _ = self.entries.popitem(last=False)
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            for key in self.entries:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self.entries.clear()
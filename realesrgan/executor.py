@@ -0,0 +1,113 @@
+import copy
+import os
+import time
+import torch
+from collections import OrderedDict
+
+from realesrgan.onnx_backend import OnnxRuntimeModel
+from realesrgan.utils import resolve_precision
+
+__all__ = ['TileExecutor']
+
+# the upsampler of a worker process
+_worker = None
+
+
+def _init_worker(upsampler, devices, num_threads):
+    """Move the upsampler copy of a worker process to the next free device of the pool."""
+    global _worker
+    device = torch.device(devices.get())
+    if device.type == 'cpu':
+        torch.set_num_threads(num_threads)
+    upsampler.device = device
+    upsampler.precision = resolve_precision(upsampler.precision, device)
+    upsampler.half = upsampler.precision == 'fp16'
+    upsampler.model = upsampler.model.to(device)
+    upsampler.model = upsampler.model.half() if upsampler.half else upsampler.model.float()
+    _worker = upsampler
+
+
+@torch.no_grad()
+def _run_tiles(task):
+    """Run a tile batch, retrying out of memory errors with smaller inputs as the in-process tile process does."""
+    index, input_tiles = task
+    input_tiles = input_tiles.to(_worker.device, torch.float16 if _worker.half else torch.float32)
+    start = time.perf_counter()
+    output_tiles = _worker._forward_resilient(input_tiles).cpu()
+    return index, output_tiles, time.perf_counter() - start
+
+
+class TileExecutor():
+    """Run the tiles of an image on a pool of worker processes, e.g., one per GPU or several on a many-core CPU.
+
+    Each worker holds a resident copy of the network (the workers on cpu map the parameters of a cpu network from
+    shared memory) and runs the tile batches of :meth:`RealESRGANer.tile_process`, which are stitched as they arrive.
+    A tile is processed exactly as on a single worker, so the output is identical, and an out of memory error is
+    retried with smaller inputs, see :meth:`RealESRGANer._forward_resilient`. The network time of the workers is
+    summed in the ``forward`` timing of the upsampler. Attach it with
+    ``upsampler.executor = executor``. The workers copy the network once, so create a new executor after
+    :meth:`RealESRGANer.set_dni_weight`.
+
+    Args:
+        upsampler (RealESRGANer): Upsampler with a PyTorch network.
+        devices (list[str | torch.device]): Device of each worker. None uses ``num_workers`` workers, on the cuda
+            devices in turn if available, and on cpu otherwise. Default: None.
+        num_workers (int): Number of workers when ``devices`` is None. None uses one worker per cuda device, or
+            ``os.cpu_count()`` cpu workers. Default: None.
+        num_threads (int): Torch threads of each cpu worker. None shares the cpu cores among the cpu workers.
+            Default: None.
+    """
+
+    def __init__(self, upsampler, devices=None, num_workers=None, num_threads=None):
+        if isinstance(upsampler.model, (OnnxRuntimeModel, torch.jit.ScriptModule)):
+            raise ValueError('TileExecutor only supports PyTorch networks.')
+        if devices is None:
+            num_cuda = torch.cuda.device_count()
+            if num_cuda:
+                devices = [f'cuda:{i % num_cuda}' for i in range(num_workers or num_cuda)]
+            else:
+                devices = ['cpu'] * (num_workers or os.cpu_count())
+        self.devices = [str(device) for device in devices]
+        num_cpu_workers = sum(torch.device(device).type == 'cpu' for device in self.devices)
+        num_threads = num_threads or max(1, os.cpu_count() // max(1, num_cpu_workers))
+
+        # the copy sent to the workers, without the state of the parent upsampler
+        worker = copy.copy(upsampler)
+        worker.model = upsampler.model if torch.device(upsampler.device).type == 'cpu' else copy.deepcopy(
+            upsampler.model).cpu()
+        worker.compiled_model = None
+        worker.warm_shapes = set()
+        worker.dni_params = None
+        worker._dni_blends = OrderedDict()
+        worker.executor = None
+        worker.result_cache = None
+        worker._tile_outputs = OrderedDict()
+        worker.tile_router = None
+        for name in ['img', 'output', '_tile_keys', '_tile_inputs', '_tile_needed', '_tile_tiers', '_tile_feathers']:
+            worker.__dict__.pop(name, None)
+
+        context = torch.multiprocessing.get_context('spawn')
+        free_devices = context.Queue()
+        for device in self.devices:
+            free_devices.put(device)
+        self.pool = context.Pool(len(self.devices), _init_worker, (worker, free_devices, num_threads))
+
+    def map(self, input_batches):
+        """Run batches of (N, 3, H, W) input tiles on the workers.
+
+        Yields:
+            tuple: The index of a batch, its output on cpu, and the seconds the worker ran the network, in the order
+                the batches complete.
+        """
+        tasks = ((i, input_tiles.cpu()) for i, input_tiles in enumerate(input_batches))
+        yield from self.pool.imap_unordered(_run_tiles, tasks)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,353 @@
+import logging
+import os
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+from basicsr.utils.download_util import load_file_from_url
+from collections import OrderedDict
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompactInference
+from realesrgan.routing import classify_content, image_features
+from realesrgan.utils import ROOT_DIR, RealESRGANer, get_device, resolve_precision
+
+__all__ = [
+    'MODEL_ZOO', 'QUALITY_TIERS', 'ModelPool', 'build_model', 'get_model_path', 'get_native_model', 'get_upsampler',
+    'get_wdn_path', 'select_model'
+]
+
+logger = logging.getLogger(__name__)
+
+_RELEASES = 'https://github.com/xinntao/Real-ESRGAN/releases/download'
+
+# model name -> network architecture, network scale and weight urls. Models with a ``wdn_url`` support the denoise
+# strength, by interpolating their weights with the ones of the weak-denoise model. ``native`` maps smaller output
+# scales to the cheaper models of the same family trained at these scales. ``kmacs`` is the cost of the network in
+# thousands of multiply-accumulates per input pixel. ``quality`` rates the models selected by select_model per content
+# class, from 0 (unsuitable) to 3 (best)
+MODEL_ZOO = {
+    'RealESRGAN_x4plus': {  # x4 RRDBNet model
+        'arch': lambda: RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4),
+        'netscale': 4,
+        'url': f'{_RELEASES}/v0.1.0/RealESRGAN_x4plus.pth',
+        'native': {
+            2: 'RealESRGAN_x2plus'
+        },
+        'kmacs': 17927,
+        'quality': {
+            'line art': 2,
+            'low detail': 3,
+            'detailed': 3
+        },
+    },
+    'RealESRNet_x4plus': {  # x4 RRDBNet model
+        'arch': lambda: RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4),
+        'netscale': 4,
+        'url': f'{_RELEASES}/v0.1.1/RealESRNet_x4plus.pth',
+        'kmacs': 17927,
+    },
+    'RealESRGAN_x4plus_anime_6B': {  # x4 RRDBNet model with 6 blocks
+        'arch': lambda: RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4),
+        'netscale': 4,
+        'url': f'{_RELEASES}/v0.2.2.4/RealESRGAN_x4plus_anime_6B.pth',
+        'kmacs': 5706,
+        'quality': {
+            'line art': 3,
+            'low detail': 1,
+            'detailed': 1
+        },
+    },
+    'RealESRGAN_x2plus': {  # x2 RRDBNet model
+        'arch': lambda: RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=2),
+        'netscale': 2,
+        'url': f'{_RELEASES}/v0.2.1/RealESRGAN_x2plus.pth',
+        'kmacs': 4483,
+    },
+    'realesr-animevideov3': {  # x4 VGG-style model (XS size)
+        'arch': lambda: SRVGGNetCompactInference(
+            num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu'),
+        'netscale': 4,
+        'url': f'{_RELEASES}/v0.2.5.0/realesr-animevideov3.pth',
+        'kmacs': 619,
+        'quality': {
+            'line art': 2,
+            'low detail': 1,
+            'detailed': 0
+        },
+    },
+    'realesr-general-x4v3': {  # x4 VGG-style model (S size)
+        'arch': lambda: SRVGGNetCompactInference(
+            num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu'),
+        'netscale': 4,
+        'url': f'{_RELEASES}/v0.2.5.0/realesr-general-x4v3.pth',
+        'wdn_url': f'{_RELEASES}/v0.2.5.0/realesr-general-wdn-x4v3.pth',
+        'kmacs': 1209,
+        'quality': {
+            'line art': 2,
+            'low detail': 2,
+            'detailed': 1
+        },
+    },
+}
+
+# minimum quality rating of the models selected by select_model
+QUALITY_TIERS = {'fast': 1, 'balanced': 2, 'best': 3}
+
+# default cap of the parameter memory of the warm upsamplers of a ModelPool
+DEFAULT_POOL_MEMORY = 2 * 1024**3
+
+
+def build_model(name):
+    """Build the (randomly initialized) network of a model of the zoo.
+
+    Returns:
+        tuple: The network and its scale.
+    """
+    if name not in MODEL_ZOO:
+        raise ValueError(f'Unknown model {name}. Options: {" | ".join(MODEL_ZOO)}')
+    return MODEL_ZOO[name]['arch'](), MODEL_ZOO[name]['netscale']
+
+
+def get_native_model(name, outscale):
+    """The model of the same family as ``name`` whose network scale is ``outscale``, or ``name`` if there is none.
+
+    A native model avoids resampling the network output, e.g., RealESRGAN_x2plus for RealESRGAN_x4plus at 2x.
+    """
+    if name not in MODEL_ZOO or outscale is None or float(outscale) == MODEL_ZOO[name]['netscale']:
+        return name
+    native = MODEL_ZOO[name].get('native', {})
+    return native.get(int(outscale), name) if float(outscale).is_integer() else name
+
+
+def select_model(img, quality='balanced', thresholds=None, baseline='RealESRGAN_x4plus'):
+    """Select the cheapest model of the zoo whose quality rating meets a tier, for the content of an image.
+
+    The content class comes from cheap statistics of a thumbnail, see :func:`realesrgan.routing.image_features`.
+    The decision is logged with its cost relative to ``baseline``, to audit the savings.
+
+    Args:
+        img (ndarray): Image of shape (H, W), (H, W, 3) or (H, W, 4) in BGR(A) order, uint8 or uint16.
+        quality (str): Quality tier. Options: fast | balanced | best. Default: 'balanced'.
+        thresholds (dict): Thresholds of :func:`realesrgan.routing.classify_content`. Default: None.
+        baseline (str): Model the savings are computed against. Default: 'RealESRGAN_x4plus'.
+
+    Returns:
+        str: Model name.
+    """
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f'Unknown quality tier {quality}. Options: {" | ".join(QUALITY_TIERS)}')
+    features = image_features(img)
+    content = classify_content(features, thresholds)
+    candidates = [
+        name for name, entry in MODEL_ZOO.items() if entry.get('quality', {}).get(content, 0) >= QUALITY_TIERS[quality]
+    ]
+    name = min(candidates, key=lambda name: MODEL_ZOO[name]['kmacs'])
+    cost = MODEL_ZOO[name]['kmacs'] / MODEL_ZOO[baseline]['kmacs']
+    logger.info(
+        'auto model: %s for %s content at %s quality, %.1f%% of the %s cost',
+        name,
+        content,
+        quality,
+        100 * cost,
+        baseline,
+        extra={
+            'model': name,
+            'content': content,
+            'quality': quality,
+            'features': features,
+            'cost': cost
+        })
+    return name
+
+
+def get_model_path(name, model_dir=None, wdn=False, half=False):
+    """Path of the weights of a model of the zoo, downloaded on first use.
+
+    Weights packed by ``scripts/pack_weights.py`` are preferred when they are in ``model_dir``: ``{stem}-fp16``
+    for half precision, then ``{stem}``, with a ``.safetensors`` extension.
+
+    Args:
+        name (str): Model name.
+        model_dir (str): Folder of the weights. None uses the ``weights`` folder of the repository. Default: None.
+        wdn (bool): Path of the weak-denoise weights, used to control the denoise strength. Default: False.
+        half (bool): Prefer the weights packed in half precision. Default: False.
+
+    Returns:
+        str: Path of the weights.
+    """
+    url = MODEL_ZOO[name]['wdn_url' if wdn else 'url']
+    model_dir = model_dir or os.path.join(ROOT_DIR, 'weights')
+    stem = os.path.splitext(os.path.basename(url))[0]
+    for packed_name in ([f'{stem}-fp16'] if half else []) + [stem]:
+        packed_path = os.path.join(model_dir, f'{packed_name}.safetensors')
+        if os.path.isfile(packed_path):
+            return packed_path
+    model_path = os.path.join(model_dir, os.path.basename(url))
+    if not os.path.isfile(model_path):
+        model_path = load_file_from_url(url=url, model_dir=model_dir, progress=True, file_name=None)
+    return model_path
+
+
+def get_wdn_path(name, model_path):
+    """Path of the weak-denoise weights next to custom weights of a model of the zoo.
+
+    Like the zoo files, the weak-denoise file name replaces the model stem, e.g., ``realesr-general-x4v3`` with
+    ``realesr-general-wdn-x4v3``, in ``model_path``.
+
+    Raises:
+        ValueError: When the path of the weak-denoise weights cannot be derived, or the file does not exist.
+    """
+    stem, wdn_stem = (os.path.splitext(os.path.basename(MODEL_ZOO[name][url]))[0] for url in ['url', 'wdn_url'])
+    wdn_path = model_path.replace(stem, wdn_stem)
+    if wdn_path == model_path or not os.path.isfile(wdn_path):
+        raise ValueError(f'The denoise strength needs the weak-denoise weights of {model_path}, expected at '
+                         f'{wdn_path}. Use a denoise strength of 1 to use {model_path} only.')
+    return wdn_path
+
+
+def _parameter_bytes(upsampler):
+    """Memory of the model parameters of an upsampler, including the resident dni parameter sets and blends."""
+    tensors = list(upsampler.model.state_dict().values())
+    for params in (upsampler.dni_params or []) + list(upsampler._dni_blends.values()):
+        tensors.extend(params.values())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class ModelPool():
+    """A pool of warm RealESRGANer instances, so that switching between models only loads them once.
+
+    Upsamplers are keyed by (model, precision, device, compile_mode), and the least recently used ones are evicted
+    when the memory of their parameters exceeds ``max_memory``. The most recent one is always kept.
+
+    Args:
+        max_memory (int): Memory cap in bytes of the parameters of the warm upsamplers. None for no cap.
+            Default: DEFAULT_POOL_MEMORY.
+    """
+
+    def __init__(self, max_memory=DEFAULT_POOL_MEMORY):
+        self.max_memory = max_memory
+        self.upsamplers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def memory(self):
+        """Parameter memory of the warm upsamplers, in bytes."""
+        return sum(_parameter_bytes(upsampler) for upsampler in self.upsamplers.values())
+
+    def get(self,
+            name,
+            half=False,
+            device=None,
+            gpu_id=None,
+            denoise_strength=1,
+            model_path=None,
+            model_dir=None,
+            tile=0,
+            tile_pad=10,
+            tile_memory_budget=None,
+            precision=None,
+            outscale=None,
+            **kwargs):
+        """Get the upsampler of a model, loading it on first use.
+
+        Args:
+            name (str): Model name, see ``MODEL_ZOO``.
+            half (bool): Whether to use half precision during inference. Default: False.
+            device (torch.device): Device of the model. None uses :func:`realesrgan.utils.get_device` with
+                ``gpu_id``. Default: None.
+            gpu_id (int): GPU to use when ``device`` is None. Default: None.
+            denoise_strength (float): Denoise strength of the models with weak-denoise weights. 1 uses the model
+                weights only, and the weak-denoise weights are only loaded for other strengths. It is changed in
+                place on warm upsamplers. Default: 1.
+            model_path (str): Path of custom weights for the architecture of ``name``. None uses the zoo weights.
+                With a denoise strength, the weak-denoise weights are next to them, see :func:`get_wdn_path`.
+                Default: None.
+            model_dir (str): Folder of the zoo weights, see :func:`get_model_path`. Default: None.
+            precision (str): Inference precision, see RealESRGANer. None uses ``half``. Default: None.
+            outscale (float): Output scale the upsampler is used at. The model of the same family at this native
+                scale is used instead of ``name`` when there is one, see :func:`get_native_model`. It is ignored
+                with a custom ``model_path``. Default: None.
+            tile, tile_pad, tile_memory_budget, kwargs: The other options of RealESRGANer. They are applied to warm
+                upsamplers with :meth:`RealESRGANer.set_options`, except ``compile_mode``, which is part of the key
+                of the pool.
+
+        Returns:
+            RealESRGANer: The upsampler.
+        """
+        if name not in MODEL_ZOO:
+            raise ValueError(f'Unknown model {name}. Options: {" | ".join(MODEL_ZOO)}')
+        native = name if model_path is not None else get_native_model(name, outscale)
+        if native != name:
+            logger.info('native model %s for the x%g output of %s', native, outscale, name)
+            name = native
+        device = get_device(device, gpu_id)
+        precision = resolve_precision(precision or ('fp16' if half else 'fp32'), device)
+        half = precision == 'fp16'
+        # the compiled network is set up when the upsampler is built
+        key = (model_path or name, precision, str(device), kwargs.get('compile_mode'))
+
+        if key in self.upsamplers:
+            self.hits += 1
+            self.upsamplers.move_to_end(key)
+            upsampler = self.upsamplers[key]
+            if upsampler.dni_params is not None:
+                upsampler.set_dni_weight([denoise_strength, 1 - denoise_strength])
+            elif denoise_strength != 1 and 'wdn_url' in MODEL_ZOO[name]:
+                # the weak-denoise weights are loaded on the first denoise strength which needs them
+                wdn_path = get_wdn_path(name, model_path) if model_path else get_model_path(
+                    name, model_dir, wdn=True, half=half)
+                upsampler.load_dni([upsampler.model_path, wdn_path], [denoise_strength, 1 - denoise_strength])
+            kwargs.pop('compile_mode', None)
+            upsampler.set_options(tile=tile, tile_pad=tile_pad, tile_memory_budget=tile_memory_budget, **kwargs)
+            return upsampler
+
+        self.misses += 1
+        model, netscale = build_model(name)
+        dni_weight = None
+        if 'wdn_url' in MODEL_ZOO[name] and denoise_strength != 1:
+            # use dni to control the denoise strength, it can then be changed without reloading the model
+            if model_path is None:
+                model_path = [
+                    get_model_path(name, model_dir, half=half),
+                    get_model_path(name, model_dir, wdn=True, half=half)
+                ]
+            else:
+                model_path = [model_path, get_wdn_path(name, model_path)]
+            dni_weight = [denoise_strength, 1 - denoise_strength]
+        elif model_path is None:
+            model_path = get_model_path(name, model_dir, half=half)
+        upsampler = RealESRGANer(
+            scale=netscale,
+            model_path=model_path,
+            dni_weight=dni_weight,
+            model=model,
+            tile=tile,
+            tile_pad=tile_pad,
+            tile_memory_budget=tile_memory_budget,
+            half=half,
+            device=device,
+            precision=precision,
+            **kwargs)
+        self.upsamplers[key] = upsampler
+        self.evict()
+        return upsampler
+
+    def evict(self):
+        """Evict the least recently used upsamplers until the pool fits in ``max_memory``."""
+        evicted = False
+        while self.max_memory is not None and len(self.upsamplers) > 1 and self.memory > self.max_memory:
+            self.upsamplers.popitem(last=False)
+            evicted = True
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def clear(self):
+        self.upsamplers.clear()
+
+
+# the process-wide pool
+_model_pool = ModelPool()
+
+
+def get_upsampler(name, **kwargs):
+    """Get the upsampler of a model from the process-wide :class:`ModelPool`. See :meth:`ModelPool.get`."""
+    return _model_pool.get(name, **kwargs)
@@ -0,0 +1,71 @@
+import copy
+import numpy as np
+import torch
+from torch import nn
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompactInference
+
+__all__ = ['OnnxRuntimeModel', 'export_onnx', 'load_onnx_session']
+
+# dynamic axes of the exported networks
+_DYNAMIC_AXES = {0: 'batch', 2: 'height', 3: 'width'}
+
+
+@torch.no_grad()
+def export_onnx(model, save_path, opset_version=11):
+    """Export a network to ONNX, with a dynamic batch size, height and width.
+
+    Args:
+        model (nn.Module): RRDBNet or SRVGGNetCompact, with its weights.
+        save_path (str): Path of the ONNX file.
+        opset_version (int): ONNX opset version. Default: 11.
+    """
+    model = model.to_compact() if isinstance(model, SRVGGNetCompactInference) else copy.deepcopy(model)
+    model = model.float().cpu().eval()
+    # the height and the width are multiples of 4 for the pixel-unshuffle of x1 / x2 RRDBNet
+    example = torch.rand(1, 3, 64, 64)
+    torch.onnx.export(
+        model,
+        example,
+        save_path,
+        opset_version=opset_version,
+        export_params=True,
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={
+            'input': _DYNAMIC_AXES,
+            'output': _DYNAMIC_AXES
+        })
+
+
+def load_onnx_session(model_path, providers=None):
+    """Create an ONNX Runtime session. It requires the onnxruntime package.
+
+    Args:
+        model_path (str): Path of the ONNX file.
+        providers (list[str]): Execution providers. None uses the CPU. Default: None.
+    """
+    import onnxruntime
+    return onnxruntime.InferenceSession(model_path, providers=providers or ['CPUExecutionProvider'])
+
+
+class OnnxRuntimeModel(nn.Module):
+    """Run an ONNX Runtime session as a network of RealESRGANer.
+
+    The inputs are converted to the input dtype of the session, and the outputs are converted back to the dtype and
+    the device of the inputs.
+
+    Args:
+        session (onnxruntime.InferenceSession): Session of an exported network, see :func:`export_onnx`.
+    """
+
+    def __init__(self, session):
+        super(OnnxRuntimeModel, self).__init__()
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.input_dtype = np.float16 if session.get_inputs()[0].type == 'tensor(float16)' else np.float32
+
+    def forward(self, x):
+        inputs = x.detach().cpu().numpy().astype(self.input_dtype, copy=False)
+        output = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(output).to(device=x.device, dtype=x.dtype)
@@ -0,0 +1,91 @@
+import copy
+import cv2
+import glob
+import numpy as np
+import operator
+import os
+import torch
+from basicsr.archs import rrdbnet_arch
+from torch.nn import functional as F
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompactInference
+
+__all__ = ['load_calibration_patches', 'quantize_model']
+
+
+def load_calibration_patches(folder, patch_size=128, num_patches=32):
+    """Load random patches of the images of a folder, to calibrate the quantized activation ranges.
+
+    Args:
+        folder (str): Folder of the calibration images.
+        patch_size (int): Size of the square patches, rounded down to a multiple of 4. Images smaller than it are
+            used whole. Default: 128.
+        num_patches (int): Number of patches, spread over the images. Default: 32.
+
+    Returns:
+        list[Tensor]: (1, 3, H, W) RGB patches in [0, 1].
+    """
+    paths = sorted(glob.glob(os.path.join(folder, '*')))
+    images = []
+    for path in paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            images.append(img)
+    if not images:
+        raise ValueError(f'No image in {folder}.')
+
+    patch_size = patch_size // 4 * 4
+    rng = np.random.RandomState(0)
+    patches = []
+    for i in range(num_patches):
+        img = images[i % len(images)]
+        # multiples of 4, for the pixel-unshuffle of x1 / x2 RRDBNet
+        h, w = img.shape[0] // 4 * 4, img.shape[1] // 4 * 4
+        top, left = rng.randint(0, max(h - patch_size, 0) + 1), rng.randint(0, max(w - patch_size, 0) + 1)
+        patch = img[top:min(top + patch_size, h), left:min(left + patch_size, w), ::-1].astype(np.float32) / 255.
+        patches.append(torch.from_numpy(np.ascontiguousarray(patch.transpose(2, 0, 1))).unsqueeze(0))
+    return patches
+
+
+@torch.no_grad()
+def quantize_model(model, calibration_patches, backend='x86'):
+    """Post-training static INT8 quantization of a network, with FX graph mode.
+
+    The convolutions and their PReLU / LeakyReLU activations run in INT8. The pixel-shuffle and pixel-unshuffle,
+    the nearest upsamplings and the concatenations work on the quantized tensors directly. The final residual
+    addition of SRVGGNetCompact (the upsampled input image) stays in float, to keep the output precision.
+
+    Args:
+        model (nn.Module): RRDBNet or SRVGGNetCompact, with its fp32 weights.
+        calibration_patches (list[Tensor]): (1, 3, H, W) RGB inputs in [0, 1], see :func:`load_calibration_patches`.
+        backend (str): Quantized engine. Options: x86 | fbgemm | qnnpack. The process-wide
+            ``torch.backends.quantized.engine`` is only set to it during the quantization, and restored afterwards:
+            the network is then run with the engine of the process, which should match it (x86 by default on x86
+            cpus). Default: 'x86'.
+
+    Returns:
+        torch.jit.ScriptModule: The frozen quantized network, to be saved with ``torch.jit.save`` and loaded by
+            RealESRGANer from a ``.pt`` file. It runs on cpu only.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    model = model.to_compact() if isinstance(model, SRVGGNetCompactInference) else copy.deepcopy(model)
+    model = model.float().cpu().eval()
+    qconfig_mapping = get_default_qconfig_mapping(backend).set_object_type(operator.iadd, None)
+    example = calibration_patches[0]
+    # the quantized engine is process-wide, it is only set while the network is calibrated and converted
+    engine = torch.backends.quantized.engine
+    torch.backends.quantized.engine = backend
+    # the pixel-unshuffle of basicsr asserts on the input shape, which FX cannot trace; the one of torch is the same op
+    rrdbnet_unshuffle = rrdbnet_arch.pixel_unshuffle
+    rrdbnet_arch.pixel_unshuffle = lambda x, scale: F.pixel_unshuffle(x, scale)
+    try:
+        model = prepare_fx(model, qconfig_mapping, (example, ))
+        for patch in calibration_patches:
+            model(patch)
+        model = convert_fx(model)
+        return torch.jit.freeze(torch.jit.trace(model, example))
+    finally:
+        rrdbnet_arch.pixel_unshuffle = rrdbnet_unshuffle
+        torch.backends.quantized.engine = engine
@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+import torch
+
+__all__ = ['CONTENT_THRESHOLDS', 'TileRouter', 'classify_content', 'gradient_energy', 'image_features']
+
+# thresholds of classify_content, calibrated on the images of the inputs folder
+CONTENT_THRESHOLDS = {
+    # line art: at most this many colours, and at least this fraction of flat pixels, and at most this noise
+    'line_art_colours': 48,
+    'line_art_flat': 0.5,
+    'line_art_noise': 2.5,
+    # low detail: less than this fraction of strong edges, and at most this noise
+    'low_detail_edges': 0.12,
+    'low_detail_noise': 6,
+}
+
+
+def gradient_energy(img):
+    """Mean absolute gradient of images, a cheap complexity statistic: about 0 for flat areas, and above 0.1 for
+    detailed textures.
+
+    Args:
+        img (Tensor): Images of shape (N, C, H, W), in [0, 1].
+
+    Returns:
+        Tensor: Gradient energy of each image, of shape (N, ).
+    """
+    img = img.float().mean(dim=1)
+    grad_y = (img[:, 1:, :] - img[:, :-1, :]).abs().mean(dim=(1, 2)) if img.shape[1] > 1 else img.new_zeros(len(img))
+    grad_x = (img[:, :, 1:] - img[:, :, :-1]).abs().mean(dim=(1, 2)) if img.shape[2] > 1 else img.new_zeros(len(img))
+    return grad_x + grad_y
+
+
+class TileRouter():
+    """Route the tiles of :meth:`RealESRGANer.tile_process` to networks of different costs, by complexity.
+
+    The :func:`gradient_energy` of the padded input of each tile decides its tier: flat tiles (sky, walls, bokeh)
+    are upsampled with bicubic interpolation, medium tiles with the ``compact`` upsampler, and only the detailed
+    tiles with the heavy network of the upsampler. The outputs of neighbouring tiles of different tiers are blended
+    with a linear ramp of ``feather`` input pixels across their boundary, which hides the seams.
+
+    Args:
+        compact (RealESRGANer): Upsampler of a compact network of the same scale, e.g., realesr-general-x4v3. None
+            sends the medium tiles to the heavy network. Default: None.
+        thresholds (tuple[float]): (flat, medium) gradient energy thresholds. Tiles below ``flat`` are flat, and
+            tiles below ``medium`` are medium. Default: (0.015, 0.05).
+        flat_tier (str): Tier of the flat tiles. Options: bicubic | compact. Default: 'bicubic'.
+        feather (int): Width in input pixels of the blending ramp on each side of a tier boundary. It is capped by
+            the tile pad. Default: 4.
+    """
+
+    tiers = ('bicubic', 'compact', 'heavy')
+
+    def __init__(self, compact=None, thresholds=(0.015, 0.05), flat_tier='bicubic', feather=4):
+        if flat_tier not in ('bicubic', 'compact'):
+            raise ValueError(f'Unknown flat tier: {flat_tier}, options: bicubic | compact.')
+        self.compact = compact
+        self.thresholds = tuple(thresholds)
+        self.flat_tier = flat_tier
+        self.feather = feather
+
+    def cache_params(self):
+        """The options of the router which affect the output, see :meth:`RealESRGANer.cache_params`.
+
+        The compact upsampler is identified by its network and weights. None when its weights cannot be identified.
+        """
+        compact = None
+        if self.compact is not None:
+            weights = self.compact.weights_hash()
+            if weights is None:
+                return None
+            compact = {
+                'arch': type(self.compact.model).__name__,
+                'weights': weights,
+                'dni_weight': self.compact.dni_weight,
+                'precision': self.compact.precision,
+            }
+        return {
+            'compact': compact,
+            'thresholds': self.thresholds,
+            'flat_tier': self.flat_tier,
+            'feather': self.feather,
+        }
+
+    def route(self, complexity):
+        """Tier of a tile of the given gradient energy: bicubic | compact | heavy."""
+        flat, medium = self.thresholds
+        if complexity < flat:
+            tier = self.flat_tier
+        elif complexity < medium:
+            tier = 'compact'
+        else:
+            tier = 'heavy'
+        if tier == 'compact' and self.compact is None:
+            tier = 'heavy'
+        return tier
+
+    @torch.no_grad()
+    def forward(self, upsampler, input_tiles, tier):
+        """Upscale a batch of input tiles with the network of a tier. The output is in the input dtype."""
+        if tier == 'bicubic':
+            _, _, h, w = input_tiles.shape
+            output_size = (h * upsampler.scale, w * upsampler.scale)
+            return torch.nn.functional.interpolate(
+                input_tiles.float(), size=output_size, mode='bicubic', align_corners=False).to(input_tiles.dtype)
+        if tier == 'compact':
+            return self.compact._forward(self.compact._cast(input_tiles)).to(input_tiles)
+        return upsampler._forward_resilient(input_tiles)
+
+
+def image_features(img, thumbnail_size=256):
+    """Cheap content statistics of an image, on a thumbnail, see :func:`classify_content`.
+
+    Args:
+        img (ndarray): Image of shape (H, W), (H, W, 3) or (H, W, 4) in BGR(A) order, uint8 or uint16.
+        thumbnail_size (int): Longest side of the thumbnail. Default: 256.
+
+    Returns:
+        dict: ``edge_density``, the fraction of strong edges, ``flat``, the fraction of flat pixels (both after a
+            median filter, which removes the compression noise), ``colours``, the number of 15-bit colours covering
+            90% of the pixels, and ``noise``, the noise standard deviation (in 8-bit levels) of Immerkaer's method.
+    """
+    if img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    img = img[:, :, :3]
+    h, w = img.shape[0:2]
+    ratio = thumbnail_size / max(h, w)
+    if ratio < 1:
+        img = cv2.resize(img, (max(1, round(w * ratio)), max(1, round(h * ratio))), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    # noise, from the Laplacian difference of the gray image
+    laplacian = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    noise = np.sqrt(np.pi / 2) * np.abs(cv2.filter2D(gray, -1, laplacian)[1:-1, 1:-1]).mean() / 6
+
+    smooth = cv2.medianBlur(img, 3)
+    smooth_gray = cv2.cvtColor(smooth, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255
+    magnitude = np.sqrt(cv2.Sobel(smooth_gray, cv2.CV_32F, 1, 0)**2 + cv2.Sobel(smooth_gray, cv2.CV_32F, 0, 1)**2) / 4
+    quantized = (smooth >> 3).astype(np.int32)
+    codes = (quantized[..., 0] << 10) | (quantized[..., 1] << 5) | quantized[..., 2]
+    counts = np.sort(np.bincount(codes.ravel()))[::-1]
+    colours = int(np.searchsorted(np.cumsum(counts), 0.9 * codes.size)) + 1
+    return {
+        'edge_density': float((magnitude >= 0.1).mean()),
+        'flat': float((magnitude < 0.01).mean()),
+        'colours': colours,
+        'noise': float(noise),
+    }
+
+
+def classify_content(features, thresholds=None):
+    """Content class of an image from its :func:`image_features`.
+
+    Args:
+        features (dict): Features of :func:`image_features`.
+        thresholds (dict): Thresholds overriding ``CONTENT_THRESHOLDS``. Default: None.
+
+    Returns:
+        str: line art (flat colours and clean edges, e.g., drawings, cartoons, UI) | low detail | detailed.
+    """
+    thresholds = {**CONTENT_THRESHOLDS, **(thresholds or {})}
+    if (features['colours'] <= thresholds['line_art_colours'] and features['flat'] >= thresholds['line_art_flat']
+            and features['noise'] <= thresholds['line_art_noise']):
+        return 'line art'
+    if (features['edge_density'] < thresholds['low_detail_edges']
+            and features['noise'] <= thresholds['low_detail_noise']):
+        return 'low detail'
+    return 'detailed'
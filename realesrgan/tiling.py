@@ -0,0 +1,218 @@
+import math
+
+__all__ = ['Tile', 'TilePlan', 'plan_tiles', 'receptive_field_radius']
+
+
+class Tile():
+    """A tile of a :class:`TilePlan`.
+
+    Rectangles are (start_x, end_x, start_y, end_y) tuples, end excluded.
+
+    Args:
+        index (int): Index of the tile in the plan, starting from 0.
+        input (tuple): Area of the input image written back by this tile. The ``input`` areas of a plan partition the
+            image.
+        input_pad (tuple): Area of the input image fed to the network, i.e., ``input`` with its padding.
+        scale (int): Upsampling scale factor of the network.
+    """
+
+    def __init__(self, index, input, input_pad, scale):
+        self.index = index
+        self.input = input
+        self.input_pad = input_pad
+        self.scale = scale
+
+    @property
+    def shape(self):
+        """(height, width) of the padded input tile."""
+        start_x, end_x, start_y, end_y = self.input_pad
+        return end_y - start_y, end_x - start_x
+
+    @property
+    def output(self):
+        """Area of the output image covered by this tile."""
+        return tuple(v * self.scale for v in self.input)
+
+    @property
+    def output_crop(self):
+        """Area of the network output (of ``input_pad``) to be put into ``output``."""
+        start_x, end_x, start_y, end_y = self.input
+        start_x_pad, _, start_y_pad, _ = self.input_pad
+        return ((start_x - start_x_pad) * self.scale, (end_x - start_x_pad) * self.scale,
+                (start_y - start_y_pad) * self.scale, (end_y - start_y_pad) * self.scale)
+
+    def __repr__(self):
+        return f'Tile(index={self.index}, input={self.input}, input_pad={self.input_pad})'
+
+
+class TilePlan():
+    """The tile geometry of an image.
+
+    Args:
+        height (int): Height of the input image.
+        width (int): Width of the input image.
+        tiles (list[Tile]): Tiles in row-major order.
+        tiles_x (int): Number of tile columns.
+        tiles_y (int): Number of tile rows.
+    """
+
+    def __init__(self, height, width, tiles, tiles_x, tiles_y):
+        self.height = height
+        self.width = width
+        self.tiles = tiles
+        self.tiles_x = tiles_x
+        self.tiles_y = tiles_y
+
+    @property
+    def padded_area(self):
+        """Number of input pixels fed to the network, over all tiles."""
+        return sum(h * w for h, w in (tile.shape for tile in self.tiles))
+
+    @property
+    def padding_waste(self):
+        """Percentage of the processed pixels that are padding (or overlap) and discarded on stitching."""
+        padded_area = self.padded_area
+        return 100 * (padded_area - self.height * self.width) / padded_area
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def __repr__(self):
+        return (f'TilePlan({self.tiles_x}x{self.tiles_y} tiles for {self.width}x{self.height}, '
+                f'padding waste {self.padding_waste:.1f}%)')
+
+
+def _ceil_to(value, multiple):
+    return int(math.ceil(value / multiple)) * multiple
+
+
+def _split(length, num_tiles, tile_length):
+    """Split [0, length) into ``num_tiles`` tiles of ``tile_length``.
+
+    Returns the areas written back by the tiles, which partition [0, length), and the areas processed by the
+    tiles. All the processed areas have the same length: the last one is shifted back to fit in the image and
+    overlaps its neighbour instead of being a thin sliver.
+    """
+    bounds = [min(i * tile_length, length) for i in range(num_tiles + 1)]
+    written = [(bounds[i], bounds[i + 1]) for i in range(num_tiles)]
+    processed = [(min(start, max(length - tile_length, 0)), min(start, max(length - tile_length, 0)) + tile_length)
+                 for start, _ in written]
+    processed[-1] = (processed[-1][0], min(processed[-1][1], length))
+    return written, processed
+
+
+def _balanced_grid(height, width, tile_size, tile_pad, align, max_aspect=4):
+    """Find the tile grid with the least tiles (then the least padded area) whose padded tiles are not larger
+    than a padded ``tile_size`` x ``tile_size`` tile. Tiles more elongated than ``max_aspect`` (or than the image
+    itself) are only used when there is no other choice."""
+    max_area = (tile_size + 2 * tile_pad)**2
+    best = None
+    for tiles_x in range(1, math.ceil(width / align) + 1):
+        if best is not None and not best[0][0] and tiles_x >= best[0][1]:
+            break  # no grid with more columns can have less tiles
+        tile_width = _ceil_to(math.ceil(width / tiles_x), align)
+        if tiles_x > 1 and tile_width * (tiles_x - 1) >= width:
+            continue  # the same tile width with fewer tiles
+        pad_width = min(tile_width + 2 * tile_pad, width)
+        max_height = max_area // pad_width - 2 * tile_pad
+        if pad_width * height <= max_area:
+            tiles_y = 1
+        elif max_height >= align:
+            tiles_y = math.ceil(height / (max_height // align * align))
+        else:
+            continue
+        tile_height = _ceil_to(math.ceil(height / tiles_y), align)
+        tiles_y = math.ceil(height / tile_height)
+        pad_height = min(tile_height + 2 * tile_pad, height)
+        tile_aspect = max(tile_width, tile_height) / min(tile_width, tile_height)
+        elongated = tile_aspect > max(max_aspect, max(width, height) / min(width, height))
+        cost = (elongated, tiles_x * tiles_y, tiles_x * tiles_y * pad_width * pad_height)
+        if best is None or cost < best[0]:
+            best = (cost, tiles_x, tiles_y, tile_width, tile_height)
+    return best[1:]
+
+
+def _extend(start, end, length, size):
+    """Extend [start, end) to ``size`` inside [0, length), towards the end first."""
+    size = min(max(size, end - start), length)
+    start = max(min(start, length - size), 0)
+    return start, start + size
+
+
+def plan_tiles(height, width, tile_size, tile_pad, scale, balanced=True, align=1, tile_shape=None):
+    """Plan the tiles of an image.
+
+    The legacy plan cuts the image with a fixed ``tile_size`` stride, which often leaves a thin last row or
+    column. The balanced plan uses the minimum number of tiles whose padded area is not larger than a padded
+    ``tile_size`` x ``tile_size`` tile, allowing non-square tiles, and spreads the image evenly over them.
+
+    Args:
+        height (int): Height of the input image.
+        width (int): Width of the input image.
+        tile_size (int): Tile size.
+        tile_pad (int): The pad size for each tile.
+        scale (int): Upsampling scale factor of the network.
+        balanced (bool): Use the balanced plan instead of the legacy one. Default: True.
+        align (int): Tile offsets and padding are multiples of it in the balanced plan, e.g., for networks with
+            pixel-unshuffle. Default: 1.
+        tile_shape (tuple): Extend the padded area of every tile to this (height, width), with more context from
+            the image (clipped to the image size), so that all the tiles have the same shape. Default: None.
+
+    Returns:
+        TilePlan: The tile plan.
+    """
+    if balanced:
+        tile_pad = _ceil_to(tile_pad, align)
+        tiles_x, tiles_y, tile_width, tile_height = _balanced_grid(height, width, tile_size, tile_pad, align)
+    else:
+        tiles_x, tiles_y = math.ceil(width / tile_size), math.ceil(height / tile_size)
+        tile_width = tile_height = tile_size
+    if balanced:
+        columns = _split(width, tiles_x, tile_width)
+        rows = _split(height, tiles_y, tile_height)
+    else:
+        columns = [[(min(i * tile_size, width), min((i + 1) * tile_size, width)) for i in range(tiles_x)]] * 2
+        rows = [[(min(i * tile_size, height), min((i + 1) * tile_size, height)) for i in range(tiles_y)]] * 2
+
+    tiles = []
+    for (start_y, end_y), (start_y_proc, end_y_proc) in zip(*rows):
+        for (start_x, end_x), (start_x_proc, end_x_proc) in zip(*columns):
+            pad_x = (max(start_x_proc - tile_pad, 0), min(end_x_proc + tile_pad, width))
+            pad_y = (max(start_y_proc - tile_pad, 0), min(end_y_proc + tile_pad, height))
+            input_pad = pad_x + pad_y
+            if tile_shape is not None:
+                input_pad = (
+                    _extend(input_pad[0], input_pad[1], width, tile_shape[1]) +
+                    _extend(input_pad[2], input_pad[3], height, tile_shape[0]))
+            tiles.append(Tile(len(tiles), (start_x, end_x, start_y, end_y), input_pad, scale))
+    return TilePlan(height, width, tiles, tiles_x, tiles_y)
+
+
+def receptive_field_radius(model):
+    """Receptive field radius of a network, in input pixels.
+
+    An output pixel only depends on the input pixels within this distance, so tiles padded by it (with offsets
+    aligned to the pixel-unshuffle factor of the network) give the same output as the whole image.
+
+    Args:
+        model (nn.Module): RRDBNet or SRVGGNetCompact.
+
+    Returns:
+        int: The radius.
+    """
+    name = type(model).__name__
+    if name in ('SRVGGNetCompact', 'SRVGGNetCompactInference'):
+        # the first conv, num_conv body convs and the last conv, all 3x3. The nearest upsampled residual and the
+        # pixel-shuffle do not mix pixels
+        return model.num_conv + 2
+    elif name == 'RRDBNet':
+        unshuffle = {4: 1, 2: 2, 1: 4}[model.scale]
+        # conv_first, 3 residual dense blocks of 5 convs for each RRDB, and conv_body
+        lr_radius = 2 + 15 * len(model.body)
+        # conv_up1 after the first nearest x2, then conv_up2, conv_hr and conv_last after the second one, reach
+        # 2 more pixels of the trunk features
+        return (lr_radius + 2) * unshuffle
+    raise ValueError(f'Unknown receptive field for {name}.')
@@ -1,31 +1,129 @@
 import cv2
+import logging
 import math
 import numpy as np
 import os
 import queue
 import threading
+import time
 import torch
 from basicsr.utils.download_util import load_file_from_url
+from collections import OrderedDict
 from torch.nn import functional as F
 
+from realesrgan.cache import hash_file, hash_params
+from realesrgan.onnx_backend import OnnxRuntimeModel, load_onnx_session
+from realesrgan.routing import gradient_energy
+from realesrgan.tiling import plan_tiles, receptive_field_radius
+
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# optional structured logs (per tile progress and stage timings), silent unless the application configures logging
+logger = logging.getLogger(__name__)
+
+# default memory budget for tile='auto' on devices whose free memory cannot be queried
+DEFAULT_TILE_MEMORY_BUDGET = 2 * 1024**3
+
+
+def estimate_activation_bytes(model, dtype=torch.float32):
+    """Estimate the peak activation memory of a forward pass with an analytic model.
+
+    Only the largest set of feature maps alive at the same time is counted, with a margin for the allocator and
+    convolution workspaces.
+
+    Args:
+        model (nn.Module): RRDBNet or SRVGGNetCompact.
+        dtype (torch.dtype): Data type of the activations. Default: torch.float32.
+
+    Returns:
+        float | None: Bytes per input pixel, or None for an unknown architecture.
+    """
+    element_size = torch.finfo(dtype).bits // 8
+    name = type(model).__name__
+    if name in ('SRVGGNetCompact', 'SRVGGNetCompactInference'):
+        num_feat, num_out = model.num_feat, model.num_out_ch * model.upscale**2
+        # body: conv input, conv output and the (not in-place) PReLU output
+        # tail: last conv output, pixel-shuffled output and the upsampled base image
+        channels = max(3 * num_feat, num_feat + 3 * num_out)
+    elif name == 'RRDBNet':
+        num_feat = model.conv_first.out_channels
+        num_grow_ch = model.body[0].rdb1.conv1.out_channels
+        unshuffle = {4: 1, 2: 2, 1: 4}[model.scale]
+        # trunk: trunk input, RRDB input, RDB input, four growth maps and the largest concatenation
+        lr_channels = (5 * num_feat + 8 * num_grow_ch) / unshuffle**2
+        # tail: two full-resolution feature maps of the conv_up2 / conv_hr layers
+        hr_channels = (2 * num_feat + model.conv_last.out_channels) * model.scale**2
+        channels = max(lr_channels, hr_channels)
+    else:
+        return None
+    return 1.25 * channels * element_size
+
 
 class RealESRGANer():
     """A helper class for upsampling images with RealESRGAN.
 
     Args:
         scale (int): Upsampling scale factor used in the networks. It is usually 2 or 4.
-        model_path (str): The path to the pretrained model. It can be urls (will first download it automatically).
-        model (nn.Module): The defined network. Default: None.
-        tile (int): As too large images result in the out of GPU memory issue, so this tile option will first crop
-            input images into tiles, and then process each of them. Finally, they will be merged into one image.
-            0 denotes for do not use tile. Default: 0.
-        tile_pad (int): The pad size for each tile, to remove border artifacts. Default: 10.
+        model_path (str): The path to the pretrained model. It can be urls (will first download it automatically),
+            or a packed ``.safetensors`` checkpoint, see :func:`pack_weights`. A TorchScript ``.pt`` network, e.g.,
+            an INT8 network of :func:`realesrgan.quantization.quantize_model` (on cpu), is used instead of ``model``.
+        model (nn.Module): The defined network. It can also be an ONNX Runtime session of an exported network (or
+            ``model_path`` an ONNX file), see :mod:`realesrgan.onnx_backend`. Default: None.
+        tile (int | str): As too large images result in the out of GPU memory issue, so this tile option will first
+            crop input images into tiles, and then process each of them. Finally, they will be merged into one image.
+            0 denotes for do not use tile. 'auto' derives the largest tile size that fits in ``tile_memory_budget``.
+            Default: 0.
+        tile_pad (int | str): The pad size for each tile, to remove border artifacts. 'exact' uses the receptive
+            field radius of the network, so the tiled output is the same as the untiled one. Default: 10.
         pre_pad (int): Pad the input images to avoid border artifacts. Default: 10.
-        half (float): Whether to use half precision during inference. Default: False.
+        half (float): Whether to use half precision during inference, see ``precision``. Default: False.
+        tile_batch_size (int): Number of tiles that share the same padded shape to be stacked and run through the
+            network in one forward pass. 1 processes the tiles one by one. Default: 1.
+        tile_memory_budget (int): Memory budget in bytes for the activations of one tile, used by ``tile='auto'``.
+            None uses 80% of the free memory on cuda and ``DEFAULT_TILE_MEMORY_BUDGET`` otherwise. Default: None.
+        balanced_tiles (bool): Spread the image evenly over the minimum number of (possibly non-square) tiles,
+            instead of cutting it with a fixed ``tile`` stride which often leaves thin slivers. Default: True.
+        batch_alpha (bool): For RGBA images upsampled with the network, run the image and its alpha channel through
+            the network as one batch of 2, instead of two sequential passes. It needs twice the activation memory
+            per forward pass. Default: False.
+        compile_mode (str): Run a compiled network in channels_last memory format. Options: 'trace' for a frozen
+            TorchScript graph | 'compile' for torch.compile. All the tiles then have the padded tile shape, and
+            the other inputs are padded to multiples of ``bucket_size``, so that the compiled graphs are reused
+            instead of being recompiled for each edge tile. The bucketing pad reflects the bottom and right borders,
+            like ``pre_pad``, so it only changes their output when ``pre_pad`` is smaller than the receptive field.
+            None runs the eager network. Default: None.
+        bucket_size (int): See ``compile_mode``. Default: 64.
+        precision (str): Inference precision. Options: fp32 | fp16 for a network and inputs in half precision |
+            bf16 for bfloat16 autocast, the weights staying in fp32 | auto for fp16 on cuda and bf16 on cpus with
+            native bfloat16 instructions. Precisions the device does not support fall back, see
+            :func:`resolve_precision`. None uses fp16 if ``half`` and fp32 otherwise. Default: None.
+        pipeline (bool): Overlap the slicing of the next tiles and the stitching of the finished ones with the
+            network, in a producer and a consumer thread. False runs the three stages serially. The time spent in
+            each stage is kept in ``tile_timings``. None pipelines on cuda only: on cpu, the network already uses
+            all the cores and its idle time is small. Default: None.
+        pipeline_depth (int): Number of tile batches buffered between the stages of the pipeline. Default: 2.
+        result_cache (ResultCache): On-disk cache of the :meth:`enhance` results, keyed by the input pixels and
+            every output-affecting option, see :meth:`cache_params`. None disables it. Default: None.
+        tile_dedup (bool): Checksum the padded input of each tile, and run the network once for the byte-identical
+            ones, e.g., the flat fills of documents, screenshots and anime backgrounds. The other tiles reuse its
+            output. The hits and misses are counted in ``tile_hits`` and ``tile_misses``. Default: False.
+        tile_cache_size (int): With ``tile_dedup``, number of tile outputs kept on the device across images, in a
+            least recently used cache. 0 only deduplicates the tiles of each image. Default: 0.
+        tile_router (TileRouter): Route the flat and medium tiles to cheaper upsamplers than the network, see
+            :class:`realesrgan.routing.TileRouter`. It only applies with tiles. The number of tiles of each tier of
+            the last image is kept in ``tile_routes``, None when it was not tiled or its result was cached. None runs
+            the network on every tile. Default: None.
     """
 
+    # activation bytes per input pixel, shared by all instances: {(arch, dtype, device): bytes}
+    _activation_bytes_cache = {}
+    # tile sizes which worked after an out of memory error, shared by all instances: {(arch, dtype, device): size}
+    _safe_tile_sizes = {}
+    # out of memory errors are retried with smaller tiles, down to this tile size
+    min_tile_size = 16
+    # number of memoized dni blends
+    dni_cache_size = 4
+
     def __init__(self,
                  scale,
                  model_path,
@@ -36,43 +134,208 @@ class RealESRGANer():
                  pre_pad=10,
                  half=False,
                  device=None,
-                 gpu_id=None):
+                 gpu_id=None,
+                 tile_batch_size=1,
+                 tile_memory_budget=None,
+                 balanced_tiles=True,
+                 batch_alpha=False,
+                 compile_mode=None,
+                 bucket_size=64,
+                 precision=None,
+                 pipeline=None,
+                 pipeline_depth=2,
+                 result_cache=None,
+                 tile_dedup=False,
+                 tile_cache_size=0,
+                 tile_router=None):
         self.scale = scale
+        self.model_path = model_path
         self.tile_size = tile
+        self.tile_batch_size = max(1, tile_batch_size)
+        self.balanced_tiles = balanced_tiles
         self.tile_pad = tile_pad
         self.pre_pad = pre_pad
         self.mod_scale = None
-        self.half = half
+        # scale of self.output
+        self.output_scale = scale
+        self.tile_memory_budget = tile_memory_budget
+        self.batch_alpha = batch_alpha
+        self.compile_mode = compile_mode
+        self.bucket_size = bucket_size
+        self.pipeline_depth = pipeline_depth
+        # seconds spent by the last tile_process in each stage: slice | forward | stitch, its wall time, and the
+        # time the network was idle
+        self.tile_timings = None
+        self.compiled_model = None
+        # a TileExecutor running the tiles on worker processes, see tile_process
+        self.executor = None
+        # input shapes (N, C, H, W) the compiled model has been run with
+        self.warm_shapes = set()
+        self.result_cache = result_cache
+        # hash of the loaded weights, see weights_hash
+        self._weights_hash = None
+        self.tile_dedup = tile_dedup
+        self.tile_cache_size = tile_cache_size
+        # (input, output) of the deduplicated tiles, by input checksum, from the least to the most recently used
+        self._tile_outputs = OrderedDict()
+        # padded inputs of the tiles run for the current image, by input checksum
+        self._tile_inputs = {}
+        self.tile_hits = 0
+        self.tile_misses = 0
+        self.tile_router = tile_router
+        # number of tiles of each tier of tile_router in the tile_process of the last enhance call
+        self.tile_routes = None
+        # with tile_router, the blending weights of self.output
+        self._output_weights = None
 
         # initialize model
-        if gpu_id:
-            self.device = torch.device(
-                f'cuda:{gpu_id}' if torch.cuda.is_available() else 'cpu') if device is None else device
+        self.device = get_device(device, gpu_id)
+        self.precision = resolve_precision(precision or ('fp16' if half else 'fp32'), self.device)
+        self.pipeline = torch.device(self.device).type == 'cuda' if pipeline is None else pipeline
+        self.half = self.precision == 'fp16'
+
+        self.dni_weight = None
+        self.dni_params = None
+        self._dni_blends = OrderedDict()
+        if isinstance(model_path, str) and model_path.endswith('.onnx'):
+            model = load_onnx_session(model_path)
+        if hasattr(model, 'get_inputs'):
+            # an ONNX Runtime session, which holds its weights
+            self.model = OnnxRuntimeModel(model)
+            self.compile_mode = None
+        elif isinstance(model_path, str) and model_path.endswith('.pt'):
+            # a TorchScript network, e.g., an INT8 network of quantize_model, which holds its weights and its dtype
+            self.model = torch.jit.load(model_path, map_location=self.device)
+            self.precision = 'fp32'
+            self.half = False
+            self.compile_mode = None
         else:
-            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu') if device is None else device
+            self._load_model(model, model_path, dni_weight)
+
+        self.set_tile(tile, tile_pad)
 
+    def _load_model(self, model, model_path, dni_weight):
+        """Load the weights of a PyTorch network, and move it to the device."""
         if isinstance(model_path, list):
-            # dni
+            # dni, both parameter sets stay on the device, so that set_dni_weight does not reload them
             assert len(model_path) == len(dni_weight), 'model_path and dni_weight should have the save length.'
-            loadnet = self.dni(model_path[0], model_path[1], dni_weight)
+            self.dni_params = [load_params(path, self.device, key='params') for path in model_path]
+            self.dni_weight = tuple(float(weight) for weight in dni_weight)
+            params = self._dni_blend(self.dni_weight)
         else:
             # if the model_path starts with https, it will first download models to the folder: weights
             if model_path.startswith('https://'):
                 model_path = load_file_from_url(
                     url=model_path, model_dir=os.path.join(ROOT_DIR, 'weights'), progress=True, file_name=None)
-            loadnet = torch.load(model_path, map_location=torch.device('cpu'))
-
-        # prefer to use params_ema
-        if 'params_ema' in loadnet:
-            keyname = 'params_ema'
-        else:
-            keyname = 'params'
-        model.load_state_dict(loadnet[keyname], strict=True)
+            params = load_params(model_path, self.device)
 
+        # the model is moved to its device and dtype first, so that parameters packed in this dtype are only copied
         model.eval()
         self.model = model.to(self.device)
         if self.half:
             self.model = self.model.half()
+        self.model.load_state_dict(params, strict=True)
+        del params
+        if self.compile_mode is not None:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+    def set_tile(self, tile, tile_pad=10):
+        """Set the tile size and the tile pad, see the ``tile`` and ``tile_pad`` arguments of the class.
+
+        'auto' and 'exact' are resolved for the loaded model, with ``self.tile_memory_budget``.
+        """
+        self.tile_size, self.tile_pad = tile, tile_pad
+        if self.tile_pad == 'exact':
+            self.tile_pad = receptive_field_radius(self.model)
+            # tile offsets are aligned to the pixel-unshuffle factor of the network
+            align = {2: 2, 1: 4}.get(self.scale, 1)
+            if isinstance(self.tile_size, int):
+                self.tile_size = int(math.ceil(self.tile_size / align)) * align
+        if self.tile_size == 'auto':
+            self.tile_size = self.auto_tile_size(self.tile_memory_budget)
+
+    def set_options(self, tile=None, tile_pad=None, **options):
+        """Set the options of the class on a loaded upsampler, normalized as in the constructor.
+
+        ``tile`` and ``tile_pad`` are resolved by :meth:`set_tile` after the other options, e.g.,
+        ``tile_memory_budget``. The options which load the network (``model_path``, ``model``, ``dni_weight``,
+        ``device``, ``precision`` and ``compile_mode``) need a new instance.
+        """
+        for option in ['model_path', 'model', 'dni_weight', 'half', 'device', 'gpu_id', 'precision', 'compile_mode']:
+            if option in options:
+                raise ValueError(f'{option} cannot be changed on a loaded upsampler')
+        for option, value in options.items():
+            if option == 'tile_batch_size':
+                value = max(1, value)
+            elif option == 'pipeline' and value is None:
+                value = torch.device(self.device).type == 'cuda'
+            elif not hasattr(self, option):
+                raise TypeError(f'Unknown option {option}')
+            setattr(self, option, value)
+        if tile is not None or tile_pad is not None:
+            self.set_tile(self.tile_size if tile is None else tile, self.tile_pad if tile_pad is None else tile_pad)
+
+    def activation_bytes(self):
+        """Peak activation memory of the loaded model, in bytes per input pixel.
+
+        The value is measured with a short probe on cuda, and estimated with :func:`estimate_activation_bytes`
+        on other devices. It is cached per (arch, dtype, device), so later instances skip the probe.
+        """
+        key = self._device_key()
+        dtype = key[1]
+        if key not in self._activation_bytes_cache:
+            if torch.device(self.device).type == 'cuda':
+                self._activation_bytes_cache[key] = self._probe_activation_bytes()
+            else:
+                self._activation_bytes_cache[key] = estimate_activation_bytes(self.model, dtype)
+        return self._activation_bytes_cache[key]
+
+    def _device_key(self):
+        """(arch, dtype, device) of the loaded model, the key of the memory related values shared by all instances."""
+        dtype = {'fp16': torch.float16, 'bf16': torch.bfloat16}.get(self.precision, torch.float32)
+        arch = f'{type(self.model).__name__}-{sum(p.numel() for p in self.model.parameters())}'
+        return arch, dtype, str(self.device)
+
+    def _probe_activation_bytes(self, probe_size=64):
+        torch.cuda.synchronize(self.device)
+        torch.cuda.reset_peak_memory_stats(self.device)
+        base = torch.cuda.memory_allocated(self.device)
+        # the input of the real path: in half precision for fp16, in fp32 under autocast for bf16
+        probe = self._cast(torch.rand(1, 3, probe_size, probe_size, device=self.device))
+        with torch.no_grad():
+            self._forward(probe)
+        peak = torch.cuda.max_memory_allocated(self.device) - base
+        del probe
+        torch.cuda.empty_cache()
+        return 1.25 * peak / probe_size**2
+
+    def auto_tile_size(self, memory_budget=None, multiple=8):
+        """Derive the largest tile size whose padded input fits in the memory budget.
+
+        The budget is shared by the ``tile_batch_size`` tiles of one forward pass.
+
+        Args:
+            memory_budget (int): Memory budget in bytes. None uses 80% of the free memory on cuda and
+                ``DEFAULT_TILE_MEMORY_BUDGET`` otherwise. Default: None.
+            multiple (int): The tile size is rounded down to a multiple of it. Default: 8.
+
+        Returns:
+            int: Tile size.
+        """
+        memory_budget = self._memory_budget(memory_budget)
+        activation_bytes = self.activation_bytes()
+        if activation_bytes is None:
+            raise ValueError(f'Cannot derive the tile size of {type(self.model).__name__}, please set tile manually.')
+        tile_size = int(math.sqrt(memory_budget / self.tile_batch_size / activation_bytes)) - 2 * self.tile_pad
+        return max(multiple, tile_size // multiple * multiple)
+
+    def _memory_budget(self, memory_budget=None):
+        """The memory budget, or 80% of the free memory on cuda and ``DEFAULT_TILE_MEMORY_BUDGET`` otherwise."""
+        if memory_budget is not None:
+            return memory_budget
+        if torch.device(self.device).type == 'cuda':
+            return 0.8 * torch.cuda.mem_get_info(self.device)[0]
+        return DEFAULT_TILE_MEMORY_BUDGET
 
     def dni(self, net_a, net_b, dni_weight, key='params', loc='cpu'):
         """Deep network interpolation.
@@ -85,11 +348,105 @@ class RealESRGANer():
             net_a[key][k] = dni_weight[0] * v_a + dni_weight[1] * net_b[key][k]
         return net_a
 
+    def _dni_blend(self, dni_weight):
+        """Blend the resident dni parameter sets, memoizing the ``dni_cache_size`` most recent blends."""
+        key = tuple(float(weight) for weight in dni_weight)
+        if key in self._dni_blends:
+            self._dni_blends.move_to_end(key)
+        else:
+            params_a, params_b = self.dni_params
+            # blend in float32, the parameter sets may be packed in half precision
+            self._dni_blends[key] = {
+                k: key[0] * v_a.float() + key[1] * params_b[k].float()
+                for k, v_a in params_a.items()
+            }
+            while len(self._dni_blends) > self.dni_cache_size:
+                self._dni_blends.popitem(last=False)
+        return self._dni_blends[key]
+
+    def load_dni(self, model_path, dni_weight):
+        """Load the two parameter sets of deep network interpolation into the loaded model, e.g., the model weights
+        and their weak-denoise version, after it was loaded with the first ones only.
+
+        Args:
+            model_path (list[str]): Paths of the two models.
+            dni_weight (list[float]): Weights of the two models.
+        """
+        self.dni_params = [load_params(path, self.device, key='params') for path in model_path]
+        self.dni_weight = None
+        self.model_path = model_path
+        self._weights_hash = None
+        self.set_dni_weight(dni_weight)
+
+    def set_dni_weight(self, dni_weight):
+        """Change the deep network interpolation weights of the loaded model, e.g., the denoise strength.
+
+        The new blend is copied into the parameters of the live model, without any disk I/O.
+
+        Args:
+            dni_weight (list[float]): Weights of the two models given as ``model_path``.
+        """
+        if self.dni_params is None:
+            raise ValueError('The model is not loaded with deep network interpolation.')
+        dni_weight = tuple(float(weight) for weight in dni_weight)
+        if dni_weight == self.dni_weight:
+            return
+        params = self._dni_blend(dni_weight)
+        with torch.no_grad():
+            for k, v in self.model.state_dict().items():
+                v.copy_(params[k])
+        self.dni_weight = dni_weight
+        # the cached tile outputs are those of the former weights
+        self._tile_outputs.clear()
+
+    def weights_hash(self):
+        """Hash of the loaded weights. The dni parameter sets are hashed, not their blend, see :meth:`cache_params`."""
+        if self._weights_hash is None:
+            if self.dni_params is not None:
+                self._weights_hash = hash_params(v for params in self.dni_params for v in params.values())
+            elif isinstance(self.model, (OnnxRuntimeModel, torch.jit.ScriptModule)):
+                self._weights_hash = hash_file(self.model_path) if isinstance(self.model_path, str) else None
+            else:
+                self._weights_hash = hash_params(self.model.state_dict().values())
+        return self._weights_hash
+
+    def cache_params(self, outscale=None, alpha_upsampler='realesrgan'):
+        """The options which affect the output of :meth:`enhance`, the key of its results in ``result_cache``.
+
+        None when the weights, or those of the compact upsampler of ``tile_router``, cannot be identified, e.g., an
+        ONNX Runtime session given without its file: the results are then not cached.
+        """
+        weights = self.weights_hash()
+        tile_router = None if self.tile_router is None else self.tile_router.cache_params()
+        if weights is None or (self.tile_router is not None and tile_router is None):
+            return None
+        return {
+            'arch': type(self.model).__name__,
+            'weights': weights,
+            'dni_weight': self.dni_weight,
+            'scale': self.scale,
+            'outscale': None if outscale is None or float(outscale) == float(self.scale) else float(outscale),
+            'alpha_upsampler': alpha_upsampler,
+            'precision': self.precision,
+            'tile': self.tile_size,
+            'tile_pad': self.tile_pad,
+            'pre_pad': self.pre_pad,
+            'balanced_tiles': self.balanced_tiles,
+            'batch_alpha': self.batch_alpha,
+            'compile_mode': self.compile_mode,
+            'bucket_size': self.bucket_size,
+            'tile_router': tile_router,
+        }
+
     def pre_process(self, img):
         """Pre-process, such as pre-pad and mod pad, so that the images can be divisible
+
+        Args:
+            img (ndarray | Tensor): RGB image of shape (H, W, 3) in [0, 1], or a (N, 3, H, W) tensor.
         """
-        img = torch.from_numpy(np.transpose(img, (2, 0, 1))).float()
-        self.img = img.unsqueeze(0).to(self.device)
+        if isinstance(img, np.ndarray):
+            img = torch.from_numpy(np.transpose(img, (2, 0, 1))).float().unsqueeze(0)
+        self.img = img.to(self.device)
         if self.half:
             self.img = self.img.half()
 
@@ -111,73 +468,461 @@ class RealESRGANer():
             self.img = F.pad(self.img, (0, self.mod_pad_w, 0, self.mod_pad_h), 'reflect')
 
     def process(self):
-        # model inference
-        self.output = self.model(self.img)
+        # model inference, falling back to tiles on out of memory errors
+        with torch.no_grad():
+            self.output = self._forward_resilient(self.img)
+        self.output_scale = self.scale
+
+    def _forward(self, img):
+        """Run the network, under bfloat16 autocast for the bf16 precision. The output is in the input dtype."""
+        if self.precision != 'bf16':
+            return self._forward_model(img)
+        with torch.autocast(torch.device(self.device).type, dtype=torch.bfloat16):
+            return self._forward_model(img).to(img.dtype)
+
+    def _forward_model(self, img):
+        """Run the network, or the compiled network on a bucketed input shape."""
+        if self.compile_mode is None:
+            return self.model(img)
+        _, _, h, w = img.shape
+        pad_h, pad_w = self._bucket(h) - h, self._bucket(w) - w
+        if pad_h or pad_w:
+            img = F.pad(img, (0, pad_w, 0, pad_h), 'reflect' if pad_h < h and pad_w < w else 'replicate')
+        img = img.contiguous(memory_format=torch.channels_last)
+        if self.compiled_model is None:
+            if self.compile_mode == 'trace':
+                self.compiled_model = torch.jit.freeze(torch.jit.trace(self.model, img))
+            else:
+                self.compiled_model = torch.compile(self.model, dynamic=False)
+        self.warm_shapes.add(tuple(img.shape))
+        return self.compiled_model(img)[:, :, :h * self.scale, :w * self.scale]
+
+    def _bucket(self, size):
+        """Bucketed size of an input dimension: the padded tile size, or the next multiple of ``bucket_size``."""
+        if self.tile_size > 0 and size == self.tile_size + 2 * self.tile_pad:
+            return size
+        return int(math.ceil(size / self.bucket_size)) * self.bucket_size
+
+    @torch.no_grad()
+    def warmup(self, shapes=None, batch_size=None):
+        """Compile the network and run it once for each input shape.
+
+        The compiled graphs are kept by the instance, e.g., in a :class:`realesrgan.model_zoo.ModelPool`, and reused
+        by all the later calls. It does nothing without ``compile_mode``.
+
+        Args:
+            shapes (list[tuple]): (height, width) of the network inputs, before bucketing. None uses the padded
+                tile shape, or a ``bucket_size`` square without tiles. Default: None.
+            batch_size (int): Batch size of the network inputs. None uses ``tile_batch_size``. Default: None.
+        """
+        if self.compile_mode is None:
+            return
+        if shapes is None:
+            size = self.tile_size + 2 * self.tile_pad if self.tile_size > 0 else self.bucket_size
+            shapes = [(size, size)]
+        dtype = torch.float16 if self.half else torch.float32
+        for h, w in shapes:
+            self._forward(torch.zeros(batch_size or self.tile_batch_size, 3, h, w, dtype=dtype, device=self.device))
+
+    def plan_tiles(self, height, width):
+        """Plan the tiles of a pre-processed image of the given size. See :func:`realesrgan.tiling.plan_tiles`.
 
-    def tile_process(self):
+        With ``compile_mode``, the tiles are cut with a fixed stride and all have the padded tile shape.
+        """
+        if self.compile_mode is not None:
+            padded_size = self.tile_size + 2 * self.tile_pad
+            return plan_tiles(
+                height, width, self.tile_size, self.tile_pad, self.scale, False, tile_shape=(padded_size, padded_size))
+        align = self.mod_scale if self.balanced_tiles and self.mod_scale is not None else 1
+        return plan_tiles(height, width, self.tile_size, self.tile_pad, self.scale, self.balanced_tiles, align)
+
+    def tile_process(self, outscale=None):
         """It will first crop input images to tiles, and then process each tile.
         Finally, all the processed tiles are merged into one images.
 
+        The tile geometry is given by :meth:`plan_tiles`, and kept in ``self.tile_plan``. Tiles whose padded inputs
+        have the same shape are stacked and processed ``tile_batch_size`` at a time. Tiles of different shapes
+        (usually the ones at the image borders) are never padded to a common shape, as the extra content would
+        change the border context of the network, so the output is identical to processing the tiles one by one.
+        With an ``executor`` (a :class:`realesrgan.executor.TileExecutor`), the tile batches are run by its workers
+        and stitched as they arrive.
+
+        With an ``outscale`` other than the network scale, each tile is resampled on the device before stitching,
+        when the tile borders fall on output pixels (always for an integer ``outscale``), so that the output at the
+        network scale is never materialized. ``output_scale`` is then ``outscale``.
+
+        With ``tile_dedup``, only the first of the tiles with byte-identical padded inputs (and those not in the
+        cross-image cache) are run, see :meth:`_dedup_tiles`. With a ``tile_router``, the tiles are batched per tier,
+        and the tiles at tier boundaries are blended, at the network scale, see :meth:`_route_tiles`.
+
         Modified from: https://github.com/ata4/esrgan-launcher
+
+        Args:
+            outscale (float): Output scale, see :meth:`enhance`. None for the network scale. Default: None.
         """
         batch, channel, height, width = self.img.shape
-        output_height = height * self.scale
-        output_width = width * self.scale
+        self.tile_plan = self.plan_tiles(height, width)
+        self.output_scale = self.scale
+        if outscale is not None and self.tile_router is None and all(
+                float(v * outscale).is_integer() for tile in self.tile_plan for v in tile.input + tile.input_pad):
+            self.output_scale = outscale
+        output_height = int(height * self.output_scale)
+        output_width = int(width * self.output_scale)
         output_shape = (batch, channel, output_height, output_width)
 
         # start with black image
         self.output = self.img.new_zeros(output_shape)
-        tiles_x = math.ceil(width / self.tile_size)
-        tiles_y = math.ceil(height / self.tile_size)
-
-        # loop over all tiles
-        for y in range(tiles_y):
-            for x in range(tiles_x):
-                # extract tile from input image
-                ofs_x = x * self.tile_size
-                ofs_y = y * self.tile_size
-                # input tile area on total image
-                input_start_x = ofs_x
-                input_end_x = min(ofs_x + self.tile_size, width)
-                input_start_y = ofs_y
-                input_end_y = min(ofs_y + self.tile_size, height)
-
-                # input tile area on total image with padding
-                input_start_x_pad = max(input_start_x - self.tile_pad, 0)
-                input_end_x_pad = min(input_end_x + self.tile_pad, width)
-                input_start_y_pad = max(input_start_y - self.tile_pad, 0)
-                input_end_y_pad = min(input_end_y + self.tile_pad, height)
-
-                # input tile dimensions
-                input_tile_width = input_end_x - input_start_x
-                input_tile_height = input_end_y - input_start_y
-                tile_idx = y * tiles_x + x + 1
-                input_tile = self.img[:, :, input_start_y_pad:input_end_y_pad, input_start_x_pad:input_end_x_pad]
-
-                # upscale tile
+        self._output_weights = None
+
+        self.tile_timings = dict.fromkeys(['slice', 'forward', 'stitch', 'wall', 'idle'], 0.)
+        start = time.perf_counter()
+        self._tile_tiers = {}
+        if self.tile_router is not None:
+            self._route_tiles(self.tile_plan)
+            self._output_weights = self.img.new_zeros((1, 1, output_height, output_width))
+        tiles, duplicates = self.tile_plan, []
+        if self.tile_dedup:
+            tiles, duplicates = self._dedup_tiles(self.tile_plan)
+
+        # group tiles by their tier and the shape of their padded input area
+        tile_groups = {}
+        for tile in tiles:
+            tile_groups.setdefault((self._tile_tier(tile), tile.shape), []).append(tile)
+
+        tile_batches = [
+            tiles[i:i + self.tile_batch_size] for tiles in tile_groups.values()
+            for i in range(0, len(tiles), self.tile_batch_size)
+        ]
+        if self.executor is not None:
+            # the workers run the network, the cheaper tiers run here
+            for tile_batch in tile_batches:
+                if self._tile_tier(tile_batch[0]) != 'heavy':
+                    self._stitch_tiles(tile_batch, self._forward_tiles(self._crop_tiles(tile_batch), tile_batch))
+            tile_batches = [tile_batch for tile_batch in tile_batches if self._tile_tier(tile_batch[0]) == 'heavy']
+            input_batches = [self._crop_tiles(tile_batch) for tile_batch in tile_batches]
+            for i, output_tiles, seconds in self.executor.map(input_batches):
+                self.tile_timings['forward'] += seconds
+                self._stitch_tiles(tile_batches[i], output_tiles.to(self.output.device))
+        elif self.pipeline:
+            self._pipeline_tiles(tile_batches)
+        else:
+            # loop over all tiles
+            for tile_batch in tile_batches:
+                input_tiles = self._crop_tiles(tile_batch)
+                output_tiles = self._forward_tiles(input_tiles, tile_batch)
+                self._stitch_tiles(tile_batch, output_tiles)
+        for tile in duplicates:
+            self._stitch_tiles([tile], self._tile_outputs[self._tile_keys[tile.index]][1])
+        if self.tile_dedup:
+            self._evict_tile_outputs()
+            self._tile_inputs = {}
+        if self._output_weights is not None:
+            self.output /= self._output_weights
+            self._output_weights = None
+        self.tile_timings['wall'] = time.perf_counter() - start
+        self.tile_timings['idle'] = max(0., self.tile_timings['wall'] - self.tile_timings['forward'])
+        logger.debug(
+            'tile process: %d tiles (%d deduplicated), %.1f%% padding waste, in %.3f s',
+            len(self.tile_plan),
+            len(duplicates),
+            self.tile_plan.padding_waste,
+            self.tile_timings['wall'],
+            extra={
+                'num_tiles': len(self.tile_plan),
+                'num_duplicates': len(duplicates),
+                'padding_waste': self.tile_plan.padding_waste,
+                'routes': self.tile_routes,
+                'timings': dict(self.tile_timings)
+            })
+
+    def _route_tiles(self, tile_plan):
+        """Give each tile the tier of its gradient energy, and find the sides of the tiles at tier boundaries.
+
+        The tiers are kept in ``self._tile_tiers``, their counts in ``tile_routes``, and the sides (left, right,
+        top, bottom) facing a tile of another tier in ``self._tile_feathers``, see :meth:`_blend_tile`.
+        """
+        start = time.perf_counter()
+        router = self.tile_router
+        if router.compact is not None and router.compact.scale != self.scale:
+            raise ValueError(f'The compact upsampler scale {router.compact.scale} is not the scale {self.scale}.')
+        for tile in tile_plan:
+            start_x, end_x, start_y, end_y = tile.input_pad
+            complexity = gradient_energy(self.img[:, :, start_y:end_y, start_x:end_x]).max().item()
+            self._tile_tiers[tile.index] = router.route(complexity)
+        self.tile_routes = dict.fromkeys(router.tiers, 0)
+        for tier in self._tile_tiers.values():
+            self.tile_routes[tier] += 1
+
+        # tiles by the coordinates of their edges
+        by_end_x, by_end_y = {}, {}
+        for tile in tile_plan:
+            by_end_x.setdefault(tile.input[1], []).append(tile)
+            by_end_y.setdefault(tile.input[3], []).append(tile)
+        self._tile_feathers = {tile.index: set() for tile in tile_plan}
+        for tile in tile_plan:
+            start_x, end_x, start_y, end_y = tile.input
+            tier = self._tile_tier(tile)
+            for other in by_end_x.get(start_x, []):
+                if other.input[2] < end_y and start_y < other.input[3] and self._tile_tier(other) != tier:
+                    self._tile_feathers[tile.index].add('left')
+                    self._tile_feathers[other.index].add('right')
+            for other in by_end_y.get(start_y, []):
+                if other.input[0] < end_x and start_x < other.input[1] and self._tile_tier(other) != tier:
+                    self._tile_feathers[tile.index].add('top')
+                    self._tile_feathers[other.index].add('bottom')
+        self.tile_timings['slice'] += time.perf_counter() - start
+
+    def _tile_tier(self, tile):
+        """Tier of a tile of ``tile_router``, heavy for the network."""
+        return self._tile_tiers.get(tile.index, 'heavy')
+
+    def _dedup_tiles(self, tile_plan):
+        """Checksum the padded input of each tile, and split the tiles into the ones to run and their duplicates.
+
+        A duplicate is a tile whose padded input is byte-identical to a former tile of the image, or to a tile in
+        the cross-image cache. The network output only depends on the padded input, so it is reused as is, and
+        each tile crops its own area from it when stitched. The checksums are computed on the device and
+        downloaded at once, and only the tiles of equal checksums are compared exactly, so that there is no
+        device to host copy per tile.
+
+        Returns:
+            tuple[list[Tile], list[Tile]]: The tiles to run, and the duplicates.
+        """
+        start = time.perf_counter()
+        input_tiles = [self.img[:, :, y0:y1, x0:x1] for x0, x1, y0, y1 in (tile.input_pad for tile in tile_plan)]
+        checksums = torch.stack([_tile_checksum(input_tile) for input_tile in input_tiles]).cpu().tolist()
+        self._tile_keys, self._tile_inputs = {}, {}
+        tiles, duplicates = [], []
+        for tile, input_tile, checksum in zip(tile_plan, input_tiles, checksums):
+            key = (tuple(checksum), tuple(input_tile.shape), input_tile.dtype)
+            if key in self._tile_inputs and torch.equal(input_tile, self._tile_inputs[key]):
+                duplicates.append(tile)
+            elif key in self._tile_outputs and torch.equal(input_tile, self._tile_outputs[key][0]):
+                self._tile_outputs.move_to_end(key)
+                duplicates.append(tile)
+            else:
+                if key in self._tile_inputs or key in self._tile_outputs:
+                    # a checksum collision, the tile gets a key of its own
+                    key += (tile.index, )
+                self._tile_inputs[key] = input_tile
+                tiles.append(tile)
+            self._tile_keys[tile.index] = key
+        self.tile_hits += len(duplicates)
+        self.tile_misses += len(tiles)
+        self._tile_needed = {self._tile_keys[tile.index] for tile in duplicates}
+        self.tile_timings['slice'] += time.perf_counter() - start
+        return tiles, duplicates
+
+    def _evict_tile_outputs(self, keep=()):
+        """Keep the ``tile_cache_size`` most recently used tile outputs for the next images, and those in ``keep``."""
+        for key in list(self._tile_outputs):
+            if len(self._tile_outputs) <= self.tile_cache_size:
+                break
+            if key not in keep:
+                del self._tile_outputs[key]
+
+    @property
+    def tile_hit_rate(self):
+        """Fraction of the tiles whose output was reused by ``tile_dedup``."""
+        total = self.tile_hits + self.tile_misses
+        return self.tile_hits / total if total else 0.
+
+    def _pipeline_tiles(self, tile_batches):
+        """Run the tile batches in three overlapping stages: a producer thread slices the padded input tiles ahead of
+        the network, which runs in this thread, and a consumer thread stitches the finished tiles.
+
+        The queues hold ``pipeline_depth`` batches, which bounds the extra memory. torch releases the GIL in its
+        kernels, so the slicing and the stitching run while the network is busy.
+        """
+        inputs, outputs = queue.Queue(self.pipeline_depth), queue.Queue(self.pipeline_depth)
+        errors = []
+
+        def produce():
+            try:
+                for tile_batch in tile_batches:
+                    input_tiles = self._crop_tiles(tile_batch)
+                    if errors:
+                        return
+                    inputs.put((tile_batch, input_tiles))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                inputs.put(None)
+
+        def consume():
+            try:
+                for tile_batch, output_tiles in iter(outputs.get, None):
+                    self._stitch_tiles(tile_batch, output_tiles)
+            except Exception as error:
+                errors.append(error)
+                # keep draining, so that the network thread never blocks
+                for _ in iter(outputs.get, None):
+                    pass
+
+        producer, consumer = threading.Thread(target=produce), threading.Thread(target=consume)
+        producer.start()
+        consumer.start()
+        try:
+            for tile_batch, input_tiles in iter(inputs.get, None):
+                if errors:
+                    break
+                outputs.put((tile_batch, self._forward_tiles(input_tiles, tile_batch)))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            outputs.put(None)
+            # unblock the producer
+            while producer.is_alive():
                 try:
-                    with torch.no_grad():
-                        output_tile = self.model(input_tile)
-                except RuntimeError as error:
-                    print('Error', error)
-                print(f'\tTile {tile_idx}/{tiles_x * tiles_y}')
-
-                # output tile area on total image
-                output_start_x = input_start_x * self.scale
-                output_end_x = input_end_x * self.scale
-                output_start_y = input_start_y * self.scale
-                output_end_y = input_end_y * self.scale
-
-                # output tile area without padding
-                output_start_x_tile = (input_start_x - input_start_x_pad) * self.scale
-                output_end_x_tile = output_start_x_tile + input_tile_width * self.scale
-                output_start_y_tile = (input_start_y - input_start_y_pad) * self.scale
-                output_end_y_tile = output_start_y_tile + input_tile_height * self.scale
+                    inputs.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            producer.join()
+            consumer.join()
+        if errors:
+            raise errors[0]
 
+    def _forward_tiles(self, input_tiles, tile_batch):
+        """Upscale a batch of input tiles, with the upsampler of their tier."""
+        start = time.perf_counter()
+        with torch.no_grad():
+            if self.tile_router is None:
+                output_tiles = self._forward_resilient(input_tiles)
+            else:
+                output_tiles = self.tile_router.forward(self, input_tiles, self._tile_tier(tile_batch[0]))
+        self.tile_timings['forward'] += time.perf_counter() - start
+        return output_tiles
+
+    def _forward_resilient(self, img):
+        """Run the network, retrying on out of memory errors with smaller inputs.
+
+        A batch is split in two halves, and a single input is processed with tiles of half its size (recursively,
+        down to ``min_tile_size``). Only the failed input is processed again, and the tile size which worked is
+        remembered for the device, see :meth:`_run`.
+        """
+        n, _, h, w = img.shape
+        try:
+            return self._forward(img)
+        except RuntimeError as error:
+            if not is_oom_error(error):
+                raise
+            plan = None
+            if n == 1:
+                # tile offsets are aligned to the pixel-unshuffle factor of the network
+                align = {2: 2, 1: 4}.get(self.scale, 1)
+                tile_size = max(h, w) // 2 // align * align
+                if tile_size < self.min_tile_size:
+                    raise
+                plan = plan_tiles(h, w, tile_size, self.tile_pad, self.scale, True, align)
+                # the tile pad may keep the padded tiles as large as the input
+                if max(max(tile.shape) for tile in plan) >= max(h, w):
+                    raise
+        # the traceback of the error is released here, with its references to the intermediate tensors
+        if torch.device(self.device).type == 'cuda':
+            torch.cuda.empty_cache()
+
+        if plan is None:
+            logger.warning('Out of memory on a batch of %d inputs, retrying in two halves', n)
+            return torch.cat((self._forward_resilient(img[:n // 2]), self._forward_resilient(img[n // 2:])))
+        logger.warning('Out of memory on a %dx%d input, retrying with %d tiles', w, h, tile_size)
+        output = img.new_zeros((n, img.shape[1], h * self.scale, w * self.scale))
+        for tile in plan:
+            start_x, end_x, start_y, end_y = tile.input_pad
+            output_tile = self._forward_resilient(img[:, :, start_y:end_y, start_x:end_x])
+            output_start_x, output_end_x, output_start_y, output_end_y = tile.output
+            crop_start_x, crop_end_x, crop_start_y, crop_end_y = tile.output_crop
+            output[:, :, output_start_y:output_end_y,
+                   output_start_x:output_end_x] = output_tile[:, :, crop_start_y:crop_end_y, crop_start_x:crop_end_x]
+        key = self._device_key()
+        self._safe_tile_sizes[key] = min(tile_size, self._safe_tile_sizes.get(key, tile_size))
+        return output
+
+    def _crop_tiles(self, tile_batch):
+        """Stack the padded input areas of tiles of the same shape."""
+        start = time.perf_counter()
+        input_tiles = []
+        for tile in tile_batch:
+            input_start_x_pad, input_end_x_pad, input_start_y_pad, input_end_y_pad = tile.input_pad
+            input_tiles.append(self.img[:, :, input_start_y_pad:input_end_y_pad, input_start_x_pad:input_end_x_pad])
+        input_tiles = torch.cat(input_tiles, dim=0) if len(input_tiles) > 1 else input_tiles[0]
+        self.tile_timings['slice'] += time.perf_counter() - start
+        return input_tiles
+
+    def _stitch_tiles(self, tile_batch, output_tiles):
+        """Put the network outputs of a tile batch into the output image."""
+        start = time.perf_counter()
+        batch = self.img.shape[0]
+        scale = self.output_scale
+        for j, tile in enumerate(tile_batch):
+            output_tile = output_tiles[j * batch:(j + 1) * batch]
+            if self.tile_dedup:
+                key = self._tile_keys[tile.index]
+                if key not in self._tile_outputs and (key in self._tile_needed or self.tile_cache_size):
+                    # copies, so that the input image and the batch of the tile are released
+                    self._tile_outputs[key] = (self._tile_inputs[key].clone(), output_tile.clone())
+                    self._evict_tile_outputs(keep=self._tile_needed)
+            if scale != self.scale:
+                # resample the padded tile to the output scale, on the device
+                _, _, h, w = output_tile.shape
+                output_tile = resize_tensor(output_tile, (round(h * scale / self.scale), round(w * scale / self.scale)))
+            # output tile area on total image
+            output_start_x, output_end_x, output_start_y, output_end_y = (int(v * scale) for v in tile.input)
+            # output tile area without padding
+            input_start_x_pad, _, input_start_y_pad, _ = tile.input_pad
+            output_start_x_tile = output_start_x - int(input_start_x_pad * scale)
+            output_end_x_tile = output_end_x - int(input_start_x_pad * scale)
+            output_start_y_tile = output_start_y - int(input_start_y_pad * scale)
+            output_end_y_tile = output_end_y - int(input_start_y_pad * scale)
+
+            if self._output_weights is not None:
+                self._blend_tile(tile, output_tile)
+            else:
                 # put tile into output image
                 self.output[:, :, output_start_y:output_end_y,
                             output_start_x:output_end_x] = output_tile[:, :, output_start_y_tile:output_end_y_tile,
                                                                        output_start_x_tile:output_end_x_tile]
+            logger.debug(
+                'tile %d/%d',
+                tile.index + 1,
+                len(self.tile_plan),
+                extra={
+                    'tile': tile.index,
+                    'num_tiles': len(self.tile_plan),
+                    'input': tile.input_pad
+                })
+        self.tile_timings['stitch'] += time.perf_counter() - start
+
+    def _blend_tile(self, tile, output_tile):
+        """Accumulate the weighted output of a tile, at the network scale.
+
+        On each side facing a tile of another tier, the tile extends ``feather`` input pixels (at most its pad) into
+        its neighbour, and its weight ramps linearly from 1 to 0 over ``feather`` pixels on both sides of the
+        boundary. The ramps of the two tiles sum to 1, and :meth:`tile_process` normalizes by the total weight.
+        """
+        scale = self.scale
+        feather = min(self.tile_router.feather, self.tile_pad) * scale
+        sides = self._tile_feathers[tile.index] if feather > 0 else ()
+        start_x, end_x, start_y, end_y = (v * scale for v in tile.input)
+        start_x_pad, end_x_pad, start_y_pad, end_y_pad = (v * scale for v in tile.input_pad)
+
+        def ramp(start, end, start_pad, end_pad, feather_start, feather_end):
+            # extent of the tile output along one axis, and its weights
+            extent_start = max(start_pad, start - feather) if feather_start else start
+            extent_end = min(end_pad, end + feather) if feather_end else end
+            centers = torch.arange(extent_start, extent_end, device=self.output.device, dtype=torch.float32) + 0.5
+            weights = torch.ones_like(centers)
+            if feather_start:
+                weights = torch.minimum(weights, (centers - (start - feather)) / (2 * feather))
+            if feather_end:
+                weights = torch.minimum(weights, ((end + feather) - centers) / (2 * feather))
+            return extent_start, extent_end, weights.clamp(0, 1)
+
+        x0, x1, weights_x = ramp(start_x, end_x, start_x_pad, end_x_pad, 'left' in sides, 'right' in sides)
+        y0, y1, weights_y = ramp(start_y, end_y, start_y_pad, end_y_pad, 'top' in sides, 'bottom' in sides)
+        weights = (weights_y[:, None] * weights_x[None, :]).to(self.output.dtype)
+        self.output[:, :, y0:y1, x0:x1] += output_tile[:, :, y0 - start_y_pad:y1 - start_y_pad,
+                                                       x0 - start_x_pad:x1 - start_x_pad] * weights
+        self._output_weights[:, :, y0:y1, x0:x1] += weights
 
     def post_process(self):
         # remove extra pad
@@ -190,77 +935,630 @@ class RealESRGANer():
             self.output = self.output[:, :, 0:h - self.pre_pad * self.scale, 0:w - self.pre_pad * self.scale]
         return self.output
 
-    @torch.no_grad()
-    def enhance(self, img, outscale=None, alpha_upsampler='realesrgan'):
-        h_input, w_input = img.shape[0:2]
-        # img: numpy
-        img = img.astype(np.float32)
-        if np.max(img) > 256:  # 16-bit image
-            max_range = 65535
-            print('\tInput is a 16-bit image')
+    def upload(self, img, max_range=None):
+        """Upload a numpy image to the device once, and normalize it there.
+
+        Args:
+            img (ndarray): Image of shape (H, W), (H, W, 3) or (H, W, 4) in BGR(A) order.
+            max_range (int): Max value of the image range. None uses :func:`get_max_range`. Default: None.
+
+        Returns:
+            tuple: The RGB image as a (1, 3, H, W) float32 tensor in [0, 1], the alpha channel as a (1, 1, H, W)
+                tensor or None, the image mode (L | RGB | RGBA) and the max range (255 | 65535).
+        """
+        img_mode = get_img_mode(img)
+        max_range = max_range or get_max_range(img)
+        if img.dtype == np.uint16:
+            # torch has no uint16 tensor, upload the raw bytes as int16 and unwrap them on the device
+            tensor = torch.from_numpy(np.ascontiguousarray(img).view(np.int16)).to(self.device).int() & 0xFFFF
         else:
-            max_range = 255
-        img = img / max_range
-        if len(img.shape) == 2:  # gray image
-            img_mode = 'L'
-            img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-        elif img.shape[2] == 4:  # RGBA image with alpha channel
-            img_mode = 'RGBA'
-            alpha = img[:, :, 3]
-            img = img[:, :, 0:3]
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            if alpha_upsampler == 'realesrgan':
-                alpha = cv2.cvtColor(alpha, cv2.COLOR_GRAY2RGB)
+            tensor = torch.from_numpy(np.ascontiguousarray(img)).to(self.device)
+
+        alpha = None
+        if img_mode == 'L':
+            tensor = tensor[None, None].to(torch.float32, copy=True).div_(max_range).expand(1, 3, -1, -1)
         else:
-            img_mode = 'RGB'
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            if img_mode == 'RGBA':
+                alpha = tensor[None, None, :, :, 3].to(torch.float32, copy=True).div_(max_range)
+            # BGR -> RGB, HWC -> NCHW, before the conversion to float
+            tensor = tensor[:, :, 0:3].permute(2, 0, 1).flip(0).unsqueeze(0).float().div_(max_range)
+        return tensor.contiguous(), alpha, img_mode, max_range
+
+    def download(self, output, max_range):
+        """Quantize (C, H, W) RGB(A) or (H, W) gray planes in [0, 1] on the device, and download them as a numpy
+        image in BGR(A) order.
+
+        Returns:
+            ndarray: uint8 image, or uint16 image if ``max_range`` is 65535.
+        """
+        output = output.mul(max_range).round_()
+        if max_range == 65535:  # 16-bit image
+            output = output.int()
+            # wrap to int16 on the device, so that only 2 bytes per value are downloaded
+            output = (output - 65536 * (output >= 32768).int()).short()
+        else:
+            output = output.byte()
+        output = output.cpu().numpy()
+        if max_range == 65535:
+            output = output.view(np.uint16)
+        if output.ndim == 3:
+            # RGB(A) planes -> interleaved BGR(A), in a single pass
+            output = cv2.merge([output[i] for i in [2, 1, 0, 3][:output.shape[0]]])
+        return output
+
+    def _to_planes(self, output, img_mode):
+        """Clamp a (1, 3, H, W) RGB network output to (3, H, W) planes, or to a (H, W) plane for gray images."""
+        output = output[0].float().clamp_(0, 1)
+        if img_mode == 'L':
+            # same weights as cv2.COLOR_BGR2GRAY
+            return 0.299 * output[0] + 0.587 * output[1] + 0.114 * output[2]
+        return output
+
+    def _run(self, img, outscale=None):
+        """Pre-process, process (with tiles or not) and post-process a (N, 3, H, W) tensor.
 
-        # ------------------- process image (without the alpha channel) ------------------- #
+        The output is at ``outscale`` (None for the network scale), resampled per tile or, without tiles, at once on
+        the device.
+        """
+        _, _, h, w = img.shape
         self.pre_process(img)
+        self._process_padded(outscale)
+        return self._crop_output(self.output, h, w, outscale)
+
+    def _process_padded(self, outscale=None):
+        """Process the pre-processed ``self.img`` into ``self.output``, with tiles or not."""
+        # start at the tile size known to fit on the device, after an out of memory error of an earlier image
+        safe_tile_size = self._safe_tile_sizes.get(self._device_key())
+        if safe_tile_size is not None and (self.tile_size == 0 or self.tile_size > safe_tile_size):
+            self.tile_size = safe_tile_size
         if self.tile_size > 0:
-            self.tile_process()
+            self.tile_process(outscale)
         else:
             self.process()
-        output_img = self.post_process()
-        output_img = output_img.data.squeeze().float().cpu().clamp_(0, 1).numpy()
-        output_img = np.transpose(output_img[[2, 1, 0], :, :], (1, 2, 0))
-        if img_mode == 'L':
-            output_img = cv2.cvtColor(output_img, cv2.COLOR_BGR2GRAY)
 
-        # ------------------- process the alpha channel if necessary ------------------- #
-        if img_mode == 'RGBA':
-            if alpha_upsampler == 'realesrgan':
-                self.pre_process(alpha)
-                if self.tile_size > 0:
-                    self.tile_process()
-                else:
-                    self.process()
-                output_alpha = self.post_process()
-                output_alpha = output_alpha.data.squeeze().float().cpu().clamp_(0, 1).numpy()
-                output_alpha = np.transpose(output_alpha[[2, 1, 0], :, :], (1, 2, 0))
-                output_alpha = cv2.cvtColor(output_alpha, cv2.COLOR_BGR2GRAY)
-            else:  # use the cv2 resize for alpha channel
-                h, w = alpha.shape[0:2]
-                output_alpha = cv2.resize(alpha, (w * self.scale, h * self.scale), interpolation=cv2.INTER_LINEAR)
+    def _crop_output(self, output, h, w, outscale=None):
+        """Remove the pre-pad and mod pad areas (at the bottom and right borders) of the output of a (h, w) input,
+        and resample it to ``outscale``."""
+        if outscale is None:
+            return output[:, :, :h * self.scale, :w * self.scale]
+        output_size = (int(h * outscale), int(w * outscale))
+        if self.output_scale == outscale:
+            return output[:, :, :output_size[0], :output_size[1]]
+        return resize_tensor(output[:, :, :h * self.scale, :w * self.scale], output_size)
+
+    def _upsample_alpha(self, alpha, alpha_upsampler, outscale=None):
+        """Upsample a (1, 1, H, W) alpha channel to a (H * outscale, W * outscale) float tensor. An outscale of
+        None is the network scale.
+
+        Trivial alpha channels are never run through the network: a constant alpha stays constant, and a binary
+        (0 / max) mask is upsampled with bilinear interpolation and thresholded, so that it stays binary.
+        """
+        _, _, h, w = alpha.shape
+        output_size = (int(h * (outscale or self.scale)), int(w * (outscale or self.scale)))
+        if alpha_upsampler == 'realesrgan':
+            kind = get_alpha_kind(alpha)
+            if kind == 'constant':
+                return alpha.new_full(output_size, alpha[0, 0, 0, 0].item())
+            elif kind == 'binary':
+                output = F.interpolate(alpha, size=output_size, mode='bilinear', align_corners=False)[0, 0]
+                return (output >= 0.5).float()
+            return self._to_planes(self._run(alpha.expand(1, 3, -1, -1), outscale), 'L')
+        # bilinear, as cv2.INTER_LINEAR
+        return F.interpolate(alpha, size=output_size, mode='bilinear', align_corners=False)[0, 0]
+
+    @torch.no_grad()
+    def enhance(self, img, outscale=None, alpha_upsampler='realesrgan'):
+        """Enhance an image.
+
+        Args:
+            img (ndarray): Image of shape (H, W), (H, W, 3) or (H, W, 4) in BGR(A) order, uint8 or uint16.
+            outscale (float): The final upsampling scale. The network output is resampled to it on the device,
+                with an antialiased bicubic filter, see :meth:`tile_process`. None uses the network scale.
+                Default: None.
+            alpha_upsampler (str): The upsampler for the alpha channel. Options: realesrgan | others for bilinear.
+                Default: 'realesrgan'.
+
+        Returns:
+            tuple: The enhanced image, and the image mode of the input: L | RGB | RGBA.
+        """
+        # the routes of a cached result are not known
+        self.tile_routes = None
+        params = None if self.result_cache is None else self.cache_params(outscale, alpha_upsampler)
+        if params is None:
+            return self._enhance(img, outscale, alpha_upsampler)
+        key = self.result_cache.key(img, **params)
+        output = self.result_cache.get(key)
+        if output is None:
+            output, _ = self._enhance(img, outscale, alpha_upsampler)
+            self.result_cache.put(key, output)
+        return output, get_img_mode(img)
 
+    def _enhance(self, img, outscale, alpha_upsampler):
+        outscale = None if outscale is None or float(outscale) == float(self.scale) else outscale
+        # the numpy image is uploaded once, all the pre/post-processing happens on the device
+        img, alpha, img_mode, max_range = self.upload(img)
+        if max_range == 65535:
+            logger.info('Input is a 16-bit image')
+
+        if (img_mode == 'RGBA' and alpha_upsampler == 'realesrgan' and self.batch_alpha
+                and get_alpha_kind(alpha) is None):
+            # ------------------- process the image and the alpha channel in one batch ------------------- #
+            output = self._run(torch.cat((img, alpha.expand(1, 3, -1, -1)), dim=0), outscale)
+            output_img = self._to_planes(output[0:1], img_mode)
+            output_alpha = self._to_planes(output[1:2], 'L')
+        else:
+            # ------------------- process image (without the alpha channel) ------------------- #
+            output_img = self._to_planes(self._run(img, outscale), img_mode)
+
+            # ------------------- process the alpha channel if necessary ------------------- #
+            if img_mode == 'RGBA':
+                output_alpha = self._upsample_alpha(alpha, alpha_upsampler, outscale)
+
+        if img_mode == 'RGBA':
             # merge the alpha channel
-            output_img = cv2.cvtColor(output_img, cv2.COLOR_BGR2BGRA)
-            output_img[:, :, 3] = output_alpha
+            output_img = torch.cat((output_img, output_alpha.clamp(0, 1).unsqueeze(0)), dim=0)
 
         # ------------------------------ return ------------------------------ #
-        if max_range == 65535:  # 16-bit image
-            output = (output_img * 65535.0).round().astype(np.uint16)
+        output = self.download(output_img, max_range)
+        return output, img_mode
+
+    @torch.no_grad()
+    def enhance_batch(self, imgs, outscale=None, alpha_upsampler='realesrgan', memory_budget=None, max_batch_size=16):
+        """Enhance a list of images, with batched forward passes.
+
+        The images are grouped by padded shape (after the pre-pad and the mod pad, which only depend on their size),
+        and each group is pre-processed as in :meth:`enhance` and run through the network (or :meth:`tile_process`,
+        with tiles) in batches of as many inputs as fit in the memory budget. Gray, RGB, RGBA and 16-bit images of
+        the same size share the batches: the alpha channels upsampled with the network are inputs of their own. The
+        outputs are the ones of :meth:`enhance`, up to the floating point differences of the convolution algorithms
+        at another batch size.
+
+        Args:
+            imgs (list[ndarray]): Images of shape (H, W), (H, W, 3) or (H, W, 4) in BGR(A) order, uint8 or uint16.
+            outscale (float): The final upsampling scale, see :meth:`enhance`. Default: None.
+            alpha_upsampler (str): The upsampler for the alpha channel, see :meth:`enhance`. Default: 'realesrgan'.
+            memory_budget (int): Memory budget in bytes for the activations of one forward pass. None uses 80% of
+                the free memory on cuda and ``DEFAULT_TILE_MEMORY_BUDGET`` otherwise. Default: None.
+            max_batch_size (int): Maximum number of inputs of one forward pass. It is the batch size of the networks
+                whose activation memory is unknown, e.g., ONNX Runtime sessions. Default: 16.
+
+        Returns:
+            list[tuple]: The enhanced image and the image mode of each input, as :meth:`enhance`, in input order.
+        """
+        results = [None] * len(imgs)
+        keys = {}
+        self.tile_routes = None
+        params = None if self.result_cache is None else self.cache_params(outscale, alpha_upsampler)
+        if params is not None:
+            for i, img in enumerate(imgs):
+                keys[i] = self.result_cache.key(img, **params)
+                output = self.result_cache.get(keys[i])
+                if output is not None:
+                    results[i] = output, get_img_mode(img)
+        groups = {}
+        for i, img in enumerate(imgs):
+            if results[i] is None:
+                groups.setdefault(self._padded_shape(*img.shape[0:2]), []).append(i)
+        budget = self._memory_budget(memory_budget)
+        activation_bytes = self.activation_bytes()
+        for (height, width), indexes in groups.items():
+            if self.tile_size > 0:
+                # the tiles of all the inputs of a batch are stacked
+                tile_size = self.tile_size + 2 * self.tile_pad
+                pixels = min(height, tile_size) * min(width, tile_size) * self.tile_batch_size
+            else:
+                pixels = height * width
+            batch_size = max_batch_size
+            if activation_bytes is not None:
+                batch_size = max(1, min(batch_size, int(budget // (activation_bytes * pixels))))
+            if self.tile_router is not None:
+                # the tiers are routed on the whole batch of a tile
+                batch_size = 1
+            # an RGBA image may be two inputs, which are run one after the other if they do not fit together
+            batches = [([], 0)]
+            for i in indexes:
+                n = 2 if get_img_mode(imgs[i]) == 'RGBA' else 1
+                if batches[-1][0] and batches[-1][1] + n > batch_size:
+                    batches.append(([], 0))
+                batches[-1] = (batches[-1][0] + [i], batches[-1][1] + n)
+            for batch, num_inputs in batches:
+                if num_inputs > batch_size:
+                    outputs = [self._enhance(imgs[batch[0]], outscale, alpha_upsampler)]
+                else:
+                    outputs = self._enhance_batch([imgs[i] for i in batch], outscale, alpha_upsampler)
+                for i, (output, img_mode) in zip(batch, outputs):
+                    results[i] = output, img_mode
+                    if params is not None:
+                        self.result_cache.put(keys[i], output)
+        return results
+
+    def _padded_shape(self, h, w):
+        """Shape of the network input of a (h, w) image, after the pre-pad and the mod pad of :meth:`pre_process`."""
+        mod_scale = {2: 2, 1: 4}.get(self.scale)
+        h, w = h + self.pre_pad, w + self.pre_pad
+        if mod_scale is not None:
+            h, w = int(math.ceil(h / mod_scale)) * mod_scale, int(math.ceil(w / mod_scale)) * mod_scale
+        return h, w
+
+    def _enhance_batch(self, imgs, outscale, alpha_upsampler):
+        """Enhance images of the same padded shape in one forward pass (or tile process)."""
+        outscale = None if outscale is None or float(outscale) == float(self.scale) else outscale
+        uploads, inputs, sizes = [], [], []
+        for img in imgs:
+            img, alpha, img_mode, max_range = self.upload(img)
+            uploads.append((alpha, img_mode, max_range))
+            parts = [img]
+            if img_mode == 'RGBA' and alpha_upsampler == 'realesrgan' and get_alpha_kind(alpha) is None:
+                parts.append(alpha.expand(1, 3, -1, -1))
+            for part in parts:
+                self.pre_process(part)
+                inputs.append(self.img)
+                sizes.append(part.shape[2:])
+        logger.debug('Batch of %d inputs of shape %s', len(inputs), tuple(inputs[0].shape[2:]))
+        self.img = torch.cat(inputs) if len(inputs) > 1 else inputs[0]
+        self._process_padded(outscale)
+        outputs = iter(self._crop_output(self.output[k:k + 1], h, w, outscale) for k, (h, w) in enumerate(sizes))
+
+        results = []
+        for alpha, img_mode, max_range in uploads:
+            output_img = self._to_planes(next(outputs), img_mode)
+            if img_mode == 'RGBA':
+                if alpha_upsampler == 'realesrgan' and get_alpha_kind(alpha) is None:
+                    output_alpha = self._to_planes(next(outputs), 'L')
+                else:
+                    output_alpha = self._upsample_alpha(alpha, alpha_upsampler, outscale)
+                output_img = torch.cat((output_img, output_alpha.clamp(0, 1).unsqueeze(0)), dim=0)
+            results.append((self.download(output_img, max_range), img_mode))
+        return results
+
+    def iter_enhanced_tiles(self, img, alpha_upsampler='realesrgan', tile_size=None, balanced=None):
+        """Enhance an image tile by tile, reading the source tiles on demand.
+
+        The pre-pad and mod-pad areas are never materialized: their pixels are read from the reflected source
+        positions, so only the padded area of one tile is in memory at a time.
+
+        Args:
+            img (array-like): Input image of shape (H, W), (H, W, 3) or (H, W, 4) in BGR(A) order, uint8 or uint16,
+                supporting numpy slicing, e.g., a np.memmap.
+            alpha_upsampler (str): The upsampler for the alpha channel. Options: realesrgan | others for bilinear.
+                Default: 'realesrgan'.
+            tile_size (int): Tile size. None uses ``self.tile_size``, or :meth:`auto_tile_size` when it is 0.
+                Default: None.
+            balanced (bool): Use a balanced tile plan. None uses ``self.balanced_tiles``. Default: None.
+
+        Yields:
+            tuple: The output area (start_x, end_x, start_y, end_y) and the enhanced uint8 / uint16 tile.
+        """
+        h, w = img.shape[0:2]
+        img_mode = get_img_mode(img)
+        max_range = get_max_range(img)
+        tile_size = tile_size or self.tile_size or self.auto_tile_size()
+        balanced = self.balanced_tiles if balanced is None else balanced
+        # trivial alpha channels are never run through the network, as in enhance
+        network_alpha = (
+            img_mode == 'RGBA' and alpha_upsampler == 'realesrgan' and _get_alpha_kind_strips(img, max_range) is None)
+
+        # sizes of the image after each reflect padding of pre_process
+        heights, widths = [h, h + self.pre_pad], [w, w + self.pre_pad]
+        self.mod_scale = {2: 2, 1: 4}.get(self.scale)
+        if self.mod_scale is not None:
+            heights.append(int(math.ceil(heights[-1] / self.mod_scale)) * self.mod_scale)
+            widths.append(int(math.ceil(widths[-1] / self.mod_scale)) * self.mod_scale)
+        align = self.mod_scale or 1
+        tile_pad = int(math.ceil(self.tile_pad / align)) * align
+        if self.compile_mode is not None:
+            # fixed-shape tiles for the compiled network, as in plan_tiles
+            tile_size = int(math.ceil(tile_size / align)) * align
+            padded_size = tile_size + 2 * tile_pad
+            plan = plan_tiles(
+                heights[-1], widths[-1], tile_size, tile_pad, self.scale, False, tile_shape=(padded_size, padded_size))
         else:
-            output = (output_img * 255.0).round().astype(np.uint8)
+            plan = plan_tiles(heights[-1], widths[-1], tile_size, tile_pad, self.scale, balanced, align)
 
-        if outscale is not None and outscale != float(self.scale):
-            output = cv2.resize(
-                output, (
-                    int(w_input * outscale),
-                    int(h_input * outscale),
-                ), interpolation=cv2.INTER_LANCZOS4)
+        for tile in plan:
+            start_x, end_x, start_y, end_y = tile.input
+            # tiles, or parts of tiles, in the padding area are dropped
+            end_x, end_y = min(end_x, w), min(end_y, h)
+            if start_x >= end_x or start_y >= end_y:
+                continue
+            start_x_pad, end_x_pad, start_y_pad, end_y_pad = tile.input_pad
+            rows = _reflect_indices(start_y_pad, end_y_pad, heights)
+            cols = _reflect_indices(start_x_pad, end_x_pad, widths)
+            input_tile, alpha, _, _ = self.upload(_read_region(img, rows, cols), max_range)
+            crop_y = slice((start_y - start_y_pad) * self.scale, (end_y - start_y_pad) * self.scale)
+            crop_x = slice((start_x - start_x_pad) * self.scale, (end_x - start_x_pad) * self.scale)
 
-        return output, img_mode
+            if network_alpha:
+                if self.batch_alpha:
+                    output = self._forward(self._cast(torch.cat((input_tile, alpha.expand(1, 3, -1, -1)), dim=0)))
+                else:
+                    output = torch.cat(
+                        (self._forward(self._cast(input_tile)), self._forward(self._cast(alpha.expand(1, 3, -1, -1)))))
+                output_tile, output_alpha = output[0:1], self._to_planes(output[1:2], 'L')
+            else:
+                output_tile = self._forward(self._cast(input_tile))
+            output_tile = self._to_planes(output_tile, img_mode)[..., crop_y, crop_x]
+            if img_mode == 'RGBA':
+                if not network_alpha:
+                    # cv2.resize replicates the border, instead of reflecting it
+                    rows = np.clip(np.arange(start_y_pad, end_y_pad), 0, h - 1)
+                    cols = np.clip(np.arange(start_x_pad, end_x_pad), 0, w - 1)
+                    _, alpha, _, _ = self.upload(_read_region(img, rows, cols), max_range)
+                    output_alpha = self._upsample_alpha(alpha, alpha_upsampler)
+                output_tile = torch.cat((output_tile, output_alpha[crop_y, crop_x].clamp(0, 1).unsqueeze(0)), dim=0)
+            output_tile = self.download(output_tile, max_range)
+            yield (start_x * self.scale, end_x * self.scale, start_y * self.scale, end_y * self.scale), output_tile
+
+    def _cast(self, img):
+        img = img.to(self.device)
+        return img.half() if self.half else img
+
+    @torch.no_grad()
+    def enhance_to(self, img, output, alpha_upsampler='realesrgan'):
+        """Out-of-core enhance for images which do not fit in memory.
+
+        Source tiles are read on demand from ``img`` and the enhanced tiles are written directly into ``output``,
+        so the peak memory is bounded by a few tiles instead of the image size. ``outscale`` is not supported,
+        the output is at the network scale.
+
+        Args:
+            img (array-like): Input image of shape (H, W), (H, W, 3) or (H, W, 4) in BGR(A) order, uint8 or uint16,
+                supporting numpy slicing, e.g., a np.memmap.
+            output (array-like): Output image with the same number of channels and dtype as ``img`` and a
+                ``scale`` times larger size, supporting numpy slice assignment, e.g., from :func:`open_memmap`.
+            alpha_upsampler (str): The upsampler for the alpha channel. Options: realesrgan | others for bilinear.
+                Default: 'realesrgan'.
+
+        Returns:
+            str: Image mode of the input: L | RGB | RGBA.
+        """
+        for (start_x, end_x, start_y, end_y), output_tile in self.iter_enhanced_tiles(img, alpha_upsampler):
+            output[start_y:end_y, start_x:end_x] = output_tile
+        if hasattr(output, 'flush'):
+            output.flush()
+        return get_img_mode(img)
+
+    @torch.no_grad()
+    def enhance_to_tiff(self, img, save_path, alpha_upsampler='realesrgan', tile_size=None):
+        """Out-of-core enhance, written to a tiled TIFF file in RGB(A) order.
+
+        The image is processed with a regular tile grid matching the TIFF tiles, which are streamed to the file as
+        they are enhanced. It requires the tifffile package.
+
+        Args:
+            img (array-like): Input image, see :meth:`enhance_to`.
+            save_path (str): Path of the TIFF file.
+            alpha_upsampler (str): The upsampler for the alpha channel. Default: 'realesrgan'.
+            tile_size (int): Input tile size, rounded up so that output tiles are multiples of 16 pixels as required
+                by TIFF. None uses ``self.tile_size``, or :meth:`auto_tile_size` when it is 0. Default: None.
+
+        Returns:
+            str: Image mode of the input: L | RGB | RGBA.
+        """
+        import tifffile
+
+        img_mode = get_img_mode(img)
+        h, w = img.shape[0:2]
+        tile_size = tile_size or self.tile_size or self.auto_tile_size()
+        multiple = 16 // math.gcd(16, self.scale)
+        tile_size = int(math.ceil(tile_size / multiple)) * multiple
+        tiff_tile = tile_size * self.scale
+        channels = () if img_mode == 'L' else (img.shape[2], )
+
+        def tiff_tiles():
+            for _, output_tile in self.iter_enhanced_tiles(img, alpha_upsampler, tile_size, balanced=False):
+                if img_mode != 'L':
+                    output_tile = output_tile[:, :, [2, 1, 0, 3][:output_tile.shape[2]]]
+                # border tiles are padded to the full tile size
+                full_tile = np.zeros((tiff_tile, tiff_tile) + channels, dtype=output_tile.dtype)
+                full_tile[:output_tile.shape[0], :output_tile.shape[1]] = output_tile
+                yield full_tile
+
+        tifffile.imwrite(
+            save_path,
+            tiff_tiles(),
+            shape=(h * self.scale, w * self.scale) + channels,
+            dtype=img.dtype if img.dtype == np.uint16 else np.uint8,
+            tile=(tiff_tile, tiff_tile),
+            photometric='minisblack' if img_mode == 'L' else 'rgb')
+        return img_mode
+
+
+def load_params(model_path, device='cpu', key=None):
+    """Load the network parameters of a checkpoint.
+
+    Packed checkpoints (``.safetensors``, see :func:`pack_weights`) are memory-mapped and only hold the parameters,
+    already in their inference dtype. They require the safetensors package.
+
+    Args:
+        model_path (str): Path of a ``.pth`` or a packed ``.safetensors`` checkpoint.
+        device (str | torch.device): Device of the loaded parameters. Default: 'cpu'.
+        key (str): Key of the parameters in a ``.pth`` checkpoint. None prefers ``params_ema`` over ``params``.
+            Default: None.
+
+    Returns:
+        dict: The parameters.
+    """
+    if model_path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        return load_file(model_path, device=str(device))
+    loadnet = torch.load(model_path, map_location=torch.device('cpu'))
+    if key is None:
+        # prefer to use params_ema
+        key = 'params_ema' if 'params_ema' in loadnet else 'params'
+    return {k: v.to(device) for k, v in loadnet[key].items()}
+
+
+def pack_weights(model_path, save_path, key=None, dtype=torch.float32):
+    """Pack the parameters of a ``.pth`` checkpoint into a pickle-free, memory-mappable ``.safetensors`` file.
+
+    Only the selected parameters are kept, already converted to the inference dtype, so that loading them reads
+    no unused bytes and needs no conversion. It requires the safetensors package.
+
+    Args:
+        model_path (str): Path of the ``.pth`` checkpoint.
+        save_path (str): Path of the packed checkpoint.
+        key (str): See :func:`load_params`. Default: None.
+        dtype (torch.dtype): Dtype of the packed parameters, e.g., torch.float16 for ``half``.
+            Default: torch.float32.
+    """
+    from safetensors.torch import save_file
+    params = load_params(model_path, key=key)
+    params = {k: (v.to(dtype) if v.is_floating_point() else v).contiguous() for k, v in params.items()}
+    save_file(params, save_path, metadata={'format': 'pt'})
+
+
+def get_device(device=None, gpu_id=None):
+    """The given device, or cuda (``cuda:gpu_id`` if ``gpu_id`` is set) when it is available, cpu otherwise."""
+    if device is not None:
+        return device
+    if gpu_id:
+        return torch.device(f'cuda:{gpu_id}' if torch.cuda.is_available() else 'cpu')
+    return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+
+def cpu_supports_bf16():
+    """Whether the cpu has native bfloat16 instructions (AVX512-BF16 or AMX), which make bf16 faster than fp32."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def resolve_precision(precision, device):
+    """Resolve an inference precision for a device, falling back to a supported one.
+
+    'auto' is fp16 on cuda, and bf16 on cpus with native bfloat16 instructions (fp32 otherwise). On cpu, fp16 falls
+    back to fp32, as the cpu convolutions have no half precision kernels, and bf16 falls back to fp32 when oneDNN
+    has no bfloat16 support. On cuda, bf16 falls back to fp16 on GPUs without bfloat16 support, and on the other
+    devices auto and bf16 are fp16.
+
+    Args:
+        precision (str): Options: fp32 | fp16 | bf16 | auto.
+        device (str | torch.device): Device of the network.
+
+    Returns:
+        str: fp32 | fp16 | bf16.
+    """
+    if precision not in ('fp32', 'fp16', 'bf16', 'auto'):
+        raise ValueError(f'Unknown precision {precision}. Options: fp32 | fp16 | bf16 | auto')
+    device_type = torch.device(device).type
+    if device_type == 'cuda':
+        if precision == 'auto' or (precision == 'bf16' and not torch.cuda.is_bf16_supported()):
+            return 'fp16'
+    elif device_type == 'cpu':
+        if precision == 'auto':
+            return 'bf16' if cpu_supports_bf16() and _mkldnn_bf16_supported() else 'fp32'
+        if precision == 'fp16' or (precision == 'bf16' and not _mkldnn_bf16_supported()):
+            return 'fp32'
+    elif precision in ('auto', 'bf16'):
+        return 'fp16'
+    return precision
+
+
+def _mkldnn_bf16_supported():
+    return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+
+
+def resize_tensor(img, size):
+    """Resample (N, C, H, W) images to a (height, width) size on their device, with a bicubic filter, antialiased
+    when downsampling. The coordinates are mapped as in cv2.resize."""
+    _, _, h, w = img.shape
+    antialias = size[0] < h or size[1] < w
+    return F.interpolate(img.float(), size=size, mode='bicubic', align_corners=False, antialias=antialias)
+
+
+def is_oom_error(error):
+    """Whether a RuntimeError is an out of memory error, on cuda, mps or cpu."""
+    message = str(error)
+    return 'out of memory' in message or "can't allocate memory" in message
+
+
+def get_img_mode(img):
+    """Image mode of a (H, W), (H, W, 3) or (H, W, 4) image: L | RGB | RGBA."""
+    if len(img.shape) == 2:
+        return 'L'
+    return 'RGBA' if img.shape[2] == 4 else 'RGB'
+
+
+def get_max_range(img):
+    """Max value of the image range: 65535 for 16-bit images, and 255 otherwise.
+
+    The dtype decides for integer images. Float images are scanned, values above 256 meaning a 16-bit range.
+    """
+    if img.dtype == np.uint16:
+        return 65535
+    if img.dtype == np.uint8:
+        return 255
+    return 65535 if np.max(img) > 256 else 255
+
+
+def get_alpha_kind(alpha):
+    """Classify an alpha channel in [0, 1].
+
+    Returns:
+        str | None: 'constant' for a single value (e.g., a fully opaque image), 'binary' for a mask of 0 and 1
+            only, and None otherwise.
+    """
+    low, high = torch.aminmax(alpha)
+    if low == high:
+        return 'constant'
+    if low == 0 and high == 1 and ((alpha == 0) | (alpha == 1)).all():
+        return 'binary'
+    return None
+
+
+# integer dtype of the same size as a floating point dtype, to checksum its bits
+_BITS_DTYPES = {torch.float32: torch.int32, torch.float16: torch.int16, torch.bfloat16: torch.int16}
+
+
+def _tile_checksum(img):
+    """Sum and position-weighted sum of the bits of a tensor, in int64 on its device: equal for identical tensors,
+    and different for almost all the others. int64 rather than float64, which MPS does not support; the sums wrap
+    around on overflow, which is fine for a checksum."""
+    img = img.contiguous()
+    img = img.view(_BITS_DTYPES[img.dtype]) if img.dtype in _BITS_DTYPES else img
+    img = img.long()
+    weights = torch.arange(img.numel(), dtype=torch.int64, device=img.device).remainder_(65521).view_as(img)
+    return torch.stack((img.sum(), (img * weights).sum()))
+
+
+def _get_alpha_kind_strips(img, max_range, strip_height=256):
+    """:func:`get_alpha_kind` of the alpha channel of a (memory-mapped) RGBA image, read in strips of rows."""
+    low, high, binary = max_range, 0, True
+    for y in range(0, img.shape[0], strip_height):
+        alpha = np.asarray(img[y:y + strip_height, :, 3])
+        low, high = min(low, alpha.min()), max(high, alpha.max())
+        binary = binary and bool(np.all((alpha == 0) | (alpha == max_range)))
+    if low == high:
+        return 'constant'
+    if binary:
+        return 'binary'
+    return None
+
+
+def _reflect_indices(start, end, sizes):
+    """Source indices of [start, end) in an axis of size ``sizes[0]``, reflect-padded to each of ``sizes`` in turn
+    (like ``F.pad(mode='reflect')``)."""
+    indices = np.arange(start, end)
+    for size in reversed(sizes[:-1]):
+        indices = np.where(indices >= size, 2 * (size - 1) - indices, indices)
+    return indices
+
+
+def _read_region(img, rows, cols):
+    """Read the pixels at the given rows and cols, reading only their bounding box from the (memory-mapped)
+    image."""
+    top, left = rows.min(), cols.min()
+    region = np.asarray(img[top:rows.max() + 1, left:cols.max() + 1])
+    return region[rows - top][:, cols - left]
+
+
+def open_memmap(path, shape, dtype=np.uint8):
+    """Create a memory-mapped ``.npy`` file to be used as the output of :meth:`RealESRGANer.enhance_to`."""
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
 
 
 class PrefetchReader(threading.Thread):
@@ -0,0 +1,68 @@
+import argparse
+import contextlib
+import io
+import numpy as np
+import time
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+
+from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def build_model(arch):
+    if arch == 'srvgg':
+        return SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
+
+
+def main(args):
+    img = np.random.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+    megapixels = args.size * args.size / 1e6
+    for arch in args.archs:
+        torch.manual_seed(0)
+        model = build_model(arch)
+        model_path = f'/tmp/benchmark_{arch}.pth'
+        torch.save({'params': model.state_dict()}, model_path)
+        reference = None
+        for compile_mode in args.modes:
+            upsampler = RealESRGANer(
+                scale=4,
+                model_path=model_path,
+                model=build_model(arch),
+                tile=args.tile,
+                tile_pad=args.tile_pad,
+                pre_pad=0,
+                device=torch.device('cpu'),
+                compile_mode=None if compile_mode == 'eager' else compile_mode)
+            start = time.perf_counter()
+            upsampler.warmup()
+            warmup = time.perf_counter() - start
+            # silence the per-tile logs
+            with contextlib.redirect_stdout(io.StringIO()):
+                upsampler.enhance(img)  # the first run of TorchScript graphs is profiled
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    output, _ = upsampler.enhance(img)
+                elapsed = (time.perf_counter() - start) / args.repeat
+            if reference is None:
+                reference = output
+            max_diff = np.abs(output.astype(np.int16) - reference).max()
+            print(f'{arch} {compile_mode:8s}: {elapsed / megapixels:.3f} s/MP, warm-up {warmup:.1f} s, '
+                  f'max diff to {args.modes[0]}: {max_diff}')
+
+
+if __name__ == '__main__':
+    """Benchmark the per-megapixel latency of the eager and compiled inference of RealESRGANer on CPU, with random
+    weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--archs', type=str, nargs='+', default=['srvgg', 'rrdb'], help='Options: srvgg | rrdb')
+    parser.add_argument(
+        '--modes', type=str, nargs='+', default=['eager', 'trace', 'compile'], help='Options: eager | trace | compile')
+    parser.add_argument('--size', type=int, default=256, help='Size of the square input image')
+    parser.add_argument('--tile', type=int, default=128, help='Tile size')
+    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,85 @@
+import argparse
+import cv2
+import numpy as np
+import time
+import torch
+
+from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def sync(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def numpy_pre(upsampler, img):
+    """The numpy pre-processing of enhance before it was moved to the device."""
+    img = img.astype(np.float32)
+    max_range = 65535 if np.max(img) > 256 else 255
+    img = cv2.cvtColor(img / max_range, cv2.COLOR_BGR2RGB)
+    upsampler.pre_process(img)
+    return max_range
+
+
+def numpy_post(upsampler, max_range):
+    """The numpy post-processing of enhance before it was moved to the device."""
+    output_img = upsampler.post_process().data.squeeze().float().cpu().clamp_(0, 1).numpy()
+    output_img = np.transpose(output_img[[2, 1, 0], :, :], (1, 2, 0))
+    if max_range == 65535:
+        return (output_img * 65535.0).round().astype(np.uint16)
+    return (output_img * 255.0).round().astype(np.uint8)
+
+
+def fused_pre(upsampler, img):
+    img, _, _, max_range = upsampler.upload(img)
+    upsampler.pre_process(img)
+    return max_range
+
+
+def fused_post(upsampler, max_range):
+    return upsampler.download(upsampler._to_planes(upsampler.post_process(), 'RGB'), max_range)
+
+
+def timed(func, device, repeat):
+    func()  # warm up
+    sync(device)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    sync(device)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+@torch.no_grad()
+def main(args):
+    device = torch.device(args.device)
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    model_path = '/tmp/benchmark_srvgg.pth'
+    torch.save({'params': model.state_dict()}, model_path)
+    upsampler = RealESRGANer(scale=4, model_path=model_path, model=model, pre_pad=10, device=device)
+    dtype = np.uint16 if args.bit16 else np.uint8
+    img = np.random.randint(0, np.iinfo(dtype).max, (args.size, args.size, 3), dtype=dtype)
+
+    upsampler.pre_process(np.zeros((args.size, args.size, 3), dtype=np.float32))
+    model_ms, _ = timed(upsampler.process, device, args.repeat)
+    print(f'model: {model_ms:.2f} ms')
+
+    for name, pre, post in [('numpy', numpy_pre, numpy_post), ('fused', fused_pre, fused_post)]:
+        pre_ms, max_range = timed(lambda: pre(upsampler, img), device, args.repeat)
+        upsampler.process()
+        post_ms, output = timed(lambda: post(upsampler, max_range), device, args.repeat)
+        print(f'{name}: pre {pre_ms:.2f} ms, post {post_ms:.2f} ms, '
+              f'overhead {(pre_ms + post_ms) / (pre_ms + post_ms + model_ms) * 100:.1f}% of enhance')
+
+
+if __name__ == '__main__':
+    """Microbenchmark the pre/post-processing overhead of RealESRGANer.enhance, separately from the model time"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=256, help='Size of the square input image')
+    parser.add_argument('--bit16', action='store_true', help='Use a 16-bit input image')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs')
+    args = parser.parse_args()
+
+    main(args)
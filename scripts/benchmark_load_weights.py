@@ -0,0 +1,55 @@
+import argparse
+import os
+import tempfile
+import time
+import torch
+
+from realesrgan import MODEL_ZOO, RealESRGANer, build_model, pack_weights
+
+
+def time_load(name, model_path, half, device, repeat):
+    """Best time of a RealESRGANer construction, the network being built beforehand."""
+    times = []
+    for _ in range(repeat):
+        model, netscale = build_model(name)
+        start = time.perf_counter()
+        RealESRGANer(scale=netscale, model_path=model_path, model=model, half=half, device=device)
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main(args):
+    device = torch.device(args.device)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in MODEL_ZOO:
+            # random weights with params and params_ema, as in the released checkpoints
+            model, _ = build_model(name)
+            pth_path = os.path.join(tmp_dir, f'{name}.pth')
+            params = model.state_dict()
+            torch.save({'params': params, 'params_ema': {k: v.clone() for k, v in params.items()}}, pth_path)
+            packed_paths = {}
+            for dtype in [torch.float32, torch.float16]:
+                packed_paths[dtype] = os.path.join(tmp_dir, f'{name}-{dtype}.safetensors')
+                pack_weights(pth_path, packed_paths[dtype], dtype=dtype)
+
+            pth = time_load(name, pth_path, False, device, args.repeat)
+            packed = time_load(name, packed_paths[torch.float32], False, device, args.repeat)
+            pth_half = time_load(name, pth_path, True, device, args.repeat)
+            packed_half = time_load(name, packed_paths[torch.float16], True, device, args.repeat)
+            print(f'{name:28s} fp32: pth {pth:7.1f} ms, packed {packed:7.1f} ms | '
+                  f'fp16: pth {pth_half:7.1f} ms, packed {packed_half:7.1f} ms | '
+                  f'size: {os.path.getsize(pth_path) / 1024**2:6.1f} MB -> '
+                  f'{os.path.getsize(packed_paths[torch.float16]) / 1024**2:6.1f} MB')
+
+
+if __name__ == '__main__':
+    """Benchmark the weight loading time of RealESRGANer for every model of the zoo, from .pth checkpoints and from
+    packed .safetensors ones, with random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of loads, the best one is reported')
+    args = parser.parse_args()
+
+    main(args)
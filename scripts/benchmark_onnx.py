@@ -0,0 +1,71 @@
+import argparse
+import contextlib
+import io
+import numpy as np
+import time
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+
+from realesrgan import RealESRGANer, export_onnx, load_onnx_session
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def build_model(arch):
+    if arch == 'srvgg':
+        return SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
+
+
+def main(args):
+    torch.set_num_threads(args.threads)
+    img = np.random.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+    megapixels = args.size * args.size / 1e6
+    for arch in args.archs:
+        torch.manual_seed(0)
+        model = build_model(arch)
+        model_path = f'/tmp/benchmark_{arch}.pth'
+        onnx_path = f'/tmp/benchmark_{arch}.onnx'
+        torch.save({'params': model.state_dict()}, model_path)
+        export_onnx(model, onnx_path)
+
+        session = load_onnx_session(onnx_path)
+        session_options = session.get_session_options()
+        session_options.intra_op_num_threads = args.threads
+        session = type(session)(onnx_path, sess_options=session_options, providers=['CPUExecutionProvider'])
+
+        reference = None
+        for backend, backend_model in [('pytorch', model), ('onnxruntime', session)]:
+            upsampler = RealESRGANer(
+                scale=4,
+                model_path=model_path,
+                model=backend_model,
+                tile=args.tile,
+                tile_pad=args.tile_pad,
+                pre_pad=0,
+                device=torch.device('cpu'))
+            # silence the per-tile logs
+            with contextlib.redirect_stdout(io.StringIO()):
+                upsampler.enhance(img)  # warm up
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    output, _ = upsampler.enhance(img)
+                elapsed = (time.perf_counter() - start) / args.repeat
+            if reference is None:
+                reference = output
+            max_diff = np.abs(output.astype(np.int16) - reference).max()
+            print(f'{arch} {backend:11s}: {megapixels / elapsed:.4f} MP/s, max diff to pytorch: {max_diff}')
+
+
+if __name__ == '__main__':
+    """Compare the CPU throughput of RealESRGANer with the PyTorch network and with its ONNX Runtime export, with
+    random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--archs', type=str, nargs='+', default=['srvgg', 'rrdb'], help='Options: srvgg | rrdb')
+    parser.add_argument('--size', type=int, default=256, help='Size of the square input image')
+    parser.add_argument('--tile', type=int, default=128, help='Tile size, 0 for no tile')
+    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads(), help='Number of CPU threads')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs')
+    args = parser.parse_args()
+
+    main(args)
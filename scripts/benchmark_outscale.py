@@ -0,0 +1,57 @@
+import argparse
+import cv2
+import multiprocessing
+import numpy as np
+import resource
+import time
+import torch
+
+from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def run(mode, args):
+    """Enhance an image at ``outscale`` in a fresh process, and measure the wall time and the peak RSS in MB."""
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    model_path = '/tmp/benchmark_srvgg.pth'
+    torch.save({'params': model.state_dict()}, model_path)
+    upsampler = RealESRGANer(4, model_path, model=model, tile=args.tile, pre_pad=0, device=torch.device('cpu'))
+    img = np.random.RandomState(0).randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+
+    start = time.perf_counter()
+    if mode == 'cv2.resize':
+        # the former path: the full network-scale image, resized on cpu
+        output, _ = upsampler.enhance(img)
+        size = int(args.size * args.outscale)
+        output = cv2.resize(output, (size, size), interpolation=cv2.INTER_LANCZOS4)
+    else:
+        output, _ = upsampler.enhance(img, outscale=args.outscale)
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, output
+
+
+def main(args):
+    # each mode runs in a fresh process, so that the peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    outputs = {}
+    for mode in ['cv2.resize', 'per tile']:
+        with context.Pool(1) as pool:
+            elapsed, peak, outputs[mode] = pool.apply(run, (mode, args))
+        print(f'{mode:10s}: {elapsed:.2f} s, peak memory {peak:.0f} MB, output {outputs[mode].shape}')
+    diff = np.abs(outputs['per tile'].astype(np.int16) - outputs['cv2.resize'])
+    print(f'mean abs diff to cv2.resize (LANCZOS4, not antialiased): {diff.mean():.2f}')
+
+
+if __name__ == '__main__':
+    """Compare the wall time and the peak memory of enhance at a non-native output scale: per-tile resampling on the
+    device, against the former full network-scale output resized with cv2, with random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024, help='Size of the square input image')
+    parser.add_argument('-s', '--outscale', type=float, default=2, help='Output scale of the x4 network')
+    parser.add_argument('--tile', type=int, default=256, help='Tile size')
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads(), help='Number of CPU threads')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,66 @@
+import argparse
+import numpy as np
+import time
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+
+from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def build_model(arch):
+    if arch == 'srvgg':
+        return SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
+
+
+def main(args):
+    device = torch.device(args.device)
+    img = np.random.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+    megapixels = args.size * args.size / 1e6
+    for arch in args.archs:
+        torch.manual_seed(0)
+        model = build_model(arch)
+        model_path = f'/tmp/benchmark_{arch}.pth'
+        torch.save({'params': model.state_dict()}, model_path)
+        upsampler = RealESRGANer(
+            scale=4,
+            model_path=model_path,
+            model=model,
+            tile=args.tile,
+            tile_pad=args.tile_pad,
+            pre_pad=0,
+            device=device,
+            tile_batch_size=args.tile_batch_size)
+
+        reference = None
+        for pipeline in [False, True]:
+            upsampler.pipeline = pipeline
+            upsampler.enhance(img)  # warm up
+            start = time.perf_counter()
+            output, _ = upsampler.enhance(img)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = output
+            timings = upsampler.tile_timings
+            stages = ', '.join(f'{stage} {timings[stage]:.3f} s' for stage in ['slice', 'forward', 'stitch', 'idle'])
+            print(f'{arch} {"pipelined" if pipeline else "serial   "}: {megapixels / elapsed:.4f} MP/s, '
+                  f'{len(upsampler.tile_plan)} tiles, {stages}, identical: {np.array_equal(output, reference)}')
+
+
+if __name__ == '__main__':
+    """Compare the serial and the pipelined tile engines of RealESRGANer, with random weights.
+
+    It reports the time spent in each stage and the time the network is idle (wall time minus forward time). On
+    cuda, the stage times are host times, the kernels being asynchronous.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--archs', type=str, nargs='+', default=['srvgg', 'rrdb'], help='Options: srvgg | rrdb')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='Device')
+    parser.add_argument('--size', type=int, default=512, help='Size of the square input image')
+    parser.add_argument('--tile', type=int, default=64, help='Tile size')
+    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument('--tile_batch_size', type=int, default=1, help='Number of tiles per forward pass')
+    args = parser.parse_args()
+
+    main(args)
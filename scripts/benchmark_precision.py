@@ -0,0 +1,73 @@
+import argparse
+import contextlib
+import io
+import numpy as np
+import time
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+from basicsr.metrics import calculate_psnr
+
+from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def build_model(arch):
+    if arch == 'srvgg':
+        return SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
+
+
+def main(args):
+    torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+    img = np.random.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+    megapixels = args.size * args.size / 1e6
+    for arch in args.archs:
+        torch.manual_seed(0)
+        model = build_model(arch)
+        model_path = f'/tmp/benchmark_{arch}.pth'
+        torch.save({'params': model.state_dict()}, model_path)
+
+        reference = None
+        for precision in args.precisions:
+            upsampler = RealESRGANer(
+                scale=4,
+                model_path=model_path,
+                model=build_model(arch),
+                tile=args.tile,
+                tile_pad=args.tile_pad,
+                pre_pad=0,
+                device=device,
+                precision=precision)
+            # silence the per-tile logs
+            with contextlib.redirect_stdout(io.StringIO()):
+                upsampler.enhance(img)  # warm up
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    output, _ = upsampler.enhance(img)
+                elapsed = (time.perf_counter() - start) / args.repeat
+            if reference is None:
+                reference = output
+            psnr = calculate_psnr(output, reference, crop_border=0)
+            print(f'{arch} {precision:4s} (resolved to {upsampler.precision}): {elapsed / megapixels:.3f} s/MP, '
+                  f'PSNR against {args.precisions[0]}: {psnr:.2f} dB')
+
+
+if __name__ == '__main__':
+    """Compare the inference time per megapixel of RealESRGANer with each precision, with random weights.
+
+    The first precision is the reference of the PSNR, e.g., fp32 against bf16 autocast on cpu.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--archs', type=str, nargs='+', default=['srvgg', 'rrdb'], help='Options: srvgg | rrdb')
+    parser.add_argument(
+        '--precisions', type=str, nargs='+', default=['fp32', 'bf16'], help='Options: fp32 | fp16 | bf16 | auto')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='Device')
+    parser.add_argument('--size', type=int, default=256, help='Size of the square input image')
+    parser.add_argument('--tile', type=int, default=128, help='Tile size, 0 for no tile')
+    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads(), help='Number of CPU threads')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,60 @@
+import argparse
+import multiprocessing
+import resource
+import time
+import torch
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact, SRVGGNetCompactInference
+
+
+def run(arch, args):
+    """Time a forward pass of one variant, and measure its peak memory in MB (peak RSS on cpu)."""
+    torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    net_class = {'base': SRVGGNetCompact, 'inference': SRVGGNetCompactInference}[arch]
+    net = net_class(num_feat=args.num_feat, num_conv=args.num_conv, upscale=args.scale, act_type='prelu')
+    net = net.eval().to(device)
+    img = torch.rand(1, 3, args.size, args.size, device=device)
+    with torch.no_grad():
+        output = net(img)  # warm up
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+            torch.cuda.reset_peak_memory_stats(device)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            output = net(img)
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+    elapsed = (time.perf_counter() - start) / args.repeat
+    if device.type == 'cuda':
+        peak = torch.cuda.max_memory_allocated(device) / 1024**2
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return elapsed, peak, output.cpu()
+
+
+def main(args):
+    # each variant runs in a fresh process, so that the peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    outputs = {}
+    for arch in ['base', 'inference']:
+        with context.Pool(1) as pool:
+            elapsed, peak, outputs[arch] = pool.apply(run, (arch, args))
+        print(f'{arch:9s}: {elapsed * 1000:.1f} ms, peak memory {peak:.0f} MB')
+    print(f'identical outputs: {torch.equal(outputs["base"], outputs["inference"])}')
+
+
+if __name__ == '__main__':
+    """Compare the latency and the peak memory of SRVGGNetCompact and SRVGGNetCompactInference, with random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='Device')
+    parser.add_argument('--size', type=int, default=512, help='Size of the square input image')
+    parser.add_argument('--scale', type=int, default=4, help='Upsampling scale')
+    parser.add_argument('--num_feat', type=int, default=64, help='Channel number of intermediate features')
+    parser.add_argument('--num_conv', type=int, default=16, help='Number of convolution layers in the body')
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads(), help='Number of CPU threads')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,59 @@
+import argparse
+import numpy as np
+import time
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+
+from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def build_model(arch):
+    if arch == 'srvgg':
+        return SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
+
+
+def main(args):
+    torch.manual_seed(0)
+    model = build_model(args.arch)
+    model_path = f'/tmp/benchmark_{args.arch}.pth'
+    torch.save({'params': model.state_dict()}, model_path)
+    upsampler = RealESRGANer(
+        scale=4,
+        model_path=model_path,
+        model=model,
+        tile=args.tile,
+        tile_pad=args.tile_pad,
+        pre_pad=0,
+        device=torch.device('cpu'))
+    img = np.random.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+
+    reference = None
+    for tile_batch_size in args.batch_sizes:
+        upsampler.tile_batch_size = tile_batch_size
+        upsampler.enhance(img)  # warm up
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            output, _ = upsampler.enhance(img)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        if reference is None:
+            reference = output
+        max_diff = np.abs(output.astype(np.int16) - reference.astype(np.int16)).max()
+        megapixels = args.size * args.size / 1e6
+        print(f'tile_batch_size {tile_batch_size:3d}: {elapsed:.3f} s/img, {megapixels / elapsed:.4f} MP/s, '
+              f'max diff to batch {args.batch_sizes[0]}: {max_diff}')
+
+
+if __name__ == '__main__':
+    """Benchmark the batched tile inference of RealESRGANer on CPU with random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--arch', type=str, default='srvgg', help='Network architecture. Options: srvgg | rrdb')
+    parser.add_argument('--size', type=int, default=256, help='Size of the square input image')
+    parser.add_argument('--tile', type=int, default=32, help='Tile size')
+    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Tile batch sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs for each batch size')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,54 @@
+import argparse
+import numpy as np
+import time
+import torch
+
+from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def document(size, seed=0):
+    """A synthetic scanned page: a white background with lines of random glyph-like blocks and wide margins."""
+    rng = np.random.RandomState(seed)
+    img = np.full((size, size, 3), 255, dtype=np.uint8)
+    margin = size // 8
+    for y in range(margin, size - margin, 48):
+        for x in range(margin, size - margin, 12):
+            if rng.rand() < 0.7:
+                img[y:y + 16, x:x + 8] = rng.randint(0, 96)
+    return img
+
+
+def main(args):
+    torch.manual_seed(0)
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    model_path = '/tmp/benchmark_srvgg.pth'
+    torch.save({'params': model.state_dict()}, model_path)
+    img = document(args.size)
+    megapixels = args.size * args.size / 1e6
+
+    reference = None
+    for tile_dedup in [False, True]:
+        upsampler = RealESRGANer(
+            4, model_path, model=model, tile=args.tile, pre_pad=0, device=args.device, tile_dedup=tile_dedup)
+        upsampler.enhance(img[:64, :64])  # warm up
+        start = time.perf_counter()
+        output, _ = upsampler.enhance(img)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = output
+        print(f'tile_dedup={str(tile_dedup):5s}: {megapixels / elapsed:.4f} MP/s, {elapsed:.2f} s, '
+              f'{len(upsampler.tile_plan)} tiles, hit rate {upsampler.tile_hit_rate:.1%}, '
+              f'identical: {np.array_equal(output, reference)}')
+
+
+if __name__ == '__main__':
+    """Compare the wall time of RealESRGANer on a synthetic document page, with and without the tile deduplication,
+    with random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='Device')
+    parser.add_argument('--size', type=int, default=1024, help='Size of the square page')
+    parser.add_argument('--tile', type=int, default=64, help='Tile size')
+    args = parser.parse_args()
+
+    main(args)
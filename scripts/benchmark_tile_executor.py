@@ -0,0 +1,64 @@
+import argparse
+import contextlib
+import io
+import numpy as np
+import os
+import time
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+
+from realesrgan import RealESRGANer, TileExecutor
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def build_model(arch):
+    if arch == 'srvgg':
+        return SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu')
+    return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4)
+
+
+def timed_enhance(upsampler, img, repeat):
+    # silence the per-tile logs
+    with contextlib.redirect_stdout(io.StringIO()):
+        upsampler.enhance(img)  # warm up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            output, _ = upsampler.enhance(img)
+    return (time.perf_counter() - start) / repeat, output
+
+
+def main(args):
+    img = np.random.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+    megapixels = args.size * args.size / 1e6
+    torch.manual_seed(0)
+    model = build_model(args.arch)
+    model_path = f'/tmp/benchmark_{args.arch}.pth'
+    torch.save({'params': model.state_dict()}, model_path)
+    upsampler = RealESRGANer(
+        scale=4, model_path=model_path, model=model, tile=args.tile, tile_pad=args.tile_pad, pre_pad=0, device='cpu')
+
+    # the single-worker path uses all the cores for intra-op parallelism
+    elapsed, reference = timed_enhance(upsampler, img, args.repeat)
+    print(f'{args.arch} in process         : {megapixels / elapsed:.4f} MP/s')
+    for num_workers in args.num_workers:
+        with TileExecutor(upsampler, num_workers=num_workers) as executor:
+            upsampler.executor = executor
+            elapsed, output = timed_enhance(upsampler, img, args.repeat)
+        upsampler.executor = None
+        print(f'{args.arch} {num_workers:2d} workers x {max(1, os.cpu_count() // num_workers):2d} threads: '
+              f'{megapixels / elapsed:.4f} MP/s, identical to in process: {np.array_equal(output, reference)}')
+
+
+if __name__ == '__main__':
+    """Compare the CPU throughput of RealESRGANer on one image, in process and with a TileExecutor of several
+    worker processes, with random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--arch', type=str, default='srvgg', help='Options: srvgg | rrdb')
+    parser.add_argument('--num_workers', type=int, nargs='+', default=[1, 2, 4], help='Numbers of worker processes')
+    parser.add_argument('--size', type=int, default=512, help='Size of the square input image')
+    parser.add_argument('--tile', type=int, default=128, help='Tile size')
+    parser.add_argument('--tile_pad', type=int, default=10, help='Tile padding')
+    parser.add_argument('--repeat', type=int, default=2, help='Number of timed runs')
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,55 @@
+import argparse
+import cv2
+import glob
+import os
+import time
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+
+from realesrgan import RealESRGANer, TileRouter
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+
+def build_upsampler(model, name, **kwargs):
+    model_path = f'/tmp/benchmark_{name}.pth'
+    torch.save({'params': model.state_dict()}, model_path)
+    return RealESRGANer(4, model_path, model=model, pre_pad=0, device=torch.device('cpu'), **kwargs)
+
+
+def main(args):
+    torch.manual_seed(0)
+    heavy = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=args.num_block, num_grow_ch=32, scale=4)
+    compact = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu')
+    compact = build_upsampler(compact, 'compact')
+    router = TileRouter(compact, thresholds=args.thresholds)
+
+    paths = sorted(glob.glob(os.path.join(args.input, '*')))
+    for path in paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        megapixels = img.shape[0] * img.shape[1] / 1e6
+        results = []
+        for tile_router in [None, router]:
+            upsampler = build_upsampler(heavy, 'heavy', tile=args.tile, tile_router=tile_router)
+            start = time.perf_counter()
+            upsampler.enhance(img)
+            results.append((time.perf_counter() - start, upsampler.tile_routes))
+        (plain, _), (routed, routes) = results
+        mix = ', '.join(f'{tier} {n}' for tier, n in routes.items())
+        print(f'{os.path.basename(path):24s}: heavy only {megapixels / plain:.4f} MP/s, '
+              f'routed {megapixels / routed:.4f} MP/s ({plain / routed:.2f}x), routes: {mix}')
+
+
+if __name__ == '__main__':
+    """Compare the CPU throughput of RealESRGANer with the network on every tile, and with a TileRouter sending the
+    flat tiles to bicubic and the medium tiles to a compact network, on a folder of images, with random weights"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', type=str, default='inputs', help='Input folder')
+    parser.add_argument('--num_block', type=int, default=23, help='Number of RRDB blocks of the heavy network')
+    parser.add_argument('--tile', type=int, default=64, help='Tile size')
+    parser.add_argument(
+        '--thresholds', type=float, nargs=2, default=[0.015, 0.05], help='Flat and medium gradient energy thresholds')
+    args = parser.parse_args()
+
+    main(args)
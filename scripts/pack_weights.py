@@ -0,0 +1,38 @@
+import argparse
+import glob
+import os
+import torch
+
+from realesrgan.utils import pack_weights
+
+
+def main(args):
+    if os.path.isfile(args.input):
+        paths = [args.input]
+    else:
+        paths = sorted(glob.glob(os.path.join(args.input, '*.pth')))
+    dtype = torch.float16 if args.fp16 else torch.float32
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        suffix = '-fp16' if args.fp16 else ''
+        save_path = os.path.join(args.output or os.path.dirname(path), f'{stem}{suffix}.safetensors')
+        pack_weights(path, save_path, key=args.key, dtype=dtype)
+        print(f'{path} ({os.path.getsize(path) / 1024**2:.1f} MB) -> '
+              f'{save_path} ({os.path.getsize(save_path) / 1024**2:.1f} MB)')
+
+
+if __name__ == '__main__':
+    """Pack .pth checkpoints into .safetensors files, with the inference parameters only and in the inference dtype.
+
+    The packed files are memory-mapped and pickle-free. They are picked up by the model zoo when they are next to the
+    original weights, e.g., weights/RealESRGAN_x4plus-fp16.safetensors for half precision.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', type=str, default='weights', help='Input .pth checkpoint or folder')
+    parser.add_argument('--output', type=str, default=None, help='Output folder. Default: the input folder')
+    parser.add_argument(
+        '--key', type=str, default=None, help='Key of the parameters. Default: params_ema if present, else params')
+    parser.add_argument('--fp16', action='store_true', help='Pack the parameters in half precision')
+    args = parser.parse_args()
+
+    main(args)
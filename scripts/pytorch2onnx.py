@@ -1,36 +1,38 @@
 import argparse
-import torch
-import torch.onnx
-from basicsr.archs.rrdbnet_arch import RRDBNet
+import os
+
+from realesrgan import MODEL_ZOO, build_model, export_onnx, get_model_path, load_params
 
 
 def main(args):
-    # An instance of the model
-    model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
-    if args.params:
-        keyname = 'params'
-    else:
-        keyname = 'params_ema'
-    model.load_state_dict(torch.load(args.input)[keyname])
-    # set the train mode to false since we will only run the forward pass.
-    model.train(False)
-    model.cpu().eval()
+    names = list(MODEL_ZOO) if args.model_name == 'all' else [args.model_name]
+    os.makedirs(args.output, exist_ok=True)
+    for name in names:
+        model, _ = build_model(name)
+        model_path = args.input or get_model_path(name)
+        # packed .safetensors weights only hold one parameter set
+        model.load_state_dict(load_params(model_path, key='params' if args.params else None))
 
-    # An example input
-    x = torch.rand(1, 3, 64, 64)
-    # Export the model
-    with torch.no_grad():
-        torch_out = torch.onnx._export(model, x, args.output, opset_version=11, export_params=True)
-    print(torch_out.shape)
+        save_path = os.path.join(args.output, f'{name}.onnx')
+        export_onnx(model, save_path, opset_version=args.opset_version)
+        print(f'{model_path} -> {save_path}')
 
 
 if __name__ == '__main__':
-    """Convert pytorch model to onnx models"""
+    """Convert pytorch models of the model zoo to onnx models, with dynamic batch size, height and width"""
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        '--input', type=str, default='experiments/pretrained_models/RealESRGAN_x4plus.pth', help='Input model path')
-    parser.add_argument('--output', type=str, default='realesrgan-x4.onnx', help='Output onnx path')
-    parser.add_argument('--params', action='store_false', help='Use params instead of params_ema')
+        '-n', '--model_name', type=str, default='all', help=f'Model names: all | {" | ".join(MODEL_ZOO)}')
+    parser.add_argument(
+        '--input',
+        type=str,
+        default=None,
+        help='Input model path, for one model of -n. Default: the weights of the model zoo')
+    parser.add_argument('--output', type=str, default='weights', help='Output folder of the onnx models')
+    parser.add_argument('--params', action='store_true', help='Use params instead of params_ema')
+    parser.add_argument('--opset_version', type=int, default=11, help='ONNX opset version')
     args = parser.parse_args()
+    if args.input is not None and args.model_name == 'all':
+        parser.error('--input is the checkpoint of one architecture, name its model with -n')
 
     main(args)
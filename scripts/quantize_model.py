@@ -0,0 +1,68 @@
+import argparse
+import cv2
+import glob
+import os
+import time
+import torch
+from basicsr.metrics import calculate_psnr
+
+from realesrgan import RealESRGANer, build_model, get_model_path, load_calibration_patches, quantize_model
+
+
+def timed_enhance(upsampler, images):
+    upsampler.enhance(images[0])  # warm up
+    start = time.perf_counter()
+    outputs = [upsampler.enhance(img)[0] for img in images]
+    return time.perf_counter() - start, outputs
+
+
+def main(args):
+    os.makedirs(args.output, exist_ok=True)
+    patches = load_calibration_patches(args.calib, args.patch_size, args.num_patches)
+    paths = sorted(glob.glob(os.path.join(args.eval or args.calib, '*')))
+    images = [img for img in (cv2.imread(path, cv2.IMREAD_COLOR) for path in paths) if img is not None]
+    device = torch.device('cpu')
+    # the INT8 networks are run with the engine they are quantized for
+    torch.backends.quantized.engine = args.backend
+
+    for name in args.model_names:
+        model, netscale = build_model(name)
+        model_path = get_model_path(name, args.model_dir)
+        fp32 = RealESRGANer(netscale, model_path, model=model, tile=args.tile, pre_pad=0, device=device)
+
+        save_path = os.path.join(args.output, f'{name}-int8.pt')
+        torch.jit.save(quantize_model(fp32.model, patches, backend=args.backend), save_path)
+        int8 = RealESRGANer(netscale, save_path, tile=args.tile, pre_pad=0, device=device)
+
+        fp32_time, fp32_outputs = timed_enhance(fp32, images)
+        int8_time, int8_outputs = timed_enhance(int8, images)
+        psnr = sum(calculate_psnr(a, b, crop_border=0) for a, b in zip(fp32_outputs, int8_outputs)) / len(images)
+        print(f'{name}: saved to {save_path}. fp32 {fp32_time:.2f} s, int8 {int8_time:.2f} s, '
+              f'speedup {fp32_time / int8_time:.2f}x, PSNR of int8 against fp32 {psnr:.2f} dB')
+
+
+if __name__ == '__main__':
+    """INT8 post-training quantization of the models of the zoo, for cpu inference.
+
+    The activation ranges are calibrated on patches of the images of a folder. It reports the speedup and the PSNR
+    drift of the INT8 model against the fp32 one, to decide per model whether to deploy it.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-n',
+        '--model_names',
+        type=str,
+        nargs='+',
+        default=['realesr-animevideov3', 'realesr-general-x4v3'],
+        help='Model names of the model zoo')
+    parser.add_argument('--calib', type=str, default='inputs', help='Folder of the calibration images')
+    parser.add_argument('--eval', type=str, default=None, help='Folder of the evaluation images. Default: --calib')
+    parser.add_argument('--model_dir', type=str, default=None, help='Folder of the fp32 weights')
+    parser.add_argument('--output', type=str, default='weights', help='Output folder of the INT8 models')
+    parser.add_argument('--patch_size', type=int, default=128, help='Size of the calibration patches')
+    parser.add_argument('--num_patches', type=int, default=32, help='Number of calibration patches')
+    parser.add_argument('--tile', type=int, default=256, help='Tile size of the evaluation, 0 for no tile')
+    parser.add_argument('--backend', type=str, default='x86', help='Quantized engine. Options: x86 | fbgemm | qnnpack')
+    args = parser.parse_args()
+
+    main(args)
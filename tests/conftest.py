@@ -0,0 +1,15 @@
+import torch
+
+from realesrgan.utils import RealESRGANer
+
+
+def save_checkpoint(model, model_path):
+    """Save the (random) weights of the given model as a BasicSR checkpoint, and return its path."""
+    torch.save({'params': model.state_dict()}, model_path)
+    return model_path
+
+
+def build_restorer(tmp_path, model, scale=4, name='net', **kwargs):
+    """Build a RealESRGANer on cpu with the (random) weights of the given model, saved in tmp_path."""
+    model_path = save_checkpoint(model, str(tmp_path / f'{name}.pth'))
+    return RealESRGANer(scale, model_path, model=model, device=torch.device('cpu'), **kwargs)
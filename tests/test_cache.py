@@ -0,0 +1,75 @@
+import numpy as np
+import os
+from conftest import build_restorer
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+from realesrgan.cache import ResultCache
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_size=3000)
+    img = np.random.randint(0, 256, (8, 8, 3), dtype=np.uint8)
+    key = cache.key(img, outscale=2, weights='a')
+    # every pixel and every option is in the key
+    assert key == cache.key(img.copy(), weights='a', outscale=2)
+    assert key != cache.key(img, outscale=3, weights='a')
+    assert key != cache.key(img[..., ::-1], outscale=2, weights='a')
+    assert key != cache.key(img.reshape(4, 16, 3), outscale=2, weights='a')
+
+    assert cache.get(key) is None
+    outputs = [np.full((20, 20, 3), i, dtype=np.uint8) for i in range(3)]
+    keys = [f'{i}' for i in range(3)]
+    cache.put(keys[0], outputs[0])
+    cache.put(keys[1], outputs[1])
+    np.testing.assert_array_equal(cache.get(keys[0]), outputs[0])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # the least recently used result is evicted over the size cap
+    cache.put(keys[2], outputs[2])
+    assert list(cache.entries) == ['0', '2']
+    assert cache.get(keys[1]) is None
+    assert cache.size <= cache.max_size
+
+    # the results persist on disk
+    cache = ResultCache(str(tmp_path / 'cache'), max_size=3000)
+    assert set(cache.entries) == {'0', '2'}
+    np.testing.assert_array_equal(cache.get(keys[2]), outputs[2])
+    # the size is the one of the files on disk, with the results written by another instance
+    other = ResultCache(str(tmp_path / 'cache'))
+    other.put('3', outputs[0][:10])
+    cache.get('3')
+    assert cache.size == sum(os.path.getsize(cache._path(key)) for key in cache.entries)
+
+
+def test_enhance_result_cache(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    cache = ResultCache(str(tmp_path / 'cache'))
+    restorer = build_restorer(tmp_path, model, result_cache=cache)
+    img = np.random.randint(0, 256, (24, 20, 4), dtype=np.uint8)
+
+    expected, _ = restorer.enhance(img, outscale=2)
+    output, img_mode = restorer.enhance(img, outscale=2)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert img_mode == 'RGBA'
+    np.testing.assert_array_equal(output, expected)
+
+    # the other options, and other weights, are cached separately
+    restorer.enhance(img, outscale=2, alpha_upsampler='bicubic')
+    restorer.enhance(img)
+    assert cache.misses == 3
+    other = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    restorer = build_restorer(tmp_path, other, name='other', result_cache=cache)
+    restorer.enhance(img, outscale=2)
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    # the tile grid changes the output
+    params = restorer.cache_params()
+    restorer.balanced_tiles = False
+    assert restorer.cache_params() != params
+
+    # weights which cannot be identified, e.g., of an ONNX Runtime session without its file, are not cached
+    restorer.weights_hash = lambda: None
+    assert restorer.cache_params() is None
+    num_entries = len(cache.entries)
+    restorer.enhance(img)
+    assert (cache.hits, cache.misses) == (1, 4) and len(cache.entries) == num_entries
@@ -0,0 +1,50 @@
+import copy
+import numpy as np
+import torch
+from conftest import build_restorer
+
+from realesrgan import executor as executor_module
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+from realesrgan.executor import TileExecutor
+
+
+class OomNet(SRVGGNetCompact):
+    """A network which runs out of memory on inputs wider than 28 pixels, in the worker processes too."""
+
+    def forward(self, x):
+        if x.shape[3] > 28:
+            raise RuntimeError('CUDA out of memory. Tried to allocate 2.00 GiB')
+        return super().forward(x)
+
+
+def worker_shares_parameters():
+    return all(param.is_shared() for param in executor_module._worker.model.parameters())
+
+
+def test_tile_executor(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    img = np.random.randint(0, 256, (45, 61, 4), dtype=np.uint8)
+
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), tile=16)
+    with TileExecutor(restorer, num_workers=2, num_threads=torch.get_num_threads()) as executor:
+        # the tile batches are formed by the upsampler, and run by any worker
+        for tile_batch_size in [1, 2]:
+            restorer.tile_batch_size = tile_batch_size
+            restorer.executor = None
+            expected, _ = restorer.enhance(img)
+            restorer.executor = executor
+            output, img_mode = restorer.enhance(img)
+            assert img_mode == 'RGBA'
+            assert np.array_equal(output, expected)
+        assert restorer.tile_timings['forward'] > 0
+        # the cpu workers map the parameters of the network from shared memory
+        assert all(executor.pool.apply(worker_shares_parameters) for _ in range(2))
+
+    # out of memory errors in the workers are retried with smaller inputs
+    model = OomNet(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    restorer = build_restorer(tmp_path, model, tile=24, tile_pad=4, pre_pad=0)
+    expected, _ = restorer.enhance(img)
+    with TileExecutor(restorer, num_workers=2, num_threads=1) as executor:
+        restorer.executor = executor
+        output, _ = restorer.enhance(img)
+    assert np.array_equal(output, expected)
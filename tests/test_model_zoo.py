@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+import os
+import pytest
+import torch
+from conftest import save_checkpoint
+
+from realesrgan.model_zoo import MODEL_ZOO, ModelPool, build_model, get_model_path, get_native_model, select_model
+from realesrgan.tiling import receptive_field_radius
+from realesrgan.utils import pack_weights
+
+
+def save_weights(model_dir, name, wdn=False):
+    """Save random weights of a zoo model in model_dir, so that nothing is downloaded."""
+    model, _ = build_model(name)
+    url = MODEL_ZOO[name]['wdn_url' if wdn else 'url']
+    save_checkpoint(model, os.path.join(model_dir, os.path.basename(url)))
+
+
+def test_build_model():
+    model, netscale = build_model('realesr-animevideov3')
+    assert type(model).__name__ == 'SRVGGNetCompactInference' and model.num_conv == 16 and netscale == 4
+    assert MODEL_ZOO['RealESRGAN_x2plus']['netscale'] == 2
+    with pytest.raises(ValueError):
+        build_model('unknown')
+
+
+def test_get_native_model():
+    assert get_native_model('RealESRGAN_x4plus', 2) == 'RealESRGAN_x2plus'
+    assert get_native_model('RealESRGAN_x4plus', 2.0) == 'RealESRGAN_x2plus'
+    # no native model for the other scales and families, and a named x2 model is kept at the default 4x output
+    for name, outscale in [('RealESRGAN_x4plus', None), ('RealESRGAN_x4plus', 4), ('RealESRGAN_x4plus', 2.5),
+                           ('RealESRGAN_x4plus', 3), ('realesr-animevideov3', 2), ('RealESRGAN_x2plus', 4)]:
+        assert get_native_model(name, outscale) == name
+
+
+def test_select_model(caplog):
+    # line art: flat colours and clean lines
+    line_art = np.full((300, 400, 3), 255, dtype=np.uint8)
+    cv2.circle(line_art, (200, 150), 100, (40, 120, 230), -1)
+    cv2.rectangle(line_art, (20, 20), (120, 260), (0, 0, 0), 3)
+    # detailed: noisy texture
+    detailed = np.random.RandomState(0).randint(0, 256, (300, 400, 3), dtype=np.uint8)
+
+    with caplog.at_level('INFO', logger='realesrgan.model_zoo'):
+        assert select_model(line_art, 'fast') == 'realesr-animevideov3'
+        assert select_model(line_art) == 'realesr-animevideov3'
+        assert select_model(line_art, 'best') == 'RealESRGAN_x4plus_anime_6B'
+        assert select_model(detailed, 'fast') == 'realesr-general-x4v3'
+        assert select_model(detailed) == 'RealESRGAN_x4plus'
+    # the decisions are logged with their content class and relative cost
+    records = [record for record in caplog.records if hasattr(record, 'model')]
+    assert [record.content for record in records] == ['line art'] * 3 + ['detailed'] * 2
+    assert records[0].cost == MODEL_ZOO['realesr-animevideov3']['kmacs'] / MODEL_ZOO['RealESRGAN_x4plus']['kmacs']
+    with pytest.raises(ValueError):
+        select_model(line_art, 'medium')
+
+
+def test_model_pool(tmp_path):
+    model_dir = str(tmp_path)
+    save_weights(model_dir, 'realesr-animevideov3')
+    save_weights(model_dir, 'realesr-general-x4v3')
+    save_weights(model_dir, 'realesr-general-x4v3', wdn=True)
+    assert get_model_path('realesr-animevideov3', model_dir) == os.path.join(model_dir, 'realesr-animevideov3.pth')
+
+    pool = ModelPool(max_memory=None)
+    device = torch.device('cpu')
+    upsampler = pool.get('realesr-animevideov3', device=device, model_dir=model_dir, tile=32)
+    assert upsampler.tile_size == 32 and pool.misses == 1
+    # warm upsamplers are reused, with the new options
+    assert pool.get('realesr-animevideov3', device=device, model_dir=model_dir, tile_pad=4, pre_pad=2) is upsampler
+    assert (upsampler.tile_size, upsampler.tile_pad, upsampler.pre_pad) == (0, 4, 2) and pool.hits == 1
+    # normalized as in the constructor
+    pool.get('realesr-animevideov3', device=device, model_dir=model_dir, tile_pad='exact', tile_batch_size=0)
+    assert upsampler.tile_pad == receptive_field_radius(upsampler.model) and upsampler.tile_batch_size == 1
+    with pytest.raises(ValueError):
+        pool.get('realesr-animevideov3', device=device, model_dir=model_dir, dni_weight=[1, 0])
+    # the compiled networks are other upsamplers
+    compiled = pool.get('realesr-animevideov3', device=device, model_dir=model_dir, compile_mode='trace')
+    assert compiled is not upsampler and compiled.compile_mode == 'trace'
+    pool.upsamplers.popitem()
+
+    # the weak-denoise weights are only loaded for a denoise strength which needs them
+    denoise = pool.get('realesr-general-x4v3', device=device, model_dir=model_dir)
+    assert denoise.dni_params is None
+    expected = ModelPool().get(
+        'realesr-general-x4v3', device=device, model_dir=model_dir, denoise_strength=0.5).model.state_dict()
+    # the denoise strength is changed in place
+    assert pool.get('realesr-general-x4v3', device=device, model_dir=model_dir, denoise_strength=0.5) is denoise
+    assert denoise.dni_weight == (0.5, 0.5)
+    assert all(torch.equal(v, expected[k]) for k, v in denoise.model.state_dict().items())
+    assert pool.get('realesr-general-x4v3', device=device, model_dir=model_dir) is denoise
+    assert denoise.dni_weight == (1, 0)
+    assert pool.get('realesr-animevideov3', device=device, model_dir=model_dir, denoise_strength=0.5) is upsampler
+    # the weak-denoise weights of custom weights are next to them
+    model_path = os.path.join(model_dir, 'realesr-general-x4v3.pth')
+    custom = ModelPool().get('realesr-general-x4v3', device=device, model_path=model_path, denoise_strength=0.5)
+    assert custom.dni_weight == (0.5, 0.5)
+    assert all(torch.equal(v, expected[k]) for k, v in custom.model.state_dict().items())
+    renamed_path = os.path.join(model_dir, 'custom.pth')
+    os.rename(model_path, renamed_path)
+    with pytest.raises(ValueError):
+        ModelPool().get('realesr-general-x4v3', device=device, model_path=renamed_path, denoise_strength=0.5)
+    assert len(pool.upsamplers) == 2 and pool.misses == 3
+
+    # a model of the native output scale is preferred
+    save_weights(model_dir, 'RealESRGAN_x2plus')
+    native = pool.get('RealESRGAN_x4plus', device=device, model_dir=model_dir, outscale=2)
+    assert native.scale == 2 and pool.misses == 4
+    pool.upsamplers.popitem()
+
+    # least recently used upsamplers are evicted under the memory cap
+    pool.max_memory = pool.memory - 1
+    pool.evict()
+    assert list(pool.upsamplers.values()) == [upsampler]
+
+
+def test_get_packed_model_path(tmp_path):
+    model_dir = str(tmp_path)
+    save_weights(model_dir, 'realesr-animevideov3')
+    pth_path = os.path.join(model_dir, 'realesr-animevideov3.pth')
+    assert get_model_path('realesr-animevideov3', model_dir, half=True) == pth_path
+    # packed weights are preferred, in half precision first for half models
+    packed_path = os.path.join(model_dir, 'realesr-animevideov3.safetensors')
+    packed_half_path = os.path.join(model_dir, 'realesr-animevideov3-fp16.safetensors')
+    pack_weights(pth_path, packed_path)
+    pack_weights(pth_path, packed_half_path, dtype=torch.float16)
+    assert get_model_path('realesr-animevideov3', model_dir) == packed_path
+    assert get_model_path('realesr-animevideov3', model_dir, half=True) == packed_half_path
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+from conftest import save_checkpoint
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact, SRVGGNetCompactInference
+from realesrgan.onnx_backend import export_onnx, load_onnx_session
+from realesrgan.utils import RealESRGANer
+
+pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+
+
+def test_onnx_backend(tmp_path):
+    torch.manual_seed(0)
+    models = [
+        (SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu'), 4),
+        # the zoo variant is exported as the plain network
+        (SRVGGNetCompactInference(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu'), 4),
+        (RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=8, num_block=1, num_grow_ch=4, scale=2), 2),
+    ]
+    img = np.random.randint(0, 256, (21, 26, 4), dtype=np.uint8)
+    for model, scale in models:
+        model_path = save_checkpoint(model, str(tmp_path / 'net.pth'))
+        onnx_path = str(tmp_path / 'net.onnx')
+        export_onnx(model, onnx_path)
+
+        # dynamic batch size, height and width
+        session = load_onnx_session(onnx_path)
+        for shape in [(1, 3, 16, 16), (2, 3, 20, 28)]:
+            x = torch.rand(shape)
+            with torch.no_grad():
+                expected = model(x).numpy()
+            output = session.run(None, {'input': x.numpy()})[0]
+            assert output.shape == expected.shape
+            assert np.abs(output - expected).max() < 1e-4
+
+        # tiles, alpha and outscale work the same as with the PyTorch network
+        for tile in [0, 8]:
+            kwargs = dict(tile=tile, tile_pad=4, pre_pad=2, device=torch.device('cpu'))
+            restorer = RealESRGANer(scale, model_path, model=model, **kwargs)
+            onnx_restorer = RealESRGANer(scale, None, model=session, **kwargs)
+            for outscale in [None, 3]:
+                expected, _ = restorer.enhance(img, outscale=outscale)
+                output, img_mode = onnx_restorer.enhance(img, outscale=outscale)
+                assert img_mode == 'RGBA' and output.shape == expected.shape
+                assert np.abs(output.astype(np.int16) - expected).max() <= 1
+        # an ONNX file as model_path
+        expected, _ = RealESRGANer(scale, model_path, model=model, pre_pad=2, device=torch.device('cpu')).enhance(img)
+        output, _ = RealESRGANer(scale, onnx_path, pre_pad=2, device=torch.device('cpu')).enhance(img)
+        assert np.abs(output.astype(np.int16) - expected).max() <= 1
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import torch
+from basicsr.archs.rrdbnet_arch import RRDBNet
+from conftest import save_checkpoint
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompactInference
+from realesrgan.quantization import load_calibration_patches, quantize_model
+from realesrgan.utils import RealESRGANer
+
+
+def test_quantize_model(tmp_path):
+    torch.manual_seed(0)
+    patches = load_calibration_patches('tests/data/gt', patch_size=30, num_patches=4)
+    assert len(patches) == 4 and all(patch.shape == (1, 3, 28, 28) for patch in patches)
+
+    img = cv2.imread('tests/data/gt/baboon.png', cv2.IMREAD_COLOR)[:40, :52]
+    models = [
+        # the variant of the model zoo, quantized as the plain network
+        (SRVGGNetCompactInference(num_in_ch=3, num_out_ch=3, num_feat=16, num_conv=4, upscale=4, act_type='prelu'), 4),
+        (RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=16, num_block=1, num_grow_ch=8, scale=2), 2),
+    ]
+    for model, scale in models:
+        # small weights, so that the output stays close to the input image
+        for param in model.parameters():
+            param.data *= 0.3
+        model_path = save_checkpoint(model, str(tmp_path / 'net.pth'))
+        quantized_path = str(tmp_path / 'net-int8.pt')
+        torch.jit.save(quantize_model(model, patches), quantized_path)
+
+        # RealESRGANer loads the INT8 network directly, with tiles of any shape
+        expected, _ = RealESRGANer(scale, model_path, model=model, tile=24, device=torch.device('cpu')).enhance(img)
+        output, _ = RealESRGANer(scale, quantized_path, tile=24, device=torch.device('cpu')).enhance(img)
+        assert output.shape == expected.shape
+        mse = np.mean((output.astype(np.float64) - expected)**2)
+        assert 10 * np.log10(255**2 / mse) > 30
+
+    # the process-wide quantized engine is restored
+    engine = torch.backends.quantized.engine
+    torch.backends.quantized.engine = 'fbgemm'
+    try:
+        quantize_model(model, patches[:1], backend='x86')
+        assert torch.backends.quantized.engine == 'fbgemm'
+    finally:
+        torch.backends.quantized.engine = engine
@@ -0,0 +1,89 @@
+import copy
+import numpy as np
+import pytest
+import torch
+from conftest import build_restorer
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+from realesrgan.cache import ResultCache
+from realesrgan.routing import TileRouter, classify_content, gradient_energy, image_features
+
+
+def half_flat_image():
+    """An image whose left half is flat, and right half is noise."""
+    img = np.full((64, 96, 3), 128, dtype=np.uint8)
+    img[:, 48:] = np.random.randint(0, 256, (64, 48, 3), dtype=np.uint8)
+    return img
+
+
+def test_gradient_energy():
+    flat = torch.full((1, 3, 16, 16), 0.5)
+    noise = torch.rand(1, 3, 16, 16)
+    energy = gradient_energy(torch.cat((flat, noise)))
+    assert energy[0] == 0 and energy[1] > 0.1
+
+    router = TileRouter(thresholds=(0.01, 0.1))
+    # without a compact upsampler, the medium tiles go to the network
+    assert [router.route(e) for e in [0, 0.05, 0.2]] == ['bicubic', 'heavy', 'heavy']
+    with pytest.raises(ValueError):
+        TileRouter(flat_tier='nearest')
+
+
+def test_image_features():
+    # a gray gradient, like a sky with some noise: low detail
+    gradient = np.tile(np.linspace(0, 255, 640, dtype=np.float32), (480, 1))
+    gradient = np.clip(gradient + np.random.RandomState(0).normal(0, 10, gradient.shape), 0, 255).astype(np.uint8)
+    features = image_features(gradient)
+    assert features['edge_density'] < 0.01 and features['noise'] > 2.5
+    assert classify_content(features) == 'low detail'
+    # 16-bit and RGBA images are supported
+    assert image_features(gradient.astype(np.uint16) * 257) == features
+    assert image_features(np.dstack([gradient] * 4)) == features
+
+    noise = np.random.RandomState(0).randint(0, 256, (480, 640, 3), dtype=np.uint8)
+    features = image_features(noise)
+    assert features['noise'] > 10 and features['colours'] > 100
+    assert classify_content(features) == 'detailed'
+    assert classify_content(features, {'low_detail_edges': 1, 'low_detail_noise': 255}) == 'low detail'
+
+
+def test_tile_router(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    img = half_flat_image()
+    expected, _ = build_restorer(tmp_path, copy.deepcopy(model), pre_pad=0, tile=16).enhance(img)
+
+    # the network on every tile is the plain tile process
+    router = TileRouter(thresholds=(0, 0))
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), pre_pad=0, tile=16, tile_router=router)
+    output, _ = restorer.enhance(img)
+    assert np.array_equal(output, expected)
+    assert restorer.tile_routes == {'bicubic': 0, 'compact': 0, 'heavy': len(restorer.tile_plan)}
+
+    # a compact upsampler with the same weights: the blended seams match the plain output
+    compact = build_restorer(tmp_path, copy.deepcopy(model), pre_pad=0, name='compact')
+    router = TileRouter(compact, thresholds=(0, 0.1), feather=4)
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), pre_pad=0, tile=16, tile_router=router)
+    output, _ = restorer.enhance(img)
+    assert restorer.tile_routes['compact'] > 0 and restorer.tile_routes['heavy'] > 0
+    assert np.abs(output.astype(np.int16) - expected).max() <= 1
+
+    # the flat tiles are bicubic, which keeps a flat area flat
+    router = TileRouter(compact, thresholds=(0.015, 0.05))
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), pre_pad=0, tile=16, tile_router=router)
+    output, _ = restorer.enhance(img)
+    assert output.shape == expected.shape
+    assert restorer.tile_routes['bicubic'] > 0 and restorer.tile_routes['heavy'] > 0
+    assert np.all(output[:, :100] == 128)
+
+    # the compact upsampler is keyed by its weights, even when it is the routed upsampler itself
+    params = restorer.cache_params()
+    assert params['tile_router']['compact']['weights'] == compact.weights_hash()
+    restorer.tile_router = TileRouter(restorer)
+    assert restorer.cache_params()['tile_router']['compact']['weights'] == restorer.weights_hash()
+
+    # the routes of a cached result are not known
+    restorer.result_cache = ResultCache(str(tmp_path / 'cache'))
+    restorer.enhance(img)
+    assert restorer.tile_routes is not None
+    restorer.enhance(img)
+    assert restorer.result_cache.hits == 1 and restorer.tile_routes is None
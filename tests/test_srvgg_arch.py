@@ -0,0 +1,25 @@
+import torch
+
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact, SRVGGNetCompactInference
+
+
+def test_srvggnetcompact_inference():
+    """Test arch: SRVGGNetCompactInference, against SRVGGNetCompact with the same state dict."""
+
+    img = torch.rand((2, 3, 17, 23), dtype=torch.float32)
+    for act_type in ['relu', 'prelu', 'leakyrelu']:
+        for upscale in [1, 2, 4]:
+            net = SRVGGNetCompact(num_feat=8, num_conv=2, upscale=upscale, act_type=act_type).eval()
+            inference_net = SRVGGNetCompactInference(num_feat=8, num_conv=2, upscale=upscale, act_type=act_type)
+            inference_net.load_state_dict(net.state_dict(), strict=True)
+            inference_net.eval()
+            with torch.no_grad():
+                expected = net(img)
+                output = inference_net(img)
+                # channels_last, as in the compiled mode of RealESRGANer
+                img_channels_last = img.contiguous(memory_format=torch.channels_last)
+                expected_channels_last = net(img_channels_last)
+                output_channels_last = inference_net(img_channels_last)
+            assert output.shape == (2, 3, 17 * upscale, 23 * upscale)
+            assert torch.equal(output, expected)
+            assert torch.equal(output_channels_last, expected_channels_last)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from realesrgan.tiling import plan_tiles
+
+
+def check_partition(plan, height, width, align=1):
+    coverage = np.zeros((height, width), dtype=np.int64)
+    for tile in plan:
+        start_x, end_x, start_y, end_y = tile.input
+        start_x_pad, end_x_pad, start_y_pad, end_y_pad = tile.input_pad
+        assert start_x_pad <= start_x < end_x <= end_x_pad and start_y_pad <= start_y < end_y <= end_y_pad
+        assert all(v % align == 0 for v in tile.input_pad)
+        coverage[start_y:end_y, start_x:end_x] += 1
+    assert (coverage == 1).all()
+
+
+def test_plan_tiles_legacy():
+    plan = plan_tiles(1010, 1010, 500, 10, 4, balanced=False)
+    assert (plan.tiles_x, plan.tiles_y) == (3, 3)
+    # the last column is a 10px sliver which still pays the full padding
+    assert plan.tiles[2].input == (1000, 1010, 0, 500)
+    assert plan.tiles[2].shape == (510, 20)
+    check_partition(plan, 1010, 1010)
+
+
+def test_plan_tiles_balanced():
+    legacy = plan_tiles(1010, 1010, 500, 10, 4, balanced=False)
+    plan = plan_tiles(1010, 1010, 500, 10, 4)
+    assert len(plan) < len(legacy)
+    assert plan.padding_waste < legacy.padding_waste
+    check_partition(plan, 1010, 1010)
+    # no padded tile is larger than a padded square tile
+    assert all(h * w <= 520 * 520 for h, w in (tile.shape for tile in plan))
+
+    # non-square tiles
+    plan = plan_tiles(400, 1010, 500, 10, 4)
+    assert len(plan) == 2
+    assert plan.tiles[0].input == (0, 505, 0, 400)
+    assert plan.tiles[0].output == (0, 2020, 0, 1600)
+    assert plan.tiles[0].output_crop == (0, 2020, 0, 1600)
+    assert plan.tiles[1].output_crop == (40, 2060, 0, 1600)
+
+    # aligned for networks with pixel-unshuffle
+    for height, width in [(36, 400), (64, 64), (38, 30)]:
+        check_partition(plan_tiles(height, width, 16, 3, 2, align=2), height, width, align=2)
+    check_partition(plan_tiles(5, 1000, 16, 4, 4), 5, 1000)
+
+
+def test_plan_tiles_shape():
+    # all the tiles have the padded tile shape, the border ones take more context from the image
+    plan = plan_tiles(1010, 1010, 500, 10, 4, balanced=False, tile_shape=(520, 520))
+    assert {tile.shape for tile in plan} == {(520, 520)}
+    assert plan.tiles[2].input_pad == (490, 1010, 0, 520)
+    check_partition(plan, 1010, 1010)
+    # clipped to the image size
+    plan = plan_tiles(300, 1010, 500, 10, 4, balanced=False, tile_shape=(520, 520))
+    assert {tile.shape for tile in plan} == {(300, 520)}
+    check_partition(plan, 300, 1010)
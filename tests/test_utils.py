@@ -1,7 +1,14 @@
+import copy
 import numpy as np
+import pytest
+import threading
+import torch
 from basicsr.archs.rrdbnet_arch import RRDBNet
+from conftest import build_restorer, save_checkpoint
 
-from realesrgan.utils import RealESRGANer
+from realesrgan import utils
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+from realesrgan.utils import RealESRGANer, load_params, open_memmap, pack_weights, resolve_precision
 
 
 def test_realesrganer():
@@ -85,3 +92,478 @@ def test_realesrganer():
     result = restorer.enhance(img, outscale=2, alpha_upsampler=None)
     assert result[0].shape == (8, 8, 4)
     assert result[1] == 'RGBA'
+
+
+def test_tile_batch_size(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    restorer = build_restorer(tmp_path, model, 4, tile=8, tile_pad=3, pre_pad=0)
+    img = np.random.random((29, 37, 3)).astype(np.float32)
+
+    def run_tiles(tile_batch_size):
+        restorer.tile_batch_size = tile_batch_size
+        restorer.pre_process(img)
+        restorer.tile_process()
+        return restorer.output.clone()
+
+    output = run_tiles(1)
+    output_batch = run_tiles(4)
+    assert output_batch.shape == (1, 3, 116, 148)
+    # oneDNN may pick a different convolution algorithm for a larger batch
+    assert torch.allclose(output_batch, output, atol=1e-5)
+    # with a batch-invariant convolution backend, the stitched output is bit-identical
+    with torch.backends.mkldnn.flags(enabled=False):
+        assert torch.equal(run_tiles(4), run_tiles(1))
+
+
+def test_auto_tile_size(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    budget = 64 * 1024**2
+    restorer = build_restorer(tmp_path, model, 4, tile='auto', tile_pad=10, tile_memory_budget=budget)
+    assert restorer.tile_size % 8 == 0
+    assert (restorer.tile_size + 20)**2 * restorer.activation_bytes() <= budget
+    assert (restorer.tile_size + 28)**2 * restorer.activation_bytes() > budget
+    # the per-pixel cost is cached per (arch, dtype, device)
+    assert len([key for key in RealESRGANer._activation_bytes_cache if key[0].startswith('SRVGGNetCompact')]) == 1
+    # a larger budget gives a larger tile, a tile batch shares the budget
+    assert restorer.auto_tile_size(4 * budget) > restorer.tile_size
+    restorer.tile_batch_size = 4
+    assert restorer.auto_tile_size(4 * budget) == restorer.tile_size
+
+
+def test_exact_tile_pad(tmp_path):
+    torch.manual_seed(0)
+    models = [
+        SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=4, upscale=4, act_type='prelu'),
+        RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=8, num_block=1, num_grow_ch=4, scale=2)
+    ]
+    for model in models:
+        # larger random weights than the default init, so that the whole receptive field matters
+        for param in model.parameters():
+            torch.nn.init.normal_(param, std=0.3)
+        scale = 4 if isinstance(model, SRVGGNetCompact) else 2
+        restorer = build_restorer(tmp_path, model, scale, tile=24, tile_pad='exact', pre_pad=0)
+        assert restorer.tile_pad == (6 if scale == 4 else 38)
+        img = np.random.random((100, 121, 3)).astype(np.float32)
+
+        def run(tile_pad):
+            restorer.tile_pad = tile_pad
+            restorer.pre_process(img)
+            restorer.tile_process()
+            tiled = restorer.output.clone()
+            with torch.no_grad():
+                restorer.process()
+            return tiled, restorer.output
+
+        exact_pad = restorer.tile_pad
+        with torch.backends.mkldnn.flags(enabled=False):
+            tiled, untiled = run(exact_pad)
+            assert torch.equal(tiled, untiled)
+            # the padding is minimal
+            tiled, untiled = run(exact_pad - restorer.mod_scale if scale == 2 else exact_pad - 1)
+            assert not torch.allclose(tiled, untiled, rtol=1e-4, atol=1e-4)
+        # oneDNN may pick different convolution algorithms for the tiles, only rounding errors remain
+        tiled, untiled = run(exact_pad)
+        assert (tiled - untiled).abs().max() < 1e-5 * untiled.abs().max()
+
+
+def test_enhance_to(tmp_path):
+    import tifffile
+
+    torch.manual_seed(0)
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    restorer = build_restorer(tmp_path, model, 4, tile=16, tile_pad='exact', pre_pad=3)
+    shapes = [(37, 45, 3), (37, 45), (37, 45, 4)]
+    for shape, dtype in zip(shapes + [(37, 45, 3)], [np.uint8] * 3 + [np.uint16]):
+        img = np.memmap(tmp_path / 'input.raw', dtype=dtype, mode='w+', shape=shape)
+        img[:] = np.random.randint(0, np.iinfo(dtype).max, shape)
+        for alpha_upsampler in ['realesrgan', 'bilinear']:
+            output = open_memmap(str(tmp_path / 'output.npy'), (148, 180) + shape[2:], dtype)
+            img_mode = restorer.enhance_to(img, output, alpha_upsampler=alpha_upsampler)
+
+            # same as the in-memory enhance up to rounding, as the tile pad covers the receptive field
+            restorer.tile_size = 0
+            expected, expected_mode = restorer.enhance(np.array(img), alpha_upsampler=alpha_upsampler)
+            restorer.tile_size = 16
+            assert img_mode == expected_mode
+            assert output.shape == expected.shape and output.dtype == expected.dtype
+            assert np.abs(output.astype(np.int64) - expected).max() <= 1
+
+            # tiled TIFF, in RGB(A) order
+            restorer.enhance_to_tiff(img, str(tmp_path / 'output.tif'), alpha_upsampler=alpha_upsampler)
+            output_tiff = tifffile.imread(tmp_path / 'output.tif')
+            if img_mode != 'L':
+                output_tiff = output_tiff[:, :, [2, 1, 0, 3][:shape[2]]]
+            assert np.abs(output_tiff.astype(np.int64) - expected).max() <= 1
+
+
+def test_enhance_device_io(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    restorer = build_restorer(tmp_path, model, 4, pre_pad=2)
+    for shape in [(6, 7), (6, 7, 3), (6, 7, 4)]:
+        for dtype in [np.uint8, np.uint16, np.float32]:
+            img = (np.random.random(shape) * 200).astype(dtype)
+            img_copy = img.copy()
+            output, img_mode = restorer.enhance(img)
+            assert output.shape == (24, 28) + shape[2:]
+            assert output.flags['C_CONTIGUOUS']
+            # the dtype decides the range of integer images, even when all the values are small
+            assert output.dtype == (np.uint16 if dtype == np.uint16 else np.uint8)
+            assert img_mode == {(6, 7): 'L', (6, 7, 3): 'RGB', (6, 7, 4): 'RGBA'}[shape]
+            # the input is left untouched
+            assert np.array_equal(img, img_copy)
+
+    # the device-side pre/post-processing matches the numpy one
+    img = np.random.randint(0, 65536, (6, 7, 3), dtype=np.uint16)
+    tensor, alpha, img_mode, max_range = restorer.upload(img)
+    assert alpha is None and max_range == 65535
+    assert torch.equal(tensor, torch.from_numpy((img[:, :, ::-1] / 65535).astype(np.float32)).permute(2, 0, 1)[None])
+    assert np.array_equal(restorer.download(tensor[0], max_range), img)
+
+
+def test_enhance_alpha(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    restorer = build_restorer(tmp_path, model, 4, pre_pad=2)
+    forward_batches = []
+    model.register_forward_hook(lambda module, inputs, output: forward_batches.append(inputs[0].shape[0]))
+    img = np.random.randint(0, 256, (10, 13, 4), dtype=np.uint8)
+
+    # constant and binary alpha channels are not run through the network
+    for alpha in [255, 0, 128]:
+        img[:, :, 3] = alpha
+        forward_batches.clear()
+        output, _ = restorer.enhance(img)
+        assert forward_batches == [1]
+        assert np.all(output[:, :, 3] == alpha)
+    img[:, :, 3] = 0
+    img[2:7, 3:11, 3] = 255
+    forward_batches.clear()
+    output, _ = restorer.enhance(img)
+    assert forward_batches == [1]
+    assert set(np.unique(output[:, :, 3])) == {0, 255}
+    assert np.all(output[10:26, 14:42, 3] == 255) and np.all(output[32:, :, 3] == 0)
+
+    # the same alpha channels out-of-core
+    restorer.tile_size = 8
+    forward_batches.clear()
+    restorer.enhance_to(img[:, :, 0:3], np.zeros((40, 52, 3), dtype=np.uint8))
+    num_tiles = len(forward_batches)
+    for alpha in [None, 255]:
+        if alpha is not None:
+            img[:, :, 3] = alpha
+        expected, _ = restorer.enhance(img)
+        forward_batches.clear()
+        output = np.zeros_like(expected)
+        restorer.enhance_to(img, output)
+        # only the RGB tiles are run through the network
+        assert forward_batches == [1] * num_tiles
+        assert np.array_equal(output[:, :, 3], expected[:, :, 3])
+    restorer.tile_size = 0
+
+    # the image and a real alpha channel in one batch, with or without tiles
+    img[:, :, 3] = np.random.randint(0, 256, (10, 13))
+    for tile in [0, 8]:
+        restorer.tile_size = tile
+        restorer.batch_alpha = False
+        forward_batches.clear()
+        expected, _ = restorer.enhance(img)
+        assert set(forward_batches) == {1}
+        num_forwards = len(forward_batches)
+        restorer.batch_alpha = True
+        forward_batches.clear()
+        output, _ = restorer.enhance(img)
+        assert set(forward_batches) == {2} and len(forward_batches) * 2 == num_forwards
+        assert np.abs(output.astype(np.int16) - expected).max() <= 1
+
+
+def test_set_dni_weight(tmp_path):
+    model_paths = []
+    for name in ['net_a', 'net_b']:
+        model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+        model_paths.append(save_checkpoint(model, str(tmp_path / f'{name}.pth')))
+
+    def build(dni_weight):
+        model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+        return RealESRGANer(4, model_paths, dni_weight, model, device=torch.device('cpu'))
+
+    restorer = build([0.2, 0.8])
+    restorer.dni_cache_size = 2
+    for dni_weight in [[0.7, 0.3], [0.2, 0.8], [1, 0], [0.7, 0.3]]:
+        restorer.set_dni_weight(dni_weight)
+        # same parameters as a model built with these weights
+        expected = build(dni_weight).model.state_dict()
+        for k, v in restorer.model.state_dict().items():
+            assert torch.equal(v, expected[k])
+    # the most recent blends are memoized
+    assert list(restorer._dni_blends) == [(1.0, 0.0), (0.7, 0.3)]
+
+
+def test_pack_weights(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    params = model.state_dict()
+    model_path = str(tmp_path / 'net.pth')
+    torch.save({'params': params, 'params_ema': {k: v + 1 for k, v in params.items()}}, model_path)
+
+    for dtype, half in [(torch.float32, False), (torch.float16, True)]:
+        packed_path = str(tmp_path / f'net-{dtype}.safetensors')
+        pack_weights(model_path, packed_path, dtype=dtype)
+        # only params_ema is packed, in the given dtype
+        packed = load_params(packed_path)
+        assert set(packed) == set(params) and all(v.dtype == dtype for v in packed.values())
+
+        expected = RealESRGANer(4, model_path, model=copy.deepcopy(model), half=half, device=torch.device('cpu'))
+        restorer = RealESRGANer(4, packed_path, model=copy.deepcopy(model), half=half, device=torch.device('cpu'))
+        expected, restored = expected.model.state_dict(), restorer.model.state_dict()
+        # half falls back to fp32 on cpu, the packed half parameters are upcast
+        for k, v in restored.items():
+            assert v.dtype == torch.float32 and torch.equal(v, expected[k].to(dtype).float())
+
+
+def test_compile_mode(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    img = np.random.randint(0, 256, (30, 41, 3), dtype=np.uint8)
+    # the pre-pad covers the receptive field, so that the bucketing pad does not change the output
+    for tile in [0, 12]:
+        eager = build_restorer(tmp_path, copy.deepcopy(model), 4, tile=tile, tile_pad='exact', pre_pad=4)
+        restorer = build_restorer(
+            tmp_path, copy.deepcopy(model), 4, tile=tile, tile_pad='exact', pre_pad=4, compile_mode='trace')
+        restorer.warmup()
+        warm_shapes = set(restorer.warm_shapes)
+        expected, _ = eager.enhance(img)
+        output, _ = restorer.enhance(img)
+        assert np.abs(output.astype(np.int16) - expected).max() <= 1
+        if tile:
+            # all the tiles have the padded tile shape, which is reused from the warm-up
+            assert restorer.warm_shapes == warm_shapes == {(1, 3, 20, 20)}
+        else:
+            # the whole image is padded to a bucketed shape
+            assert (1, 3, 64, 64) in restorer.warm_shapes
+
+
+def test_precision(tmp_path, monkeypatch):
+    assert resolve_precision('fp32', 'cpu') == 'fp32'
+    # no half precision convolutions on cpu
+    assert resolve_precision('fp16', 'cpu') == 'fp32'
+    assert resolve_precision('auto', 'cpu') in ('fp32', 'bf16')
+    with pytest.raises(ValueError):
+        resolve_precision('int8', 'cpu')
+
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    img = np.random.randint(0, 256, (30, 41, 3), dtype=np.uint8)
+    expected, _ = build_restorer(tmp_path, copy.deepcopy(model), 4).enhance(img)
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, half=True)
+    assert restorer.precision == 'fp32'
+    assert np.array_equal(restorer.enhance(img)[0], expected)
+
+    if resolve_precision('bf16', 'cpu') == 'bf16':
+        restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, tile=16, precision='bf16')
+        output, _ = restorer.enhance(img)
+        # the weights stay in fp32 under autocast
+        assert all(param.dtype == torch.float32 for param in restorer.model.parameters())
+        assert output.dtype == np.uint8
+        assert np.abs(output.astype(np.int16) - expected).mean() < 2
+
+        # tile='auto', and the activation memory probe of cuda devices run the network under autocast
+        restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, tile='auto', precision='bf16')
+        assert restorer.tile_size > 0 and restorer.enhance(img)[0].shape == expected.shape
+        for name in ['synchronize', 'reset_peak_memory_stats', 'empty_cache']:
+            monkeypatch.setattr(torch.cuda, name, lambda *args: None)
+        monkeypatch.setattr(torch.cuda, 'memory_allocated', lambda device: 0)
+        monkeypatch.setattr(torch.cuda, 'max_memory_allocated', lambda device: 4096)
+        assert restorer._probe_activation_bytes(probe_size=32) == 5
+
+
+def test_pipeline(tmp_path, caplog):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    img = np.random.randint(0, 256, (45, 61, 3), dtype=np.uint8)
+    restorer = build_restorer(tmp_path, model, 4, tile=16, tile_batch_size=2, pipeline=False)
+    expected, _ = restorer.enhance(img)
+    assert restorer.tile_timings['slice'] > 0 and restorer.tile_timings['stitch'] > 0
+
+    restorer.pipeline = True
+    with caplog.at_level('DEBUG', logger='realesrgan.utils'):
+        output, _ = restorer.enhance(img)
+    assert np.array_equal(output, expected)
+    timings = restorer.tile_timings
+    assert set(timings) == {'slice', 'forward', 'stitch', 'wall', 'idle'}
+    assert 0 < timings['forward'] <= timings['wall']
+    # one structured record per tile, and one for the stage timings
+    tiles = [record.tile for record in caplog.records if hasattr(record, 'tile')]
+    assert sorted(tiles) == list(range(len(restorer.tile_plan)))
+    record, = [record for record in caplog.records if getattr(record, 'timings', None) == timings]
+    assert record.padding_waste == restorer.tile_plan.padding_waste
+
+    # the errors of the network are raised, and the pipeline threads are stopped
+    def fail(_):
+        raise RuntimeError('out of memory')
+
+    restorer.model.forward = fail
+    num_threads = threading.active_count()
+    with pytest.raises(RuntimeError):
+        restorer.enhance(img)
+    assert threading.active_count() == num_threads
+
+
+def test_out_of_memory_retry(tmp_path, monkeypatch):
+    # the remembered tile sizes are shared by all instances
+    monkeypatch.setattr(RealESRGANer, '_safe_tile_sizes', {})
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    img = np.random.random((40, 50, 3)).astype(np.float32)
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, tile_pad='exact', pre_pad=0)
+    with torch.no_grad(), torch.backends.mkldnn.flags(enabled=False):
+        expected = restorer.model(torch.from_numpy(img.transpose(2, 0, 1)).unsqueeze(0))
+
+    # a network which runs out of memory on inputs larger than 32x32
+    forward = restorer.model.forward
+    input_sizes = []
+
+    def forward_limited(x):
+        input_sizes.append(x.shape[0] * x.shape[2] * x.shape[3])
+        if input_sizes[-1] > 32 * 32:
+            raise RuntimeError('CUDA out of memory. Tried to allocate 2.00 GiB')
+        return forward(x)
+
+    restorer.model.forward = forward_limited
+    with torch.backends.mkldnn.flags(enabled=False):
+        # the whole image falls back to tiles, identical with the exact tile pad
+        restorer.pre_process(img)
+        restorer.process()
+        assert torch.equal(restorer.output, expected)
+        safe_tile_size = RealESRGANer._safe_tile_sizes[restorer._device_key()]
+        assert 0 < safe_tile_size <= 32
+
+        # the next image starts with the safe tile size, and a failed tile batch is split
+        input_sizes.clear()
+        restorer.tile_batch_size = 4
+        output, _ = restorer.enhance((img * 255).astype(np.uint8))
+        assert restorer.tile_size == safe_tile_size
+        assert output.shape == (160, 200, 3)
+        assert max(input_sizes) > 32 * 32 and input_sizes[-1] <= 32 * 32
+
+    # other errors are raised
+    def forward_error(x):
+        raise RuntimeError('Expected 3 channels')
+
+    restorer.model.forward = forward_error
+    with pytest.raises(RuntimeError, match='channels'):
+        restorer.enhance((img * 255).astype(np.uint8))
+
+    # an input which cannot be split further raises the out of memory error
+    def forward_oom(x):
+        raise RuntimeError('CUDA out of memory. Tried to allocate 2.00 GiB')
+
+    restorer.model.forward = forward_oom
+    with pytest.raises(RuntimeError, match='out of memory'):
+        restorer.enhance((img * 255).astype(np.uint8))
+
+
+def test_enhance_outscale(tmp_path):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    img = np.random.randint(0, 256, (37, 50, 4), dtype=np.uint8)
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, tile_pad='exact')
+    tiled_restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, tile=16, tile_pad='exact')
+    for outscale in [2, 3, 2.5]:
+        expected, _ = restorer.enhance(img, outscale=outscale)
+        output, img_mode = tiled_restorer.enhance(img, outscale=outscale)
+        assert img_mode == 'RGBA'
+        assert output.shape == expected.shape == (int(37 * outscale), int(50 * outscale), 4)
+        # the integer output scales are resampled per tile, the border pixels see the pre-pad area
+        assert tiled_restorer.output_scale == (outscale if outscale != 2.5 else 4)
+        assert np.abs(output[:-2, :-2].astype(np.int16) - expected[:-2, :-2]).max() <= 1
+
+    # the tile process is at the network scale, whatever the outscale of the former images
+    tiled_restorer.pre_process(torch.rand(1, 3, 37, 50))
+    tiled_restorer.tile_process()
+    assert tiled_restorer.output_scale == 4
+    assert tiled_restorer.output.shape[2:] == tuple(4 * size for size in tiled_restorer.img.shape[2:])
+
+    # the out-of-core enhance is at the network scale, whatever the outscale of the former images
+    expected, _ = restorer.enhance(img, alpha_upsampler='bilinear')
+    tiled_restorer.enhance(img, outscale=2)
+    output = np.zeros_like(expected)
+    tiled_restorer.enhance_to(img, output, alpha_upsampler='bilinear')
+    assert np.abs(output.astype(np.int16) - expected).max() <= 1
+
+
+def test_tile_dedup(tmp_path, monkeypatch):
+    model = SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=8, num_conv=2, upscale=4, act_type='prelu')
+    # a flat page with a textured block, most of the padded tiles are byte-identical
+    img = np.full((160, 192, 3), 240, dtype=np.uint8)
+    img[40:56, 40:72] = np.random.randint(0, 256, (16, 32, 3), dtype=np.uint8)
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, tile=16, pre_pad=0)
+    expected, _ = restorer.enhance(img)
+
+    for pipeline in [False, True]:
+        dedup_restorer = build_restorer(
+            tmp_path, copy.deepcopy(model), 4, tile=16, pre_pad=0, tile_dedup=True, pipeline=pipeline)
+        output, _ = dedup_restorer.enhance(img)
+        assert np.array_equal(output, expected)
+        num_tiles = len(dedup_restorer.tile_plan)
+        assert dedup_restorer.tile_hits + dedup_restorer.tile_misses == num_tiles
+        assert dedup_restorer.tile_hit_rate > 0.5
+        # only the outputs of the image are kept
+        assert len(dedup_restorer._tile_outputs) == 0
+
+    # across images, through the cache
+    dedup_restorer = build_restorer(
+        tmp_path, copy.deepcopy(model), 4, tile=16, pre_pad=0, tile_dedup=True, tile_cache_size=4)
+    dedup_restorer.enhance(img)
+    misses = dedup_restorer.tile_misses
+    output, _ = dedup_restorer.enhance(img)
+    assert np.array_equal(output, expected)
+    assert len(dedup_restorer._tile_outputs) == 4
+    # the flat tiles are in the cache
+    assert dedup_restorer.tile_misses - misses < misses
+
+    # the checksums are in int64, which every device supports, and tell apart the tiles of a one-bit difference
+    for dtype in [torch.float32, torch.float16, torch.bfloat16]:
+        tile = torch.rand(1, 3, 24, 24).to(dtype)
+        other = tile.clone()
+        other.view(utils._BITS_DTYPES[dtype])[0, 1, 5, 7] ^= 1
+        assert utils._tile_checksum(tile).dtype == torch.int64
+        assert torch.equal(utils._tile_checksum(tile), utils._tile_checksum(tile.clone()))
+        assert not torch.equal(utils._tile_checksum(tile), utils._tile_checksum(other))
+
+    # the tiles of equal checksums are compared exactly
+    monkeypatch.setattr(utils, '_tile_checksum', lambda img: torch.zeros(2, dtype=torch.int64))
+    dedup_restorer = build_restorer(tmp_path, copy.deepcopy(model), 4, tile=16, pre_pad=0, tile_dedup=True)
+    output, _ = dedup_restorer.enhance(img)
+    assert np.array_equal(output, expected)
+    assert 0 < dedup_restorer.tile_hits < num_tiles
+
+
+def test_enhance_batch(tmp_path, monkeypatch):
+    rng = np.random.RandomState(0)
+    rgb = rng.randint(0, 256, (20, 30, 3), dtype=np.uint8)
+    imgs = [
+        rgb,
+        rng.randint(0, 256, (20, 30), dtype=np.uint8),
+        rng.randint(0, 65536, (20, 30, 3), dtype=np.uint16),
+        rng.randint(0, 256, (20, 30, 4), dtype=np.uint8),
+        np.dstack([rgb, np.full((20, 30), 255, dtype=np.uint8)]),  # a constant alpha channel
+        rng.randint(0, 256, (25, 17, 3), dtype=np.uint8),
+        rng.randint(0, 256, (21, 30, 3), dtype=np.uint8),  # the padded shape of the 20x30 images for the x2 model
+    ]
+    model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=8, num_block=1, num_grow_ch=4, scale=2)
+    for tile in [0, 16]:
+        restorer = build_restorer(tmp_path, copy.deepcopy(model), 2, tile=tile)
+        batch_sizes = []
+        forward = restorer._forward
+        monkeypatch.setattr(restorer, '_forward', lambda img: batch_sizes.append(len(img)) or forward(img))
+        for outscale in [None, 3]:
+            results = restorer.enhance_batch(imgs, outscale=outscale, max_batch_size=3)
+            for img, (output, img_mode) in zip(imgs, results):
+                expected, expected_mode = restorer.enhance(img, outscale=outscale)
+                assert img_mode == expected_mode and output.dtype == expected.dtype
+                assert output.shape == expected.shape
+                # the 16-bit outputs may differ by a rounding level
+                assert np.abs(output.astype(np.int32) - expected).max() <= 1
+        assert max(batch_sizes) == 3
+
+    # a memory budget of one input per forward pass
+    restorer = build_restorer(tmp_path, copy.deepcopy(model), 2)
+    budget = restorer.activation_bytes() * 32 * 40
+    batch_sizes = []
+    forward = restorer._forward
+    monkeypatch.setattr(restorer, '_forward', lambda img: batch_sizes.append(len(img)) or forward(img))
+    restorer.enhance_batch(imgs, memory_budget=budget)
+    assert batch_sizes == [1] * 8